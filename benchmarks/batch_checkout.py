@@ -0,0 +1,96 @@
+# Стоимость одной книги при выдаче по одной и пакетом (create_many) и при пакетном возврате.
+#   python -m benchmarks.batch_checkout --batch 10 --rounds 50
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from config.db_config import DBSettings
+from db.models import Book
+from db.repositories import BookLoanRepository
+from db.schema import ensure_schema
+
+
+async def prepare(session_factory, batch: int) -> tuple[int, list[int]]:
+    async with session_factory() as session:
+        author_id = await session.scalar(
+            text("INSERT INTO library_app_bookauthor (name) VALUES ('Benchmark') "
+                 "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id")
+        )
+        await session.execute(
+            text("INSERT INTO library_app_book (author_id, bookname, amount, cover_url) "
+                 "SELECT :author_id, 'Batch benchmark ' || i, 1000000, 'https://example.com/cover.jpg' "
+                 "FROM generate_series(1, :batch) AS i "
+                 "ON CONFLICT (author_id, bookname) DO UPDATE SET amount = EXCLUDED.amount"),
+            {"author_id": author_id, "batch": batch},
+        )
+        reader_id = await session.scalar(
+            text("INSERT INTO library_app_reader (first_name, last_name, email, registered_at) "
+                 "VALUES ('Bench', 'Batch', 'bench-batch@example.com', now()) "
+                 "ON CONFLICT (email) DO UPDATE SET last_name = EXCLUDED.last_name RETURNING id")
+        )
+        book_ids = (await session.scalars(
+            select(Book.id).where(Book.bookname.like("Batch benchmark %")).order_by(Book.id).limit(batch)
+        )).all()
+        await session.execute(
+            text("UPDATE library_app_bookloan SET returned_at = now() WHERE reader_id = :reader_id "
+                 "AND returned_at IS NULL"),
+            {"reader_id": reader_id},
+        )
+        await session.commit()
+    return reader_id, list(book_ids)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_async_engine(DBSettings().url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    await ensure_schema(engine)
+    reader_id, book_ids = await prepare(session_factory, args.batch)
+    due_date = date.today() + timedelta(days=14)
+    # выдачи возвращаются «завтрашним» днём: дата возврата должна быть позже дня выдачи
+    returned_at = date.today() + timedelta(days=1)
+
+    single, batch, returns = [], [], []
+    try:
+        for _ in range(args.rounds):
+            async with session_factory() as session:
+                repo = BookLoanRepository(session)
+                started = time.perf_counter()
+                loans = [
+                    await repo.create({"book_id": book_id, "reader_id": reader_id, "librarian_id": None,
+                                       "due_date": due_date})
+                    for book_id in book_ids
+                ]
+                single.append((time.perf_counter() - started) * 1000 / len(book_ids))
+                await repo.return_many({"loan_ids": [loan.id for loan in loans], "returned_at": returned_at})
+
+                started = time.perf_counter()
+                result = await repo.create_many({"book_ids": book_ids, "reader_id": reader_id, "librarian_id": None,
+                                                 "due_date": due_date})
+                batch.append((time.perf_counter() - started) * 1000 / len(book_ids))
+                assert result.ok, result
+
+                started = time.perf_counter()
+                result = await repo.return_many({"loan_ids": [item.loan_id for item in result.items],
+                                                 "returned_at": returned_at})
+                returns.append((time.perf_counter() - started) * 1000 / len(book_ids))
+                assert result.ok, result
+    finally:
+        await engine.dispose()
+
+    print(f"{args.batch} books per checkout, {args.rounds} rounds, ms per book")
+    for name, timings in (("single", single), ("create_many", batch), ("return_many", returns)):
+        print(f"{name:<12} p50 {statistics.median(timings):7.3f}  mean {statistics.fmean(timings):7.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
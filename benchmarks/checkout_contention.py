@@ -0,0 +1,117 @@
+# 500 одновременных выдач одной и той же книги: атомарный checkout против прежней схемы
+# «SELECT ... FOR UPDATE, проверка в Python, INSERT, refresh».
+#   python -m benchmarks.checkout_contention --concurrency 500 --copies 400
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func, delete, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from config.db_config import DBSettings
+from db.models import Book, BookLoan, Reader
+from db.repositories import BookLoanRepository
+from db.schema import ensure_schema
+
+BOOKNAME = "Contention benchmark"
+
+
+async def prepare(session_factory, readers: int, copies: int) -> tuple[int, list[int]]:
+    async with session_factory() as session:
+        author_id = await session.scalar(
+            text("INSERT INTO library_app_bookauthor (name) VALUES ('Benchmark') "
+                 "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id")
+        )
+        book_id = await session.scalar(
+            text("INSERT INTO library_app_book (author_id, bookname, amount, cover_url) "
+                 "VALUES (:author_id, :bookname, :amount, 'https://example.com/cover.jpg') "
+                 "ON CONFLICT (author_id, bookname) DO UPDATE SET amount = EXCLUDED.amount RETURNING id"),
+            {"author_id": author_id, "bookname": BOOKNAME, "amount": copies},
+        )
+        await session.execute(delete(BookLoan).where(BookLoan.book_id == book_id))
+        await session.execute(
+            text("INSERT INTO library_app_reader (first_name, last_name, email, registered_at) "
+                 "SELECT 'Bench', 'Reader ' || i, 'bench' || i || '@example.com', now() "
+                 "FROM generate_series(1, :readers) AS i ON CONFLICT (email) DO NOTHING"),
+            {"readers": readers},
+        )
+        reader_ids = (await session.scalars(
+            select(Reader.id).where(Reader.email.like("bench%@example.com")).order_by(Reader.id).limit(readers)
+        )).all()
+        await session.commit()
+    return book_id, list(reader_ids)
+
+
+async def atomic_checkout(session, data: dict) -> None:
+    await BookLoanRepository(session).create(data)
+
+
+async def locking_checkout(session, data: dict) -> None:
+    # прежний путь, но с блокировкой строки книги — без неё параллельные выдачи теряют списания
+    book = await session.get(Book, data["book_id"], with_for_update=True)
+    if book.amount < 1:
+        await session.rollback()
+        raise ValueError("такая книга недоступна для выдачи")
+    book.amount -= 1
+    loan = BookLoan(issued_at=datetime.utcnow(), **data)
+    session.add(loan)
+    await session.commit()
+    await session.refresh(loan)
+
+
+async def run(session_factory, checkout, book_id: int, reader_ids: list[int]) -> tuple[list[float], int, float]:
+    timings = []
+    rejected = 0
+
+    async def one(reader_id: int) -> None:
+        nonlocal rejected
+        data = {"book_id": book_id, "reader_id": reader_id, "librarian_id": None,
+                "due_date": date.today() + timedelta(days=14)}
+        started = time.perf_counter()
+        async with session_factory() as session:
+            try:
+                await checkout(session, data)
+            except ValueError:
+                rejected += 1
+        timings.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(reader_id) for reader_id in reader_ids))
+    return timings, rejected, time.perf_counter() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--copies", type=int, default=400)
+    parser.add_argument("--pool-size", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_async_engine(DBSettings().url, pool_size=args.pool_size, max_overflow=0, pool_timeout=120)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    await ensure_schema(engine)
+
+    print(f"{args.concurrency} checkouts, {args.copies} copies, pool {args.pool_size}")
+    print(f"{'mode':<10}{'ok':>6}{'rejected':>10}{'p50 ms':>10}{'p95 ms':>10}{'wall s':>9}{'left':>6}")
+    try:
+        for name, checkout in (("locking", locking_checkout), ("atomic", atomic_checkout)):
+            book_id, reader_ids = await prepare(session_factory, args.concurrency, args.copies)
+            timings, rejected, wall = await run(session_factory, checkout, book_id, reader_ids)
+
+            async with session_factory() as session:
+                left = await session.scalar(select(Book.amount).where(Book.id == book_id))
+                issued = await session.scalar(select(func.count()).where(BookLoan.book_id == book_id))
+            # инвариант: выдано ровно столько, сколько списано, и не больше, чем было экземпляров
+            assert issued == args.copies - left == len(timings) - rejected, (issued, left, rejected)
+
+            p95 = statistics.quantiles(timings, n=20)[18]
+            print(f"{name:<10}{issued:>6}{rejected:>10}{statistics.median(timings):>10.1f}{p95:>10.1f}"
+                  f"{wall:>9.2f}{left:>6}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
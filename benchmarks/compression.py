@@ -0,0 +1,79 @@
+# CPU на сжатие против сэкономленных байт для страниц /books/ и /bookloan/ по 100 строк.
+# Страницы берутся у приложения (в процессе или --url), дальше сжимаются теми же потоками,
+# что использует CompressionMiddleware, на нескольких уровнях.
+#   python -m benchmarks.compression --repeat 200
+#   python -m benchmarks.compression --url http://127.0.0.1:8000
+import argparse
+import asyncio
+import time
+
+try:
+    import httpx
+except ImportError:  # нужен только для бенчмарка
+    httpx = None
+
+from middleware.compression import DEFAULT_LEVELS, ENCODERS
+
+PAGES = ["/books/?page_size=100", "/bookloan/?page_size=100"]
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 6, 11), "zstd": (1, 3, 9, 19)}
+
+
+async def fetch_pages(url: str | None) -> dict[str, bytes]:
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=30)
+    else:
+        from main import app
+        from db.db_entry import db
+
+        await db.connect()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+
+    try:
+        async with client:
+            pages = {}
+            for path in PAGES:
+                response = await client.get(path, headers={"Accept-Encoding": "identity"})
+                response.raise_for_status()
+                pages[path] = response.content
+            return pages
+    finally:
+        if not url:
+            await db.close()
+
+
+def measure(body: bytes, encoding: str, level: int, repeat: int) -> tuple[int, float]:
+    stream_class = ENCODERS[encoding]
+    size = len(stream_class(level).write(body, final=True))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        stream_class(level).write(body, final=True)
+    return size, (time.perf_counter() - started) / repeat * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="адрес запущенного сервера; без него приложение поднимается в процессе")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if httpx is None:
+        raise SystemExit("Для бенчмарка нужен httpx: pip install httpx")
+
+    pages = await fetch_pages(args.url)
+    print(f"encoders: {', '.join(ENCODERS)}")
+    missing = [module for module, name in (("zstandard", "zstd"), ("brotli", "br")) if name not in ENCODERS]
+    if missing:
+        print(f"не установлены: {', '.join(missing)} — их строк не будет")
+    for path, body in pages.items():
+        print(f"\n{path}: {len(body):,} bytes")
+        print(f"{'encoding':<10}{'level':>6}{'bytes':>10}{'ratio':>8}{'µs':>10}{'MB/s':>9}{'KB saved/ms CPU':>17}")
+        for encoding in ENCODERS:
+            for level in LEVELS[encoding]:
+                size, micros = measure(body, encoding, level, args.repeat)
+                default = "*" if DEFAULT_LEVELS[encoding] == level else ""
+                print(f"{encoding:<10}{f'{level}{default}':>6}{size:>10,}{len(body) / size:>7.1f}×{micros:>10.0f}"
+                      f"{len(body) / micros:>9.1f}{(len(body) - size) / 1024 / (micros / 1000):>17.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,218 @@
+# Нагрузочный прогон по основным страницам: в процессе (ASGI, без сети) или против запущенного uvicorn.
+# Для каждого сценария — пропускная способность, p50/p95/p99 и число SQL-запросов на HTTP-запрос
+# (только в процессе: счётчик висит на движке приложения). Результат пишется в JSON для сравнения коммитов.
+#   python -m benchmarks.loadtest --duration 10 --concurrency 20 --output before.json
+#   python -m benchmarks.loadtest --url http://127.0.0.1:8000 --compare before.json
+#   Данные: python -m db.seed --truncate (или --scale 0.1 для быстрого прогона)
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+try:
+    import httpx
+except ImportError:  # нужен только для бенчмарка
+    httpx = None
+
+from config.db_config import DBSettings
+from db.models import Book, Reader
+
+SEARCH_WORDS = ["война", "мир", "дон", "маргарита", "silent", "garden", "river"]
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: Callable[[random.Random], str]
+
+
+@dataclass
+class Result:
+    name: str
+    requests: int = 0
+    errors: int = 0
+    elapsed: float = 0
+    queries: int | None = None
+    timings: list[float] = field(default_factory=list, repr=False)
+
+    def summary(self) -> dict:
+        data = {key: value for key, value in asdict(self).items() if key != "timings"}
+        ordered = sorted(self.timings)
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+        data.update(
+            rps=self.requests / self.elapsed if self.elapsed else 0,
+            mean_ms=statistics.fmean(ordered) if ordered else 0,
+            p50_ms=cuts[49] if cuts else 0,
+            p95_ms=cuts[94] if cuts else 0,
+            p99_ms=cuts[98] if cuts else 0,
+            queries_per_request=self.queries / self.requests if self.queries is not None and self.requests else None,
+        )
+        return data
+
+
+async def sample_ids(limit: int = 200) -> tuple[list[int], list[int]]:
+    # id берём из той же базы, что и приложение, чтобы /reader/{id} и форма выдачи не отдавали 404
+    engine = create_async_engine(DBSettings().url)
+    try:
+        async with engine.connect() as connection:
+            readers = (await connection.scalars(select(Reader.id).order_by(Reader.id).limit(limit))).all()
+            books = (await connection.scalars(
+                select(Book.id).where(Book.amount > 0).order_by(Book.id).limit(limit)
+            )).all()
+    finally:
+        await engine.dispose()
+    return list(readers), list(books)
+
+
+def build_scenarios(reader_ids: list[int], book_ids: list[int]) -> list[Scenario]:
+    scenarios = [
+        Scenario("index", lambda rng: "/"),
+        Scenario("health", lambda rng: "/health"),
+        Scenario("books", lambda rng: f"/books/?page={rng.randint(1, 5)}"),
+        Scenario("books_search", lambda rng: f"/books/?q={rng.choice(SEARCH_WORDS)}"),
+        Scenario("bookloan", lambda rng: f"/bookloan/?page={rng.randint(1, 5)}"),
+    ]
+    if book_ids:
+        scenarios.append(Scenario("create_bookloan", lambda rng: f"/create_bookloan/?book_id={rng.choice(book_ids)}"))
+    if reader_ids:
+        scenarios.append(Scenario("reader", lambda rng: f"/reader/{rng.choice(reader_ids)}"))
+    return scenarios
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args) -> None:
+        self.count += 1
+
+
+async def run_scenario(client, scenario: Scenario, *, duration: float, concurrency: int, warmup: int,
+                       seed: int, counter: QueryCounter | None) -> Result:
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        await client.get(scenario.path(rng))
+
+    result = Result(scenario.name)
+    queries_before = counter.count if counter else 0
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            path = scenario.path(rng)
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            result.timings.append((time.perf_counter() - started) * 1000)
+            result.requests += 1
+            result.errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    if counter:
+        result.queries = counter.count - queries_before
+    return result
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results: list[dict], baseline: dict[str, dict] | None = None) -> None:
+    header = f"{'scenario':<16}{'req':>7}{'err':>5}{'rps':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'q/req':>7}"
+    if baseline:
+        header += f"{'Δrps':>8}{'Δp95':>8}"
+    print(header)
+    for row in results:
+        queries = f"{row['queries_per_request']:.1f}" if row["queries_per_request"] is not None else "-"
+        line = (f"{row['name']:<16}{row['requests']:>7}{row['errors']:>5}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>8.1f}{row['p95_ms']:>8.1f}{row['p99_ms']:>8.1f}{queries:>7}")
+        old = (baseline or {}).get(row["name"])
+        if old and old["rps"] and old["p95_ms"]:
+            line += f"{(row['rps'] / old['rps'] - 1) * 100:>+7.0f}%{(row['p95_ms'] / old['p95_ms'] - 1) * 100:>+7.0f}%"
+        print(line)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="адрес запущенного сервера; без него приложение поднимается в процессе")
+    parser.add_argument("--duration", type=float, default=10, help="секунд на сценарий")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="запустить только эти сценарии")
+    parser.add_argument("--output", help="куда сохранить результат в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    if httpx is None:
+        raise SystemExit("Для нагрузочного прогона нужен httpx: pip install httpx")
+
+    reader_ids, book_ids = await sample_ids()
+    scenarios = [s for s in build_scenarios(reader_ids, book_ids) if not args.only or s.name in args.only]
+
+    counter = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        from main import app
+        from db.db_entry import db
+
+        # startup-хуки приложения как у uvicorn: сборка статики, шаблоны, прогрев пула, фоновые воркеры.
+        # ASGITransport lifespan не запускает
+        await app.router.startup()
+        counter = QueryCounter()
+        event.listen(db._engine.sync_engine, "before_cursor_execute", counter)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+                                   base_url="http://loadtest", timeout=30)
+
+    started_at = datetime.now(timezone.utc)
+    results = []
+    try:
+        async with client:
+            for index, scenario in enumerate(scenarios):
+                result = await run_scenario(client, scenario, duration=args.duration, concurrency=args.concurrency,
+                                            warmup=args.warmup, seed=args.seed + index, counter=counter)
+                results.append(result.summary())
+    finally:
+        if not args.url:
+            await app.router.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {row["name"]: row for row in json.load(f)["results"]}
+    print_table(results, baseline)
+
+    if args.output:
+        report = {
+            "revision": git_revision(),
+            "started_at": started_at.isoformat(),
+            "target": args.url or "in-process",
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+# Цена MetricsMiddleware: один и тот же пустой маршрут через ASGI напрямую (без сети и БД)
+# с метриками и без, плюс стоимость одного observe() и рост памяти после прогрева.
+#   python -m benchmarks.metrics_overhead --requests 50000
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from middleware.metrics import MetricsMiddleware, RouteMetrics
+
+
+def build_app(metrics: RouteMetrics | None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/reader/{reader_id}")
+    async def reader(reader_id: int):
+        return PlainTextResponse("ok")
+
+    if metrics is not None:
+        app.add_middleware(MetricsMiddleware, metrics=metrics)
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    started = time.perf_counter()
+    for i in range(requests):
+        path = f"/reader/{i % 1000}"
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+            "server": ("bench", 80), "client": ("bench", 1),
+        }
+        await app(scope, receive, send)
+        messages.clear()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    metrics = RouteMetrics()
+    plain, instrumented = build_app(None), build_app(metrics)
+    await drive(plain, 1000)
+    await drive(instrumented, 1000)
+
+    # порядок чередуется, берётся лучший раунд: так меньше влияют прогрев и соседние процессы
+    without, with_ = [], []
+    for round_ in range(args.rounds):
+        if round_ % 2:
+            with_.append(await drive(instrumented, args.requests))
+            without.append(await drive(plain, args.requests))
+        else:
+            without.append(await drive(plain, args.requests))
+            with_.append(await drive(instrumented, args.requests))
+
+    started = time.perf_counter()
+    for i in range(args.requests):
+        metrics.observe("/reader/{reader_id}", "GET", 200, (i % 100) / 1000)
+    observe = (time.perf_counter() - started) / args.requests * 1e6
+
+    # после прогрева серии уже заведены: новые запросы не должны удерживать память
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    await drive(instrumented, args.requests)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename")
+                 if stat.traceback[0].filename.endswith("metrics.py"))
+
+    base, instr = min(without), min(with_)
+    print(f"without metrics  {base:8.2f} µs/request")
+    print(f"with metrics     {instr:8.2f} µs/request  ({instr - base:+.2f} µs, {(instr / base - 1) * 100:+.1f}%)")
+    print(f"observe() alone  {observe:8.2f} µs")
+    print(f"metrics.py memory growth over {args.requests} requests: {growth} bytes")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
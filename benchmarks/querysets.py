@@ -0,0 +1,56 @@
+# Сколько стоит Python-сторона запроса до отправки в БД: сборка QuerySet, ключ кэша SQLAlchemy
+# и поиск скомпилированного SQL — с кэшем операторов BaseQuerySet и без него (кэш очищается
+# перед каждой итерацией — так работал код до кэша). БД не нужна, компиляция под диалект asyncpg.
+#   python -m benchmarks.querysets --iterations 20000
+import argparse
+import time
+from typing import Callable
+
+from sqlalchemy.dialects import postgresql
+
+from db.querysets import BaseQuerySet, BookQueryset, BookLoanQueryset, ReaderQuerySet
+
+SCENARIOS: dict[str, Callable[[int], BaseQuerySet]] = {
+    "books page": lambda i: BookQueryset().with_author().order_by(None).limit(11).offset(i % 5 * 10),
+    "books search": lambda i: BookQueryset().with_author().search(f"война {i % 7}").order_by_rank().limit(11),
+    "books keyset": lambda i: BookQueryset().with_author().order_by("bookname").seek([f"b{i}", i]).limit(11),
+    "bookloans page": lambda i: BookLoanQueryset().as_list().order_by("-issued_at").limit(11).offset(i % 5 * 10),
+    "bookloans count": lambda i: BookLoanQueryset().as_list().order_by("-issued_at"),
+    "reader detail": lambda i: ReaderQuerySet().filter_by_id(i).with_ticket().with_active_loans_count(),
+    "readers lookup": lambda i: ReaderQuerySet().list_choices().prefix_search("last_name", f"п{i % 10}").limit(20),
+}
+
+
+def measure(make: Callable[[int], BaseQuerySet], iterations: int, *, cached: bool, count: bool) -> float:
+    # то же, что делает Connection.execute до сети: ключ кэша и поиск в кэше скомпилированных операторов
+    dialect = postgresql.asyncpg.dialect()
+    compiled_cache = {}
+    BaseQuerySet._statements.clear()
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        if not cached:
+            BaseQuerySet._statements.clear()
+        qs = make(i)
+        stmt = qs.count_query if count else qs.query
+        key = stmt._generate_cache_key().key
+        if compiled_cache.get(key) is None:
+            compiled_cache[key] = stmt.compile(dialect=dialect)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<18}{'no cache, µs':>14}{'cache, µs':>12}{'speedup':>9}")
+    for name, make in SCENARIOS.items():
+        count = name.endswith("count")
+        before = measure(make, args.iterations, cached=False, count=count)
+        after = measure(make, args.iterations, cached=True, count=count)
+        print(f"{name:<18}{before:>14.1f}{after:>12.1f}{before / after:>8.1f}×")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Сравнение ILIKE-поиска с триграммным на каталоге из 1M книг.
+#   python -m benchmarks.search --books 1000000 --repeat 20
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text, select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from config.db_config import DBSettings
+from db.counting import ExactCounter, set_counter
+from db.models import Book
+from db.repositories import BookRepository
+from db.schema import ensure_schema
+
+WORDS = [
+    "война", "мир", "тихий", "дон", "мастер", "маргарита", "идиот", "бесы", "отцы", "дети",
+    "мёртвые", "души", "преступление", "наказание", "герой", "нашего", "времени", "горе", "от", "ума",
+    "shadow", "river", "winter", "garden", "silent", "empire", "stone", "night", "ocean", "crown",
+]
+
+QUERIES = ["маргарита", "маргорита", "тихий дон", "silent", "gardne", "Author 4217", "empire stone 90"]
+
+
+async def seed(session, books: int, authors: int, seed: float) -> None:
+    existing = await session.scalar(select(func.count()).select_from(Book))
+    if existing >= books:
+        return
+
+    await session.execute(text("SELECT setseed(:seed)"), {"seed": seed})
+    await session.execute(
+        text(
+            "INSERT INTO library_app_bookauthor (name) "
+            "SELECT 'Author ' || i FROM generate_series(1, :authors) AS i ON CONFLICT DO NOTHING"
+        ),
+        {"authors": authors},
+    )
+    await session.execute(
+        text(
+            "INSERT INTO library_app_book (author_id, bookname, amount, cover_url) "
+            "SELECT a.ids[1 + i % cardinality(a.ids)], "
+            "       w.words[1 + floor(random() * cardinality(w.words))::int] || ' ' || "
+            "       w.words[1 + floor(random() * cardinality(w.words))::int] || ' ' || i, "
+            "       floor(random() * 5)::int, 'https://example.com/cover.jpg' "
+            "FROM generate_series(:start, :stop) AS i, "
+            "     (SELECT array_agg(id) AS ids FROM library_app_bookauthor) AS a, "
+            "     (SELECT CAST(:words AS text[]) AS words) AS w "
+            "ON CONFLICT DO NOTHING"
+        ),
+        {"start": existing + 1, "stop": books, "words": WORDS},
+    )
+    await session.commit()
+    await session.execute(text("ANALYZE library_app_book"))
+    await session.execute(text("ANALYZE library_app_bookauthor"))
+
+
+async def measure(session_factory, engine: str, query: str, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        async with session_factory() as session:
+            started = time.perf_counter()
+            await BookRepository(session).list(page=1, page_size=20, search=query, search_engine=engine)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--authors", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=float, default=0.42)
+    args = parser.parse_args()
+
+    engine = create_async_engine(DBSettings().url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    # кэш count исказил бы сравнение: считаем честно на каждом запросе
+    set_counter(ExactCounter())
+
+    await ensure_schema(engine)
+    async with session_factory() as session:
+        await seed(session, args.books, args.authors, args.seed)
+
+    print(f"{'query':<20} {'engine':<8} {'p50 ms':>9} {'p95 ms':>9}")
+    for query in QUERIES:
+        for search_engine in ("ilike", "trigram"):
+            timings = sorted(await measure(session_factory, search_engine, query, args.repeat))
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{query:<20} {search_engine:<8} {statistics.median(timings):>9.1f} {p95:>9.1f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
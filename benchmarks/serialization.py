@@ -0,0 +1,97 @@
+# Пропускная способность сериализации страницы выдач (те же колонки, что BookLoanQueryset.as_list)
+# тремя путями, которыми FastAPI может отдать ответ:
+#   response_model — валидация по BookLoanPage, dump_python(mode="json"), JSONResponse (json.dumps);
+#   jsonable_encoder — без response_model: FastAPI прогоняет ответ через jsonable_encoder и json.dumps;
+#   FastJSONResponse — строки result.mappings() сразу в orjson (так отвечает /api/v1).
+# Строки — настоящие RowMapping из SQLite в памяти, БД приложения не нужна.
+#   python -m benchmarks.serialization --repeat 200
+import argparse
+import time
+from datetime import date, datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, create_engine, insert, select
+
+from routes.responses import FastJSONResponse
+from schemas.api import BookLoanPage
+from schemas.pagination import Pagination
+
+metadata = MetaData()
+loans = Table(
+    "loans", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("issued_at", DateTime),
+    Column("due_date", Date),
+    Column("returned_at", DateTime),
+    Column("bookname", String),
+    Column("reader_name", String),
+    Column("librarian_name", String),
+)
+
+
+def load_rows(count: int) -> list:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    issued = datetime(2025, 1, 1, 10, 30)
+    with engine.begin() as conn:
+        conn.execute(insert(loans), [
+            {
+                "id": i,
+                "issued_at": issued + timedelta(minutes=i),
+                "due_date": date(2025, 2, 1) + timedelta(days=i % 30),
+                "returned_at": issued + timedelta(days=7) if i % 3 else None,
+                "bookname": f"Война и мир, том {i % 4 + 1}",
+                "reader_name": f"Иван Петров {i}",
+                "librarian_name": "Анна Кузнецова",
+            }
+            for i in range(1, count + 1)
+        ])
+        return list(conn.execute(select(loans)).mappings().all())
+
+
+def response_model_path(adapter: TypeAdapter):
+    def render(content) -> bytes:
+        value = adapter.validate_python(content, from_attributes=True)
+        return JSONResponse(adapter.dump_python(value, mode="json")).body
+
+    return render
+
+
+PATHS = {
+    "response_model": response_model_path(TypeAdapter(BookLoanPage)),
+    "jsonable_encoder": lambda content: JSONResponse(jsonable_encoder(content)).body,
+    "FastJSONResponse": lambda content: FastJSONResponse(content).body,
+}
+
+
+def measure(render, content, repeat: int) -> tuple[int, float]:
+    size = len(render(content))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        render(content)
+    return size, (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 1000])
+    args = parser.parse_args()
+
+    rows = load_rows(max(args.sizes))
+    for page_size in args.sizes:
+        pagination = Pagination(page=1, page_size=page_size, total=len(rows), next_cursor="WzEwMCwxMDBd")
+        content = {"items": rows[:page_size], "pagination": pagination}
+        print(f"\npage_size={page_size}")
+        print(f"{'path':<18}{'bytes':>10}{'µs':>10}{'rows/s':>12}{'speedup':>9}")
+        baseline = None
+        for name, render in PATHS.items():
+            size, micros = measure(render, content, args.repeat)
+            baseline = baseline or micros
+            print(f"{name:<18}{size:>10,}{micros:>10.0f}{page_size / micros * 1e6:>12,.0f}{baseline / micros:>8.1f}×")
+
+
+if __name__ == "__main__":
+    main()
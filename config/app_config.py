@@ -0,0 +1,44 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+# тот же .env, что и у DBSettings, но свои префиксы: HTTP_ — ответы, WORKER_ — фоновые воркеры
+from config.db_config import env_file
+
+
+class HTTPSettings(BaseSettings):
+    # готовые страницы каталога (routes/response_cache.py)
+    response_cache_max_bytes: int = 32 * 1024 * 1024
+    response_cache_ttl: float = 60
+    # сжатие ответов (middleware/compression.py): ответы меньше порога идут как есть
+    compression_min_size: int = 500
+    gzip_level: int = 6
+    brotli_quality: int = 4
+    zstd_level: int = 3
+
+    model_config = SettingsConfigDict(
+        env_prefix="HTTP_",
+        env_file=env_file,
+        extra="ignore",
+    )
+
+
+class WorkerSettings(BaseSettings):
+    # опрос версий таблиц для кэшей (db/cache.py): как быстро видны записи других воркеров; 0 — не опрашивать
+    version_sync_interval: float = 1
+    # пересчёт статистики выдач (db/stats.py): 0 — воркер не запускается, пересчёт только через python -m db.stats
+    stats_refresh_interval: float = 60
+    # насколько назад от прошлой отметки пересчитывать: возвраты задним числом и поздно зафиксированные выдачи
+    stats_lookback_hours: float = 48
+    stats_full_refresh_hours: float = 24
+    # сканер просроченных выдач (db/overdue.py): 0 — не запускается; сканирует один воркер из всех
+    overdue_scan_interval: float = 300
+    overdue_batch_size: int = 500
+    overdue_max_batches: int = 20
+    # запас на возвраты задним числом; полный обход ловит то, чего отметки не видят (продления, отмены возврата)
+    overdue_lookback_hours: float = 48
+    overdue_full_scan_hours: float = 24
+
+    model_config = SettingsConfigDict(
+        env_prefix="WORKER_",
+        env_file=env_file,
+        extra="ignore",
+    )
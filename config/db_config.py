@@ -1,3 +1,4 @@
+import math
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -16,13 +17,62 @@ class DBSettings(BaseSettings):
     port: int = 5432
     name: str
     echo: bool
+    # пул на один воркер: workers × (pool_size + max_overflow) должно укладываться в max_connections Postgres
+    pool_size: int = 10
+    max_overflow: int = 20
+    # сколько ждать свободного соединения, прежде чем ответить 503; лучше быстро отказать, чем висеть
+    pool_timeout: float = 5
+    # пересоздавать соединения старше N секунд (-1 — никогда)
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    # кэш подготовленных операторов на соединение; 0 — за PgBouncer в transaction-режиме
+    statement_cache_size: int = 100
+    command_timeout: float | None = None
+    # сколько соединений открыть при старте (по умолчанию pool_size, 0 — не прогревать)
+    pool_warmup: int | None = None
+    # реплики для чтения через запятую: "replica1,replica2:5433" (пользователь, пароль и база — как у мастера)
+    replica_hosts: str = ""
+    # реплика с отставанием больше этого выводится из ротации до следующей проверки
+    replica_max_lag: float = 10
+    replica_check_interval: float = 5
+    # сколько секунд после записи чтения клиента идут на мастер (0 — не закреплять). По умолчанию — пока
+    # реплика, признанная здоровой, может не видеть записи: replica_max_lag плюс интервал между проверками лага
+    read_your_writes_seconds: int | None = None
+    # exact | cached | estimate — см. db/counting.py
+    count_strategy: str = "cached"
+    count_cache_ttl: float = 60
+    choice_cache_max_bytes: int = 16 * 1024 * 1024
+    choice_cache_ttl: float = 300
+    # учёт SQL по запросам (db/instrumentation.py); на живом приложении переключается SIGUSR2
+    sql_instrumentation: bool = False
+    slow_query_ms: float = 200
+    n_plus_one_threshold: int = 5
 
     @property
     def url(self) -> str:
-        return f"postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.name}"
+        return self._url(self.host, self.port)
+
+    @property
+    def replica_urls(self) -> list[str]:
+        urls = []
+        for item in filter(None, (part.strip() for part in self.replica_hosts.split(","))):
+            host, _, port = item.partition(":")
+            urls.append(self._url(host, int(port) if port else self.port))
+        return urls
+
+    @property
+    def read_your_writes_window(self) -> int:
+        if self.read_your_writes_seconds is not None:
+            return self.read_your_writes_seconds
+        return math.ceil(self.replica_max_lag + self.replica_check_interval)
+
+    def _url(self, host: str, port: int) -> str:
+        return f"postgresql+asyncpg://{self.user}:{self.password}@{host}:{port}/{self.name}"
 
     model_config = SettingsConfigDict(
         env_prefix="DB_",
-        env_file=env_file
+        env_file=env_file,
+        # в одном .env лежат настройки всех классов: чужие префиксы пропускаем
+        extra="ignore",
     )
 
@@ -1,15 +1,32 @@
+import asyncio
+import itertools
+import logging
 from contextlib import asynccontextmanager
-from typing import Optional, AsyncIterator
+from typing import Optional, AsyncIterator, Awaitable, Callable, Sequence, TypeVar
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
-    AsyncSession, AsyncEngine,
+    AsyncSession, AsyncEngine, AsyncConnection,
 )
+from sqlalchemy import exc, make_url, text
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config.db_config import DBSettings
+from .instrumentation import QueryInstrumentation
 
 Base = declarative_base()
 
+T = TypeVar("T")
+
+logger = logging.getLogger("db.replicas")
+
+# отставание реплики в секундах; если всё полученное WAL уже применено, реплика догнала мастер
+# (сравнение по времени последней транзакции на простаивающем мастере показывало бы растущий лаг)
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
 
 # class Database:
 #     _instance: Optional["Database"] = None
@@ -49,6 +66,45 @@ Base = declarative_base()
 #         return self._session_factory()
 #
 
+class CountingQueuePool(AsyncAdaptedQueuePool):
+    # QueuePool не сообщает, сколько запросов ждут соединения: считаем тех, кто внутри connect()
+    # (ожидание свободного соединения в очереди или открытие нового сверх pool_size)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiters = 0
+        self.timeouts = 0
+
+    def connect(self):
+        self.waiters += 1
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiters -= 1
+
+    def recreate(self):
+        # dispose()/invalidate пересоздают пул — счётчик таймаутов не должен обнуляться
+        pool = super().recreate()
+        pool.timeouts = self.timeouts
+        return pool
+
+
+class Replica:
+    __slots__ = ("url", "name", "engine", "session_factory", "healthy", "lag")
+
+    def __init__(self, url: str, engine: AsyncEngine):
+        self.url = url
+        # для логов: без пароля
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = engine
+        self.session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        # до первой проверки реплика не используется: чтения идут на мастер
+        self.healthy = False
+        self.lag: float | None = None
+
+
 class Database:
     def __init__(
             self,
@@ -56,49 +112,220 @@ class Database:
             *,
             pool_size: int = 10,
             max_overflow: int = 20,
-            pool_timeout: int = 30,
+            pool_timeout: float = 30,
+            pool_recycle: int = -1,
+            pool_pre_ping: bool = True,
+            statement_cache_size: int = 100,
+            command_timeout: float | None = None,
             echo: bool = False,
+            gather_limit: int | None = None,
+            instrumentation: QueryInstrumentation | None = None,
+            replica_urls: Sequence[str] = (),
+            replica_max_lag: float = 10,
+            replica_check_interval: float = 5,
     ) -> None:
         self._url: str = url
+        self._replica_urls: tuple[str, ...] = tuple(replica_urls)
+        self._replica_max_lag: float = replica_max_lag
+        self._replica_check_interval: float = replica_check_interval
         self._pool_size: int = pool_size
         self._max_overflow: int = max_overflow
-        self._pool_timeout: int = pool_timeout
+        self._pool_timeout: float = pool_timeout
+        self._pool_recycle: int = pool_recycle
+        self._pool_pre_ping: bool = pool_pre_ping
+        self._statement_cache_size: int = statement_cache_size
+        self._command_timeout: float | None = command_timeout
         self._echo: bool = echo
+        # сколько соединений одновременно могут занять gather-запросы всех обработчиков;
+        # остаток пула остаётся под основные сессии запросов, иначе возможен взаимный захват пула
+        self._gather_slots = asyncio.Semaphore(gather_limit or max(1, pool_size // 2))
+        self.instrumentation = instrumentation or QueryInstrumentation()
 
         self._engine: Optional[AsyncEngine] = None
         self._session_factory: Optional[
             async_sessionmaker[AsyncSession]
         ] = None
+        self._replicas: list[Replica] = []
+        self._replica_turn = itertools.count()
+        self._replica_watcher: asyncio.Task | None = None
 
     async def connect(self) -> None:
         if self._engine is not None:
             return
 
-        self._engine = create_async_engine(
-            self._url,
-            echo=self._echo,
-            pool_pre_ping=True,
-            pool_size=self._pool_size,
-            max_overflow=self._max_overflow,
-            pool_timeout=self._pool_timeout,
-        )
-
+        self._engine = self._create_engine(self._url)
         self._session_factory = async_sessionmaker(
             bind=self._engine,
             expire_on_commit=False,
         )
+        self.instrumentation.bind(self._engine.sync_engine)
+
+        self._replicas = [Replica(url, self._create_engine(url)) for url in self._replica_urls]
+        for replica in self._replicas:
+            self.instrumentation.bind(replica.engine.sync_engine)
+        if self._replicas:
+            await self.check_replicas()
+            self._replica_watcher = asyncio.create_task(self._watch_replicas())
 
     async def close(self) -> None:
+        if self._replica_watcher is not None:
+            self._replica_watcher.cancel()
+            self._replica_watcher = None
+        for replica in self._replicas:
+            await replica.engine.dispose()
+        self._replicas = []
         if self._engine:
+            self.instrumentation.unbind()
             await self._engine.dispose()
             self._engine = None
             self._session_factory = None
 
-    def get_session(self) -> AsyncSession:
+    def _create_engine(self, url: str) -> AsyncEngine:
+        return create_async_engine(
+            url,
+            echo=self._echo,
+            pool_pre_ping=self._pool_pre_ping,
+            poolclass=CountingQueuePool,
+            pool_size=self._pool_size,
+            max_overflow=self._max_overflow,
+            pool_timeout=self._pool_timeout,
+            pool_recycle=self._pool_recycle,
+            connect_args=self._connect_args(url),
+        )
+
+    def _connect_args(self, url: str) -> dict:
+        if make_url(url).get_driver_name() != "asyncpg":
+            return {}
+        return {
+            # SQLAlchemy готовит каждый оператор через asyncpg.prepare() и держит свой кэш,
+            # у asyncpg — ещё один для прямых вызовов. За PgBouncer (transaction) оба должны быть 0
+            "prepared_statement_cache_size": self._statement_cache_size,
+            "statement_cache_size": self._statement_cache_size,
+            "command_timeout": self._command_timeout,
+        }
+
+    async def warm_up(self, connections: int | None = None) -> int:
+        # открываем соединения заранее, чтобы первые запросы после старта не платили за TCP+TLS+auth.
+        # Берём их одновременно: по одному пул отдавал бы одно и то же соединение
+        if self._engine is None:
+            raise RuntimeError("Database not connected")
+        count = min(connections if connections is not None else self._pool_size, self._pool_size)
+        opened = await asyncio.gather(*(self._engine.connect() for _ in range(count)))
+        for connection in opened:
+            await connection.close()
+        return count
+
+    def get_session(self, readonly: bool = False) -> AsyncSession:
+        # readonly=True — сессия на одной из живых реплик по кругу; если живых нет, на мастере.
+        # Писать в такую сессию нельзя, а только что записанное на реплике может быть ещё не видно
         if not self._session_factory:
             raise RuntimeError("Database not connected")
+        if readonly:
+            replica = self._pick_replica()
+            if replica is not None:
+                return replica.session_factory()
         return self._session_factory()
 
+    def dedicated_connection(self) -> AsyncConnection:
+        # соединение мастера в обход сессий — для блокировок уровня сессии (pg_advisory_lock), которые живут
+        # дольше одной транзакции. Занимает место в пуле, пока открыто
+        if self._engine is None:
+            raise RuntimeError("Database not connected")
+        return self._engine.connect()
+
+    def _pick_replica(self) -> Replica | None:
+        healthy = [replica for replica in self._replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._replica_turn) % len(healthy)]
+
+    def report_failure(self, session: AsyncSession) -> None:
+        # ошибка соединения в сессии на реплике: убираем реплику из ротации до следующей удачной проверки
+        for replica in self._replicas:
+            if session.bind is replica.engine and replica.healthy:
+                replica.healthy = False
+                logger.warning("replica %s marked unhealthy after connection error", replica.name)
+
+    async def check_replicas(self) -> None:
+        async def check(replica: Replica) -> None:
+            try:
+                async with replica.engine.connect() as connection:
+                    lag = await asyncio.wait_for(connection.scalar(REPLICA_LAG_SQL), self._replica_check_interval)
+            except (OSError, asyncio.TimeoutError, exc.DBAPIError, exc.TimeoutError) as error:
+                healthy, replica.lag = False, None
+                reason = type(error).__name__
+            else:
+                replica.lag = float(lag or 0)
+                healthy = replica.lag <= self._replica_max_lag
+                reason = f"lag {replica.lag:.1f}s"
+            if healthy != replica.healthy:
+                logger.log(logging.INFO if healthy else logging.WARNING, "replica %s is %s (%s)", replica.name,
+                           "healthy" if healthy else "unhealthy", reason)
+            replica.healthy = healthy
+
+        await asyncio.gather(*(check(replica) for replica in self._replicas))
+
+    async def _watch_replicas(self) -> None:
+        while True:
+            await asyncio.sleep(self._replica_check_interval)
+            await self.check_replicas()
+
+    def replica_stats(self) -> list[dict]:
+        return [
+            {"healthy": int(replica.healthy), "lag_seconds": replica.lag if replica.lag is not None else -1}
+            for replica in self._replicas
+        ]
+
+    def pool_stats(self) -> dict:
+        pool = self._engine.pool if self._engine is not None else None
+        if not isinstance(pool, QueuePool):
+            return {}
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # отрицательный overflow — столько соединений пула ещё ни разу не открывались
+            "overflow": pool.overflow(),
+            "max_overflow": self._max_overflow,
+            "timeout": self._pool_timeout,
+            "waiters": getattr(pool, "waiters", 0),
+            # сколько раз соединение не выдали за pool_timeout (эти запросы получили 503)
+            "timeouts": getattr(pool, "timeouts", 0),
+        }
+
+    async def gather(self, *calls: Callable[[AsyncSession], Awaitable[T]], readonly: bool = False) -> list[T]:
+        # независимые чтения параллельно, каждое в своей сессии (своём соединении из пула);
+        # readonly=True — как у get_session: на живой реплике. TaskGroup отменяет остальные при ошибке одного
+        # и при отмене самого запроса
+        async def run(call: Callable[[AsyncSession], Awaitable[T]]) -> T:
+            # очередь за слотом — то же ожидание пула: не дольше pool_timeout, дальше 503 как у пула
+            try:
+                async with asyncio.timeout(self._pool_timeout):
+                    await self._gather_slots.acquire()
+            except TimeoutError:
+                raise exc.TimeoutError(f"no gather slot available within {self._pool_timeout}s") from None
+            try:
+                async with self.get_session(readonly) as session:
+                    try:
+                        return await call(session)
+                    except (exc.OperationalError, exc.InterfaceError, OSError):
+                        self.report_failure(session)
+                        raise
+            finally:
+                self._gather_slots.release()
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(run(call)) for call in calls]
+        except BaseExceptionGroup as group:
+            # наружу — первая исходная ошибка, а не группа: иначе обработчики по типу (503 на таймаут пула)
+            # её не узнают
+            error = group
+            while isinstance(error, BaseExceptionGroup):
+                error = error.exceptions[0]
+            raise error from None
+        return [task.result() for task in tasks]
+
     # @asynccontextmanager
     # async def get_session(self) -> AsyncIterator[AsyncSession]:
     #     if not self._session_factory:
@@ -0,0 +1,371 @@
+# Потоковый импорт книг и читателей: CSV/NDJSON -> пачки -> валидация схемами форм ->
+# COPY во временную staging-таблицу -> INSERT ... ON CONFLICT DO NOTHING в основную.
+#   python -m db.bulk books books.csv
+#   python -m db.bulk readers readers.ndjson --format ndjson
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import re
+import time
+from functools import lru_cache
+from typing import Annotated, AsyncIterator
+
+import asyncpg
+from pydantic import AfterValidator, BaseModel, ValidationError
+from pydantic.networks import validate_email
+from pydantic_core import PydanticCustomError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from config.db_config import DBSettings
+from schemas.schemas import BookCreateSchema, ReaderCreateSchema, ImportReport
+from .cache import versions
+from .models import Book, BookAuthor, Reader
+
+FORMATS = ("csv", "ndjson")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def iter_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    # (номер строки, данные, ошибка разбора)
+    header = None
+    pending = ""
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"Некорректный JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "Ожидался JSON-объект"
+                continue
+            yield line_no, row, None
+            continue
+
+        # CSV: поле в кавычках может содержать перевод строки — склеиваем, пока кавычки не закрыты
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, None, f"Ожидалось {len(header)} колонок, получено {len(values)}"
+            continue
+        yield line_no, dict(zip(header, values)), None
+
+
+def format_errors(error: ValidationError) -> list[str]:
+    return [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()]
+
+
+# Адрес читателя принимает только validate_email — тот же, что у EmailStr в ReaderCreateSchema.
+# Быстрая проверка лишь отсеивает заранее: validate_email на каждой строке заново проверяет домен через IDNA,
+# а домены в выгрузке повторяются, поэтому неверный домен проверяется один раз и его ошибка переиспользуется.
+# Это та же ошибка, что дал бы validate_email: локальная часть из обычных ASCII-символов проходит его проверку,
+# а домен он проверяет следующим
+_ATEXT = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+"
+_LOCAL_PART = re.compile(rf"{_ATEXT}(?:\.{_ATEXT})*")
+_ASCII_DOMAIN = re.compile(r"[A-Za-z0-9.-]+")
+
+
+@lru_cache(maxsize=4096)
+def _domain_error(domain: str) -> PydanticCustomError | None:
+    try:
+        validate_email(f"x@{domain}")
+    except PydanticCustomError as error:
+        return error
+    return None
+
+
+def import_email(value: str) -> str:
+    local, at, domain = value.rpartition("@")
+    # 64 и 254 — пределы email_validator для локальной части и адреса целиком
+    simple = at and len(local) <= 64 and len(value) <= 254 and _LOCAL_PART.fullmatch(local)
+    if simple and _ASCII_DOMAIN.fullmatch(domain):
+        error = _domain_error(domain)
+        if error is not None:
+            raise error
+    return validate_email(value)[1]
+
+
+class ReaderImportSchema(ReaderCreateSchema):
+    email: Annotated[str, AfterValidator(import_email)]
+
+
+class BulkImporter:
+    schema_class: type[BaseModel]
+    model_class = None
+    staging_ddl: str
+    staging_table: str
+    staging_columns: tuple[str, ...]
+    merge_sql: str
+    duplicate_error: str
+
+    def __init__(self, session: AsyncSession, *, batch_size: int = 5000, max_errors: int = 1000):
+        self.session = session
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        # модели, чьи версии кэша нужно поднять после коммита пачки
+        self.touched: set = set()
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str = "csv") -> ImportReport:
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}")
+
+        report = ImportReport()
+        started = time.perf_counter()
+        batch: list[tuple[int, dict]] = []
+        async for line_no, row, error in iter_rows(chunks, fmt):
+            report.received += 1
+            if error:
+                report.add_error(line_no, [error], self.max_errors)
+                continue
+            batch.append((line_no, row))
+            if len(batch) >= self.batch_size:
+                await self._process(batch, report)
+                batch = []
+        if batch:
+            await self._process(batch, report)
+
+        report.elapsed = time.perf_counter() - started
+        if report.inserted:
+            versions.bump(self.model_class)
+        return report
+
+    async def _process(self, batch: list[tuple[int, dict]], report: ImportReport) -> None:
+        # ошибка одной строки не прерывает пачку; ошибка БД откатывает только эту пачку
+        valid = []
+        for line_no, row in batch:
+            try:
+                obj = self._validate(row)
+            except ValidationError as e:
+                report.add_error(line_no, format_errors(e), self.max_errors)
+                continue
+            except (TypeError, AttributeError) as e:
+                # before-валидаторы схем рассчитаны на строки из формы, а в NDJSON может прийти что угодно
+                report.add_error(line_no, [f"Некорректный тип значения: {e}"], self.max_errors)
+                continue
+            valid.append((line_no, row, obj))
+        if not valid:
+            return
+
+        # связанные записи (авторы) создаются только для прошедших валидацию строк и в той же транзакции
+        self.touched = set()
+        try:
+            records = [(line_no, *self._record(obj)) for line_no, obj in await self._resolve(valid, report)]
+            inserted = await self._write(records) if records else set()
+            await self.session.commit()
+        except (SQLAlchemyError, asyncpg.PostgresError, OSError) as e:
+            await self.session.rollback()
+            # строки, уже отклонённые валидацией, второй раз не считаем
+            for line_no, _, _ in valid:
+                report.add_error(line_no, [f"Ошибка записи пачки: {e.__class__.__name__}"], self.max_errors)
+            return
+        for model in self.touched:
+            versions.bump(model)
+
+        report.inserted += len(inserted)
+        for record in records:
+            if record[0] not in inserted:
+                report.add_error(record[0], [self.duplicate_error], self.max_errors)
+
+    def _validate(self, row: dict) -> BaseModel:
+        return self.schema_class(**row)
+
+    async def _resolve(self, valid: list[tuple[int, dict, BaseModel]],
+                       report: ImportReport) -> list[tuple[int, BaseModel]]:
+        return [(line_no, obj) for line_no, _, obj in valid]
+
+    def _record(self, obj: BaseModel) -> tuple:
+        raise NotImplementedError
+
+    async def _write(self, records: list[tuple]) -> set[int]:
+        # CREATE TEMP TABLE открывает транзакцию сессии, поэтому COPY ниже идёт в неё же
+        await self.session.execute(text(self.staging_ddl))
+        connection = await self.session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            self.staging_table,
+            records=records,
+            columns=self.staging_columns,
+        )
+        result = await self.session.execute(text(self.merge_sql))
+        return set(result.scalars().all())
+
+
+class BookImporter(BulkImporter):
+    schema_class = BookCreateSchema
+    model_class = Book
+    staging_table = "import_book"
+    staging_columns = ("line", "author_id", "bookname", "review", "amount", "cover_url")
+    staging_ddl = (
+        "CREATE TEMP TABLE IF NOT EXISTS import_book ("
+        " line integer, author_id integer, bookname varchar(100), review text, amount integer,"
+        " cover_url varchar(1000)"
+        ") ON COMMIT DELETE ROWS"
+    )
+    # DISTINCT ON: повтор книги внутри файла вставляется один раз — первая строка
+    merge_sql = (
+        "WITH src AS ("
+        "  SELECT DISTINCT ON (author_id, bookname) * FROM import_book ORDER BY author_id, bookname, line"
+        "), ins AS ("
+        "  INSERT INTO library_app_book (author_id, bookname, review, amount, cover_url)"
+        "  SELECT author_id, bookname, review, amount, cover_url FROM src"
+        "  ON CONFLICT (author_id, bookname) DO NOTHING"
+        "  RETURNING author_id, bookname"
+        ") "
+        "SELECT src.line FROM src JOIN ins USING (author_id, bookname)"
+    )
+    duplicate_error = "Книга этого автора уже существует"
+
+    resolve_authors_sql = (
+        "WITH wanted AS (SELECT DISTINCT unnest(CAST(:names AS varchar[])) AS name), "
+        "ins AS ("
+        "  INSERT INTO library_app_bookauthor (name) SELECT name FROM wanted"
+        "  ON CONFLICT (name) DO NOTHING RETURNING id, name"
+        ") "
+        "SELECT id, name, true AS created FROM ins "
+        "UNION ALL "
+        "SELECT a.id, a.name, false FROM library_app_bookauthor a JOIN wanted USING (name)"
+    )
+
+    @staticmethod
+    def _author_name(row: dict) -> str | None:
+        # имя автора используется, только если author_id не задан
+        name = row.get("author")
+        if row.get("author_id") or not isinstance(name, str):
+            return None
+        name = name.strip()
+        return name if 0 < len(name) <= 1000 else None
+
+    def _validate(self, row: dict) -> BookCreateSchema:
+        data = dict(row)
+        data.pop("author", None)
+        if self._author_name(row) is not None:
+            # настоящий id подставит _resolve, когда строка пройдёт валидацию
+            data["author_id"] = 0
+        return self.schema_class(**data)
+
+    async def _resolve(self, valid: list[tuple[int, dict, BookCreateSchema]],
+                       report: ImportReport) -> list[tuple[int, BookCreateSchema]]:
+        # авторы по имени одним запросом на пачку; отсутствующие создаются
+        names = {name for _, row, _ in valid if (name := self._author_name(row)) is not None}
+        author_ids = {}
+        if names:
+            result = await self.session.execute(text(self.resolve_authors_sql), {"names": list(names)})
+            for id_, name, is_new in result.all():
+                author_ids[name] = id_
+                if is_new:
+                    self.touched.add(BookAuthor)
+
+        resolved = []
+        for line_no, row, obj in valid:
+            name = self._author_name(row)
+            if name is not None:
+                if name not in author_ids:
+                    # автора создала параллельная транзакция, и этому снимку он не виден
+                    report.add_error(line_no, ["author: автор создаётся другим импортом, повторите строку"],
+                                     self.max_errors)
+                    continue
+                obj = obj.model_copy(update={"author_id": author_ids[name]})
+            resolved.append((line_no, obj))
+        return resolved
+
+    def _record(self, obj: BookCreateSchema) -> tuple:
+        return obj.author_id, obj.bookname, obj.review, obj.amount, str(obj.cover_url)
+
+
+class ReaderImporter(BulkImporter):
+    schema_class = ReaderImportSchema
+    model_class = Reader
+    staging_table = "import_reader"
+    staging_columns = ("line", "first_name", "last_name", "email", "phone", "cover_url")
+    staging_ddl = (
+        "CREATE TEMP TABLE IF NOT EXISTS import_reader ("
+        " line integer, first_name varchar(100), last_name varchar(100), email varchar(254),"
+        " phone varchar(20), cover_url varchar(1000)"
+        ") ON COMMIT DELETE ROWS"
+    )
+    merge_sql = (
+        "WITH src AS ("
+        "  SELECT DISTINCT ON (email) * FROM import_reader ORDER BY email, line"
+        "), ins AS ("
+        "  INSERT INTO library_app_reader (first_name, last_name, email, phone, cover_url, registered_at)"
+        "  SELECT first_name, last_name, email, phone, cover_url, now() FROM src"
+        "  ON CONFLICT (email) DO NOTHING"
+        "  RETURNING email"
+        ") "
+        "SELECT src.line FROM src JOIN ins USING (email)"
+    )
+    duplicate_error = "Читатель с таким email уже существует"
+
+    def _record(self, obj: ReaderCreateSchema) -> tuple:
+        return (
+            obj.first_name,
+            obj.last_name,
+            obj.email,
+            obj.phone,
+            str(obj.cover_url) if obj.cover_url else None,
+        )
+
+
+IMPORTERS: dict[str, type[BulkImporter]] = {
+    "books": BookImporter,
+    "readers": ReaderImporter,
+}
+
+
+async def read_file(path: str, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("entity", choices=sorted(IMPORTERS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, default=None)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+
+    engine = create_async_engine(DBSettings().url)
+    try:
+        async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+            importer = IMPORTERS[args.entity](session, batch_size=args.batch_size)
+            report = await importer.run(read_file(args.path), fmt)
+    finally:
+        await engine.dispose()
+
+    print(json.dumps(report.model_dump(), ensure_ascii=False, indent=2))
+    print(f"{report.rows_per_second:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
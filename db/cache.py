@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+
+from .api import Database
+
+logger = logging.getLogger("db.cache")
+
+
+class TableVersions:
+    # версии по таблицам: запись меняет версию, кэши сравнивают снимок. Версия — пара из счётчика bump
+    # этого процесса (свои записи видны сразу) и отметки из Postgres (observe), которая ловит записи
+    # других воркеров, админки и импорта
+    def __init__(self):
+        self._versions: dict[str, int] = {}
+        self._stamps: dict[str, int] = {}
+        self._changed_at: dict[str, float] = {}
+
+    @staticmethod
+    def _name(table) -> str:
+        return table if isinstance(table, str) else table.__tablename__
+
+    def bump(self, *tables) -> None:
+        now = time.time()
+        for table in tables:
+            name = self._name(table)
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._changed_at[name] = now
+
+    def observe(self, stamps: dict[str, int]) -> None:
+        now = time.time()
+        for name, stamp in stamps.items():
+            previous = self._stamps.get(name)
+            if previous is not None and previous != stamp:
+                self._changed_at[name] = now
+            self._stamps[name] = stamp
+
+    def get(self, *tables) -> tuple[tuple[int, int], ...]:
+        names = [self._name(table) for table in tables]
+        return tuple((self._versions.get(name, 0), self._stamps.get(name, 0)) for name in names)
+
+    def changed_at(self, *tables) -> float:
+        return max((self._changed_at.get(self._name(table), 0.0) for table in tables), default=0.0)
+
+
+versions = TableVersions()
+
+
+class VersionSync:
+    # Раз в interval читает из pg_stat_user_tables число вставленных, изменённых и удалённых строк
+    # по каждой таблице и передаёт его в versions.observe. Счётчики пишутся после конца транзакции, поэтому
+    # новая отметка не опережает коммит, и на запись они не добавляют ни триггеров, ни блокировок.
+    # Бэкенд сбрасывает их в общую статистику не чаще раза в секунду, а в простое — в пределах 10 секунд:
+    # чужая запись видна в кэшах этого воркера через interval плюс эту задержку, дальше страхует ttl кэшей.
+    # Нужен track_counts = on (по умолчанию); отказ опроса только логируется.
+    QUERY = text(
+        "SELECT relname, n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables "
+        "WHERE schemaname = current_schema()"
+    )
+
+    def __init__(self, database: Database, *, interval: float = 1, table_versions: TableVersions = versions):
+        self.database = database
+        self.interval = interval
+        self.versions = table_versions
+        self.polls = 0
+        self.failures = 0
+        self._task: asyncio.Task | None = None
+
+    async def sync(self) -> None:
+        # мастер: счётчики pg_stat не реплицируются
+        async with self.database.get_session() as session:
+            rows = (await session.execute(self.QUERY)).all()
+        self.versions.observe({name: int(stamp) for name, stamp in rows})
+        self.polls += 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception:
+                self.failures += 1
+                logger.exception("table version sync failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {"polls": self.polls, "failures": self.failures}
+
+
+class VersionedCache:
+    # LRU с бюджетом по памяти; запись валидна, пока не сменилась версия её таблиц и не истёк ttl.
+    # ttl страхует от записей, которые versions ещё не увидел (задержка VersionSync или он не запущен)
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 300, settle: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # с репликами значение, загруженное вскоре после записи, могло прийти с отстающей реплики:
+        # такая запись живёт только до конца окна settle, потом перечитывается
+        self.settle = settle
+        self._entries: OrderedDict[str, tuple[tuple, float, object, int]] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, version: tuple):
+        entry = self._entries.get(key)
+        if entry and entry[0] == version and entry[1] > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, version: tuple, tables: tuple, value) -> None:
+        # version — снимок, взятый до загрузки: запись во время загрузки сделает значение сразу устаревшим
+        ttl = self.ttl
+        if self.settle:
+            since_change = time.time() - versions.changed_at(*tables)
+            if since_change < self.settle:
+                ttl = min(ttl, self.settle - since_change)
+        self._store(key, (version, time.monotonic() + ttl, value, self._estimate(value)))
+
+    def _store(self, key: str, entry: tuple) -> None:
+        old = self._entries.pop(key, None)
+        if old:
+            self._size -= old[3]
+        if entry[3] > self.max_bytes:
+            return
+
+        self._entries[key] = entry
+        self._size += entry[3]
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted[3]
+            self.evictions += 1
+
+    @classmethod
+    def _estimate(cls, value) -> int:
+        # размер по умолчанию: sys.getsizeof самого значения и, для контейнеров, их элементов.
+        # Подклассы со своими типами значений переопределяют оценку
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += sum(cls._estimate(key) + cls._estimate(item) for key, item in value.items())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(cls._estimate(item) for item in value)
+        return size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ChoiceCache(VersionedCache):
+    # списки для SelectField
+    async def get_or_load(self, key: str, tables: tuple, loader: Callable[[], Awaitable[list]]) -> list:
+        version = versions.get(*tables)
+        choices = self.get(key, version)
+        if choices is None:
+            choices = await loader()
+            self.put(key, version, tables, choices)
+        return choices
+
+
+choice_cache = ChoiceCache()
@@ -0,0 +1,122 @@
+import json
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import versions
+
+
+class ExactCounter:
+    # qs — QuerySet до limit/offset: count_query и params берутся из него
+    async def count(self, session: AsyncSession, qs, *, name: str, filters: tuple = (),
+                    tables: tuple = ()) -> tuple[int, bool]:
+        total = await session.scalar(qs.count_query, qs.params)
+        return total, True
+
+
+class CachedCounter(ExactCounter):
+    # точный count, закэшированный по (queryset, фильтры) до записи в одну из таблиц или истечения ttl
+    def __init__(self, ttl: float = 60, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[tuple, float, int, bool]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def count(self, session: AsyncSession, qs, *, name: str, filters: tuple = (),
+                    tables: tuple = ()) -> tuple[int, bool]:
+        key = (name, filters)
+        version = versions.get(*tables)
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry and entry[0] == version and entry[1] > now:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2], entry[3]
+
+        self.misses += 1
+        total, exact = await self._compute(session, qs, filters=filters, tables=tables)
+        self._entries[key] = (version, now + self.ttl, total, exact)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return total, exact
+
+    async def _compute(self, session, qs, *, filters, tables) -> tuple[int, bool]:
+        return await super().count(session, qs, name="", filters=filters, tables=tables)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class EstimatedCounter(CachedCounter):
+    # без фильтров берём pg_class.reltuples, с фильтрами — оценку планировщика из EXPLAIN.
+    # Маленькие оценки пересчитываем точно: это дёшево, а ошибка там заметнее всего
+    def __init__(self, ttl: float = 60, max_entries: int = 1024, exact_below: int = 10_000):
+        super().__init__(ttl=ttl, max_entries=max_entries)
+        self.exact_below = exact_below
+
+    async def _compute(self, session, qs, *, filters, tables) -> tuple[int, bool]:
+        if any(value is not None for value in filters):
+            estimate = await self._explain_rows(session, qs.query.params(qs.params))
+        else:
+            estimate = await self._reltuples(session, tables[0])
+
+        if estimate is None or estimate < self.exact_below:
+            return await super()._compute(session, qs, filters=filters, tables=tables)
+        return estimate, False
+
+    @staticmethod
+    async def _reltuples(session, table) -> int | None:
+        estimate = await session.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": table.__tablename__},
+        )
+        # -1 — таблицу ещё ни разу не анализировали
+        return estimate if estimate is not None and estimate >= 0 else None
+
+    @staticmethod
+    async def _explain_rows(session, stmt) -> int | None:
+        # значения фильтров уходят параметрами драйвера: пользовательский текст не попадает в SQL и не
+        # разбирается text() как :name
+        try:
+            compiled = stmt.compile(dialect=session.bind.dialect, compile_kwargs={"render_postcompile": True})
+        except CompileError:
+            return None
+        params = compiled.construct_params()
+        if compiled.positional:
+            params = tuple(params[name] for name in compiled.positiontup)
+        connection = await session.connection()
+        plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+
+COUNTERS = {
+    "exact": ExactCounter,
+    "cached": CachedCounter,
+    "estimate": EstimatedCounter,
+}
+
+_counter: ExactCounter = CachedCounter()
+
+
+def build_counter(strategy: str, *, ttl: float = 60) -> ExactCounter:
+    counter_class = COUNTERS.get(strategy)
+    if counter_class is None:
+        raise ValueError(f"Unknown count strategy: {strategy}")
+    return counter_class() if counter_class is ExactCounter else counter_class(ttl=ttl)
+
+
+def get_counter() -> ExactCounter:
+    return _counter
+
+
+def set_counter(counter: ExactCounter) -> None:
+    global _counter
+    _counter = counter
@@ -1,6 +1,32 @@
 
 from config.db_config import DBSettings
 from db.api import Database
+from db.cache import choice_cache
+from db.counting import build_counter, set_counter
+from db.instrumentation import QueryInstrumentation
 
 settings = DBSettings()
-db: Database = Database(url=settings.url, echo=settings.echo)
+db: Database = Database(
+    url=settings.url,
+    echo=settings.echo,
+    pool_size=settings.pool_size,
+    max_overflow=settings.max_overflow,
+    pool_timeout=settings.pool_timeout,
+    pool_recycle=settings.pool_recycle,
+    pool_pre_ping=settings.pool_pre_ping,
+    statement_cache_size=settings.statement_cache_size,
+    command_timeout=settings.command_timeout,
+    replica_urls=settings.replica_urls,
+    replica_max_lag=settings.replica_max_lag,
+    replica_check_interval=settings.replica_check_interval,
+    instrumentation=QueryInstrumentation(
+        enabled=settings.sql_instrumentation,
+        slow_query_ms=settings.slow_query_ms,
+        n_plus_one_threshold=settings.n_plus_one_threshold,
+    ),
+)
+set_counter(build_counter(settings.count_strategy, ttl=settings.count_cache_ttl))
+choice_cache.max_bytes = settings.choice_cache_max_bytes
+choice_cache.ttl = settings.choice_cache_ttl
+if settings.replica_urls:
+    choice_cache.settle = settings.replica_max_lag
@@ -0,0 +1,103 @@
+# Учёт SQL по HTTP-запросам: число и время запросов, повторы одного и того же оператора (N+1)
+# и медленные запросы с маршрутом. Хуки висят на движке только пока учёт включён, поэтому
+# в выключенном состоянии затраты нулевые; включать и выключать можно на живом приложении.
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("db.sql")
+
+
+class RequestQueries:
+    __slots__ = ("route", "count", "total", "statements", "token")
+
+    def __init__(self, route: str = "-"):
+        self.route = route
+        self.token = None
+        self.count = 0
+        self.total = 0.0
+        # текст оператора -> сколько раз выполнен; параметры не учитываются, поэтому
+        # цикл «SELECT ... WHERE id = ?» по списку виден как один оператор с большим счётчиком
+        self.statements: dict[str, int] = {}
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        return [(sql, count) for sql, count in self.statements.items() if count >= threshold]
+
+
+# greenlet'ы SQLAlchemy наследуют контекст вызывающей корутины, так что хуки видят запрос
+current_queries: ContextVar[RequestQueries | None] = ContextVar("current_queries", default=None)
+
+
+class QueryInstrumentation:
+    def __init__(self, *, enabled: bool = False, slow_query_ms: float = 200, n_plus_one_threshold: int = 5):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        # мастер и реплики: на каждом движке свои хуки
+        self._engines: list[Engine] = []
+
+    def bind(self, engine: Engine) -> None:
+        # вызывается Database.connect(); хуки ставятся, только если учёт включён
+        self._engines.append(engine)
+        if self.enabled:
+            self._attach(engine)
+
+    def unbind(self) -> None:
+        for engine in self._engines:
+            self._detach(engine)
+        self._engines = []
+
+    def set_enabled(self, enabled: bool) -> None:
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        for engine in self._engines:
+            self._attach(engine) if enabled else self._detach(engine)
+
+    def _attach(self, engine: Engine) -> None:
+        if not event.contains(engine, "before_cursor_execute", self._before):
+            event.listen(engine, "before_cursor_execute", self._before)
+            event.listen(engine, "after_cursor_execute", self._after)
+
+    def _detach(self, engine: Engine) -> None:
+        if event.contains(engine, "before_cursor_execute", self._before):
+            event.remove(engine, "before_cursor_execute", self._before)
+            event.remove(engine, "after_cursor_execute", self._after)
+
+    @staticmethod
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info["query_started"] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+        queries = current_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.total += elapsed
+            queries.statements[statement] = queries.statements.get(statement, 0) + 1
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            logger.warning(
+                "slow query %.1f ms route=%s: %s",
+                elapsed * 1000, queries.route if queries else "-", _shorten(statement),
+            )
+
+    def start(self, route: str = "-") -> RequestQueries | None:
+        if not self.enabled:
+            return None
+        queries = RequestQueries(route)
+        queries.token = current_queries.set(queries)
+        return queries
+
+    def finish(self, queries: RequestQueries) -> None:
+        current_queries.reset(queries.token)
+        for statement, count in queries.repeated(self.n_plus_one_threshold):
+            logger.warning("possible N+1 route=%s: %d× %s", queries.route, count, _shorten(statement))
+
+
+def _shorten(statement: str, limit: int = 500) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else f"{statement[:limit]}…"
@@ -3,14 +3,14 @@ import uuid
 from sqlalchemy.orm import DeclarativeBase
 
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from sqlalchemy import (
     BigInteger,
     String,
     DateTime, Boolean,
 
 )
-from sqlalchemy import String, Text, Integer, ForeignKey, UniqueConstraint, Date, Index
+from sqlalchemy import String, Text, Integer, ForeignKey, UniqueConstraint, Date, Index, func
 
 from sqlalchemy.orm import (
     Mapped,
@@ -36,6 +36,15 @@ class BookAuthor(Base):
         cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        Index(
+            "ix_bookauthor_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+
     def __repr__(self) -> str:
         return self.name
 
@@ -64,6 +73,12 @@ class Book(Base):
             "bookname",
             name="unique_book_per_author"
         ),
+        Index(
+            "ix_book_bookname_trgm",
+            "bookname",
+            postgresql_using="gin",
+            postgresql_ops={"bookname": "gin_trgm_ops"},
+        ),
     )
 
     def __repr__(self) -> str:
@@ -185,6 +200,21 @@ class BookLoan(Base):
             unique=True,
             postgresql_where=(returned_at.is_(None)),
         ),
+        # выдачи одного читателя: история и выгрузка по читателю
+        Index("ix_bookloan_reader_issued", "reader_id", "issued_at"),
+        # текущие выдачи читателя и просроченные среди них (профиль читателя)
+        Index(
+            "ix_bookloan_reader_active",
+            "reader_id",
+            "due_date",
+            postgresql_where=(returned_at.is_(None)),
+        ),
+        # пересчёт статистики (db/stats.py): выдачи книги, выдачи и возвраты после отметки
+        Index("ix_bookloan_book_issued", "book_id", "issued_at"),
+        Index("ix_bookloan_issued_at", "issued_at"),
+        Index("ix_bookloan_returned_at", "returned_at", postgresql_where=(returned_at.isnot(None))),
+        # только книги на руках, по сроку: сканер просрочек (db/overdue.py) идёт по нему пачками
+        Index("ix_bookloan_active_due", "due_date", "id", postgresql_where=(returned_at.is_(None))),
     )
 
     def __repr__(self) -> str:
@@ -224,3 +254,114 @@ class ReaderTicket(Base):
 
     def __repr__(self) -> str:
         return f"Билет {self.code} — {self.reader}"
+
+
+# Статистика выдач: сводные таблицы, которые пересчитывает db/stats.py. Читаются только дашбордом
+
+
+class BookStats(Base):
+    __tablename__ = "library_app_bookstats"
+
+    book_id: Mapped[int] = mapped_column(
+        ForeignKey("library_app_book.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    loans_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    loans_active: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_issued_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("ix_bookstats_loans_total", "loans_total"),
+    )
+
+
+class ReaderStats(Base):
+    __tablename__ = "library_app_readerstats"
+
+    reader_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("library_app_reader.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    loans_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    loans_active: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_issued_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("ix_readerstats_loans_total", "loans_total"),
+    )
+
+
+class DailyCheckouts(Base):
+    __tablename__ = "library_app_dailycheckouts"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    checkouts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class CirculationStats(Base):
+    # одна строка: отметка пересчёта и срез по текущим выдачам на момент refreshed_at
+    __tablename__ = "library_app_circulationstats"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # изменения выдач с issued_at/returned_at не раньше отметки ещё не учтены
+    watermark: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    full_refreshed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    refreshed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    active_loans: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    overdue_loans: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    overdue_readers: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class OverdueLoan(Base):
+    # просроченная выдача, найденная db/overdue.py; resolved_at — когда книгу вернули или продлили срок
+    __tablename__ = "library_app_overdueloan"
+
+    # id выдачи: одна запись на выдачу, повторная просрочка после продления открывает ту же запись
+    id: Mapped[int] = mapped_column(
+        ForeignKey("library_app_bookloan.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    reader_id: Mapped[int] = mapped_column(
+        ForeignKey("library_app_reader.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    book_id: Mapped[int] = mapped_column(
+        ForeignKey("library_app_book.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    due_date: Mapped[date] = mapped_column(Date, nullable=False)
+    detected_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    resolved_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("ix_overdueloan_open", "due_date", "id", postgresql_where=(resolved_at.is_(None))),
+    )
+
+
+class OverdueScanState(Base):
+    # одна строка: докуда дошёл сканер просрочек (db/overdue.py). Пишется в транзакции каждой пачки,
+    # поэтому новый лидер продолжает с того же места
+    __tablename__ = "library_app_overduescanstate"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # просрочки со сроком раньше отметки уже записаны; новые ищутся в [watermark, сегодня)
+    watermark: Mapped[Optional[date]] = mapped_column(Date)
+    # (due_date, id) последней записанной выдачи внутри [watermark, сегодня)
+    cursor_due_date: Mapped[Optional[date]] = mapped_column(Date)
+    cursor_id: Mapped[Optional[int]] = mapped_column(Integer)
+    # возвраты начиная с этого момента (минус lookback) ещё не закрыли свои записи
+    returned_since: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    # полный обход: "detect" — выдачи со сроком раньше watermark (задним числом, отмена возврата),
+    # "resolve" — открытые записи (продления); None — не идёт
+    sweep_phase: Mapped[Optional[str]] = mapped_column(String(10))
+    sweep_due_date: Mapped[Optional[date]] = mapped_column(Date)
+    sweep_id: Mapped[Optional[int]] = mapped_column(Integer)
+    swept_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+
+# Префиксный поиск для typeahead: lower(...) COLLATE "C" позволяет обслуживать индексом
+# и LIKE 'abc%', и ORDER BY по тому же выражению (см. BaseQuerySet.prefix_search)
+Index("ix_reader_last_name_prefix", func.lower(Reader.last_name).collate("C"))
+Index("ix_book_bookname_prefix", func.lower(Book.bookname).collate("C"))
+Index("ix_bookauthor_name_prefix", func.lower(BookAuthor.name).collate("C"))
@@ -0,0 +1,306 @@
+# Сканер просроченных выдач: фоновая задача, которая записывает в library_app_overdueloan выдачи с истёкшим
+# due_date и без возврата и закрывает записи, когда книгу вернули или срок продлили.
+# - Новые просрочки ищутся только в [watermark, сегодня) по частичному индексу ix_bookloan_active_due
+#   (due_date, id) WHERE returned_at IS NULL: выдача, срок которой истёк вчера, находится на следующем проходе,
+#   а не после всего хвоста старых просрочек. Закончив диапазон, сканер сдвигает watermark на сегодня.
+# - Записи закрываются по возвратам с прошлого прохода (индекс ix_bookloan_returned_at), с запасом lookback
+#   на возвраты, оформленные задним числом.
+# - Чего отметки не видят — выдачи со сроком в прошлом, заведённые задним числом, отменённые возвраты,
+#   продления, — исправляет полный обход раз в full_every: те же ограниченные пачки после основной работы.
+# - Состояние (отметки и курсоры) лежит в library_app_overduescanstate и пишется в транзакции каждой пачки:
+#   новый лидер продолжает с того же места. За проход — не больше max_batches пачек по batch_size.
+# - Перед пачкой сканер уступает запросам: пока пул соединений занят (есть ожидающие или ушли в overflow),
+#   ждёт, но не дольше interval.
+# - Сканирует один воркер: лидер держит pg_advisory_lock на отдельном соединении, остальные раз в interval
+#   пробуют его взять. Упал лидер — соединение закрылось, блокировку берёт другой. За PgBouncer в transaction-режиме
+#   блокировка уровня сессии не работает: сканер нужно запускать на прямом соединении или в одном воркере.
+# - stop() дожидается конца текущей пачки и отпускает блокировку до возврата соединения в пул.
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import Date, bindparam, case, func, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .api import Database
+from .cache import versions
+from .models import BookLoan, OverdueLoan, OverdueScanState
+
+logger = logging.getLogger("db.overdue")
+
+# ключ pg_advisory_lock лидера; у пересчёта статистики (db/stats.py) свой
+LOCK_KEY = 7_240_002
+STATE_ID = 1
+STATE_FIELDS = (
+    "watermark", "cursor_due_date", "cursor_id", "returned_since", "sweep_phase", "sweep_due_date", "sweep_id",
+    "swept_at",
+)
+
+
+def _overdue_batch(lower: date | None, upper: date, cursor: tuple | None, size: int):
+    stmt = (
+        select(BookLoan.id, BookLoan.reader_id, BookLoan.book_id, BookLoan.due_date)
+        .where(BookLoan.returned_at.is_(None), BookLoan.due_date < bindparam("upper", upper, type_=Date))
+        .order_by(BookLoan.due_date, BookLoan.id)
+        .limit(size)
+    )
+    if lower is not None:
+        stmt = stmt.where(BookLoan.due_date >= bindparam("lower", lower, type_=Date))
+    if cursor is not None:
+        stmt = stmt.where(tuple_(BookLoan.due_date, BookLoan.id) > tuple_(*cursor))
+    return stmt
+
+
+def _record(rows: list) -> object:
+    # новая просрочка — вставка; закрытая ранее (продлили, и срок снова истёк) — открывается заново;
+    # у открытой меняется только due_date, если его успели поправить. RETURNING — только реально изменённые
+    stmt = insert(OverdueLoan).values([
+        {"id": row.id, "reader_id": row.reader_id, "book_id": row.book_id, "due_date": row.due_date} for row in rows
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=[OverdueLoan.id],
+        set_={
+            "due_date": stmt.excluded.due_date,
+            "detected_at": case((OverdueLoan.resolved_at.isnot(None), func.now()), else_=OverdueLoan.detected_at),
+            "resolved_at": None,
+        },
+        where=or_(OverdueLoan.resolved_at.isnot(None), OverdueLoan.due_date != stmt.excluded.due_date),
+    ).returning(OverdueLoan.id)
+
+
+def _settled(*criteria):
+    # из выдач по criteria — те, что вернули или продлили: их записи больше не просрочки
+    loans = (
+        select(BookLoan.id)
+        .where(*criteria)
+        .where(or_(BookLoan.returned_at.isnot(None), BookLoan.due_date >= func.current_date()))
+    )
+    return (
+        update(OverdueLoan)
+        .where(OverdueLoan.resolved_at.is_(None), OverdueLoan.id.in_(loans))
+        .values(resolved_at=func.now())
+    )
+
+
+def _open_batch(cursor: tuple | None, size: int):
+    stmt = (
+        select(OverdueLoan.id, OverdueLoan.due_date)
+        .where(OverdueLoan.resolved_at.is_(None))
+        .order_by(OverdueLoan.due_date, OverdueLoan.id)
+        .limit(size)
+    )
+    if cursor is not None:
+        stmt = stmt.where(tuple_(OverdueLoan.due_date, OverdueLoan.id) > tuple_(*cursor))
+    return stmt
+
+
+def _cursor(due_date: date | None, id_: int | None) -> tuple | None:
+    return None if id_ is None else (due_date, id_)
+
+
+def _save_state(state: dict):
+    stmt = insert(OverdueScanState).values(id=STATE_ID, **state)
+    return stmt.on_conflict_do_update(index_elements=[OverdueScanState.id], set_=state)
+
+
+class OverdueScanner:
+    def __init__(self, *, interval: float = 300, batch_size: int = 500, max_batches: int = 20,
+                 lookback: timedelta = timedelta(hours=48), full_every: timedelta = timedelta(hours=24),
+                 shutdown_timeout: float = 10):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.lookback = lookback
+        self.full_every = full_every
+        self.shutdown_timeout = shutdown_timeout
+        self.database: Database | None = None
+        self.leader = False
+        self.passes = 0
+        self.detected = 0
+        self.resolved = 0
+        self.paused = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.last_pass_at: float | None = None
+        # последнее записанное состояние (OverdueScanState) — для stats()
+        self._state: dict = {}
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self, database: Database) -> None:
+        if self._task is None:
+            self.database = database
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("overdue scanner did not stop in %ss, cancelled", self.shutdown_timeout)
+        self._task = None
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                async with self.database.dedicated_connection() as connection:
+                    if await self._acquire(connection):
+                        try:
+                            await self._lead(connection)
+                        finally:
+                            self.leader = False
+                            await self._release(connection)
+            except Exception:
+                self.failures += 1
+                logger.exception("overdue scanner failed")
+            await self._sleep(self.interval)
+
+    @staticmethod
+    async def _acquire(connection: AsyncConnection) -> bool:
+        acquired = await connection.scalar(select(func.pg_try_advisory_lock(LOCK_KEY)))
+        await connection.commit()
+        return bool(acquired)
+
+    @staticmethod
+    async def _release(connection: AsyncConnection) -> None:
+        # соединение вернётся в пул: с неснятой блокировкой его нельзя отдавать другим сессиям
+        try:
+            await connection.rollback()
+            await connection.scalar(select(func.pg_advisory_unlock(LOCK_KEY)))
+            await connection.commit()
+        except Exception:
+            await connection.invalidate()
+
+    async def _lead(self, connection: AsyncConnection) -> None:
+        self.leader = True
+        logger.info("overdue scanner is the leader")
+        while not self._stopping.is_set():
+            await self.scan(connection)
+            await self._sleep(self.interval)
+
+    async def _yield_to_requests(self) -> None:
+        deadline = time.monotonic() + self.interval
+        while not self._stopping.is_set() and time.monotonic() < deadline:
+            stats = self.database.pool_stats()
+            if not stats or (stats["waiters"] == 0 and stats["checked_out"] < stats["size"]):
+                return
+            self.paused += 1
+            await self._sleep(1)
+
+    async def scan(self, connection: AsyncConnection) -> tuple[int, int]:
+        started = time.perf_counter()
+        # дата и время базы, а не воркера: сравниваются с due_date и returned_at в той же базе
+        today, now = (await connection.execute(select(func.current_date(), func.now()))).one()
+        state = self._state = await self._load_state(connection, now)
+        budget = self.max_batches
+        detected = resolved = 0
+
+        # 1. выдачи, чей срок истёк с прошлого прохода: [watermark, сегодня)
+        while budget and not self._stopping.is_set():
+            budget -= 1
+            await self._yield_to_requests()
+            cursor = _cursor(state["cursor_due_date"], state["cursor_id"])
+            rows = (await connection.execute(
+                _overdue_batch(state["watermark"], today, cursor, self.batch_size)
+            )).all()
+            detected += await self._record_rows(connection, rows)
+            done = len(rows) < self.batch_size
+            if done:
+                state.update(watermark=today, cursor_due_date=None, cursor_id=None)
+            else:
+                state.update(cursor_due_date=rows[-1].due_date, cursor_id=rows[-1].id)
+            await self._save(connection, state)
+            if done:
+                break
+
+        # 2. возвраты с прошлого прохода; на первом проходе записи закроет полный обход
+        if not self._stopping.is_set():
+            if state["returned_since"] is not None:
+                await self._yield_to_requests()
+                since = state["returned_since"] - self.lookback
+                resolved += (await connection.execute(_settled(BookLoan.returned_at >= since))).rowcount
+            state["returned_since"] = now
+            await self._save(connection, state)
+
+        # 3. полный обход — только остатком бюджета прохода, после новых просрочек
+        if state["sweep_phase"] is None and now - state["swept_at"] >= self.full_every:
+            state.update(sweep_phase="detect", sweep_due_date=None, sweep_id=None, swept_at=now)
+        while budget and state["sweep_phase"] is not None and not self._stopping.is_set():
+            budget -= 1
+            await self._yield_to_requests()
+            cursor = _cursor(state["sweep_due_date"], state["sweep_id"])
+            if state["sweep_phase"] == "detect":
+                upper = state["watermark"] or today
+                rows = (await connection.execute(_overdue_batch(None, upper, cursor, self.batch_size))).all()
+                detected += await self._record_rows(connection, rows)
+            else:
+                rows = (await connection.execute(_open_batch(cursor, self.batch_size))).all()
+                if rows:
+                    ids = [row.id for row in rows]
+                    resolved += (await connection.execute(_settled(BookLoan.id.in_(ids)))).rowcount
+            if len(rows) < self.batch_size:
+                phase = "resolve" if state["sweep_phase"] == "detect" else None
+                state.update(sweep_phase=phase, sweep_due_date=None, sweep_id=None)
+            else:
+                state.update(sweep_due_date=rows[-1].due_date, sweep_id=rows[-1].id)
+            await self._save(connection, state)
+
+        self.passes += 1
+        self.detected += detected
+        self.resolved += resolved
+        self.last_duration = time.perf_counter() - started
+        self.last_pass_at = time.time()
+        if detected or resolved:
+            versions.bump(OverdueLoan)
+            logger.info("overdue scan: %d new, %d resolved", detected, resolved)
+        return detected, resolved
+
+    @staticmethod
+    async def _load_state(connection: AsyncConnection, now) -> dict:
+        columns = [OverdueScanState.__table__.c[name] for name in STATE_FIELDS]
+        row = (await connection.execute(select(*columns).where(OverdueScanState.id == STATE_ID))).one_or_none()
+        if row is not None:
+            return dict(row._mapping)
+        # первый запуск: шаг 1 пройдёт все просрочки с начала, а полный обход сразу закроет устаревшие записи
+        return {**dict.fromkeys(STATE_FIELDS), "sweep_phase": "resolve", "swept_at": now}
+
+    @staticmethod
+    async def _record_rows(connection: AsyncConnection, rows: list) -> int:
+        if not rows:
+            return 0
+        return len((await connection.execute(_record(rows))).all())
+
+    @staticmethod
+    async def _save(connection: AsyncConnection, state: dict) -> None:
+        # состояние — в той же транзакции, что и пачка: записанное и отметка не расходятся
+        await connection.execute(_save_state(state))
+        await connection.commit()
+
+    def stats(self) -> dict:
+        return {
+            "leader": int(self.leader),
+            "passes": self.passes,
+            "detected": self.detected,
+            "resolved": self.resolved,
+            "paused": self.paused,
+            "failures": self.failures,
+            "last_duration_seconds": round(self.last_duration, 3),
+            # новые просрочки ещё не пройдены до сегодняшнего дня
+            "backlog": int(bool(self._state) and (self._state["cursor_id"] is not None
+                                                  or self._state["watermark"] is None)),
+            "sweeping": int(bool(self._state) and self._state["sweep_phase"] is not None),
+        }
+
+
+overdue_scanner = OverdueScanner()
@@ -1,38 +1,176 @@
-from sqlalchemy import select, or_, func
+from collections.abc import Mapping
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (
+    select, or_, func, tuple_, literal, union, update, insert, case, exists, bindparam, true, Integer, String, JSON,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.orm import contains_eager
 
+from schemas.pagination import encode_cursor
 from .models import *
 
 
 class BaseQuerySet:
+    # Методы-построители не собирают select() сразу: они записывают шаг с ключом формы запроса
+    # (какие join, сортировка, есть ли поиск) и откладывают сборку, а значения (id, шаблоны, limit/offset)
+    # кладут в params под именами bindparam. Собранный оператор кэшируется по (класс, шаги):
+    # повторный запрос той же формы не строит дерево заново, а SQLAlchemy не пересчитывает ключ кэша —
+    # он запоминается на самом объекте оператора. Выполнять нужно с параметрами: execute(qs.query, qs.params)
+    _statements: dict[tuple, object] = {}
+    statement_cache_size = 512
+
     def __init__(self, model_class):
         self.model_class = model_class
-        self._stmt = select(model_class)
+        self.params: dict = {}
+        self._steps: list = []
+        self._builders: list = []
+        self._sort_column = None
+        self._sort_desc = False
 
-    def filter_by_id(self, obj_id: int):
-        self._stmt = self._stmt.where(self.model_class.id == obj_id)
+    def _base(self):
+        return select(self.model_class)
+
+    def _step(self, key, build=None):
+        # key — всё, от чего зависит текст SQL; build(stmt) -> stmt вызывается только при промахе кэша
+        self._steps.append(key)
+        if build is not None:
+            self._builders.append(build)
         return self
 
+    def _cached(self, key: tuple, build):
+        stmt = self._statements.get(key)
+        if stmt is None:
+            stmt = build()
+            if len(self._statements) >= self.statement_cache_size:
+                # форм запросов немного; переполнение — признак ошибки, вытесняем самую старую
+                self._statements.pop(next(iter(self._statements)))
+            self._statements[key] = stmt
+        return stmt
+
+    def _build(self):
+        stmt = self._base()
+        for build in self._builders:
+            stmt = build(stmt)
+        return stmt
+
+    def filter_by_id(self, obj_id: int):
+        self.params["obj_id"] = obj_id
+        model = self.model_class
+        return self._step("filter_by_id", lambda stmt: stmt.where(model.id == bindparam("obj_id")))
+
     def one(self):
-        self._stmt = self._stmt.limit(1)
-        return self
+        return self._step("one", lambda stmt: stmt.limit(1))
+
+    def limit(self, count: int):
+        self.params["limit"] = count
+        return self._step("limit", lambda stmt: stmt.limit(bindparam("limit", type_=Integer)))
+
+    def offset(self, count: int):
+        self.params["offset"] = count
+        return self._step("offset", lambda stmt: stmt.offset(bindparam("offset", type_=Integer)))
 
     def order_by(self, field: str | None):
+        # id всегда добавляется последним ключом, чтобы порядок был стабильным
+        self._sort_column = None
+        self._sort_desc = False
         if field:
-            desc = field.startswith('-')
-            field_name = field.lstrip('-')
-            column = getattr(self.model_class, field_name, None)
-            if column:
-                self._stmt = self._stmt.order_by(column.desc() if desc else column.asc())
+            column = getattr(self.model_class, field.lstrip('-'), None)
+            if column is not None:
+                self._sort_column = column
+                self._sort_desc = field.startswith('-')
 
-        else:
-            self._stmt = self._stmt.order_by(self.model_class.id)
+        ordering = self._ordering()
+        sort_key = self._sort_column.key if self._sort_column is not None else None
+        return self._step(("order_by", sort_key, self._sort_desc), lambda stmt: stmt.order_by(*ordering))
 
-        return self
+    def _sort_keys(self) -> list:
+        if self._sort_column is None:
+            return [self.model_class.id]
+        return [self._sort_column, self.model_class.id]
+
+    def _ordering(self, reverse: bool = False) -> list:
+        desc = self._sort_desc != reverse
+        return [key.desc() if desc else key.asc() for key in self._sort_keys()]
+
+    @property
+    def seekable(self) -> bool:
+        # сравнение кортежей не работает с NULL, поэтому keyset только по NOT NULL колонкам
+        return self._sort_column is None or not self._sort_column.expression.nullable
+
+    def _seek_values(self, values: list) -> list | None:
+        keys = self._sort_keys()
+        if len(values) != len(keys):
+            return None
+        coerced = []
+        for key, value in zip(keys, values):
+            python_type = key.type.python_type
+            try:
+                if python_type in (datetime, date) and isinstance(value, str):
+                    value = python_type.fromisoformat(value)
+                elif not isinstance(value, python_type):
+                    value = python_type(value)
+            except (TypeError, ValueError):
+                return None
+            coerced.append(value)
+        return coerced
+
+    def seek(self, values: list, *, backwards: bool = False):
+        # keyset: WHERE (sort_key, id) > (:seek_0, :seek_1) вместо OFFSET
+        values = self._seek_values(values)
+        if values is None:
+            return self
+
+        keys = self._sort_keys()
+        for index, value in enumerate(values):
+            self.params[f"seek_{index}"] = value
+        greater = self._sort_desc == backwards
+        reversed_ordering = self._ordering(reverse=True) if backwards else None
+
+        def build(stmt):
+            bounds = [bindparam(f"seek_{index}", type_=key.type) for index, key in enumerate(keys)]
+            if len(keys) == 1:
+                row, bound = keys[0], bounds[0]
+            else:
+                row, bound = tuple_(*keys), tuple_(*bounds)
+            stmt = stmt.where(row > bound if greater else row < bound)
+            if backwards:
+                stmt = stmt.order_by(None).order_by(*reversed_ordering)
+            return stmt
+
+        return self._step(("seek", backwards), build)
+
+    def prefix_search(self, field: str, text: str | None):
+        # выражение совпадает с индексами *_prefix в models.py: и LIKE 'abc%', и ORDER BY идут по индексу
+        model = self.model_class
+        if text:
+            escaped = text.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            self.params["prefix"] = f"{escaped}%"
+
+        def build(stmt):
+            key = func.lower(getattr(model, field)).collate("C")
+            if text:
+                stmt = stmt.where(key.like(bindparam("prefix", type_=String)))
+            return stmt.order_by(None).order_by(key, model.id)
+
+        return self._step(("prefix_search", field, bool(text)), build)
+
+    def cursor_for(self, row) -> str:
+        keys = [key.key for key in self._sort_keys()]
+        if isinstance(row, Mapping):
+            return encode_cursor([row[key] for key in keys])
+        return encode_cursor([getattr(row, key) for key in keys])
 
     @property
     def query(self):
-        return self._stmt
+        return self._cached((type(self), *self._steps), self._build)
+
+    @property
+    def count_query(self):
+        return self._cached(
+            (type(self), *self._steps, "count"),
+            lambda: select(func.count()).select_from(self.query.subquery()),
+        )
 
 
 class ReaderQuerySet(BaseQuerySet):
@@ -41,83 +179,252 @@ class ReaderQuerySet(BaseQuerySet):
         self._joined_ticket = False
 
     def list_choices(self):
-        self._stmt = (
+        return self._step("list_choices", lambda stmt: (
             select(
                 Reader.id,
                 Reader.first_name,
                 Reader.last_name,
             )
             .order_by(Reader.last_name, Reader.first_name)
-        )
-        return self
+        ))
 
     def with_ticket(self):
-        if not self._joined_ticket:
-            self._stmt = (
-                self._stmt
-                .outerjoin(ReaderTicket, ReaderTicket.reader_id == Reader.id)
-                .add_columns(
+        if self._joined_ticket:
+            return self
+        self._joined_ticket = True
+        return self._step("with_ticket", lambda stmt: (
+            stmt
+            .outerjoin(ReaderTicket, ReaderTicket.reader_id == Reader.id)
+            .add_columns(
+                ReaderTicket.code.label("ticket_code"),
+                ReaderTicket.is_active.label("ticket_active"),
+            )
+        ))
+
+    def with_active_loans_count(self):
+        # коррелированный подзапрос по индексу (reader_id, due_date) WHERE returned_at IS NULL:
+        # считаются выдачи только этого читателя, а не GROUP BY по всей таблице выдач
+        return self._step("with_active_loans_count", lambda stmt: stmt.add_columns(
+            select(func.count())
+            .where(BookLoan.reader_id == Reader.id, BookLoan.returned_at.is_(None))
+            .correlate(Reader)
+            .scalar_subquery()
+            .label("active_loans")
+        ))
+
+    def profile(self):
+        # профиль одним запросом: билет, история (число всех выдач) и текущие выдачи с названиями книг.
+        # Все агрегаты посчитаны для одного читателя — LATERAL и коррелированный подзапрос идут
+        # по индексам с reader_id в начале, время не зависит от размера таблицы выдач.
+        # Текущие выдачи собираются в JSON на стороне базы: одна строка вместо строки на выдачу
+        def build(stmt):
+            active = (
+                select(
+                    func.count().label("active_count"),
+                    func.count().filter(BookLoan.due_date < func.current_date()).label("overdue_count"),
+                    func.json_agg(
+                        aggregate_order_by(
+                            func.json_build_object(
+                                "id", BookLoan.id,
+                                "book_id", Book.id,
+                                "bookname", Book.bookname,
+                                "issued_at", BookLoan.issued_at,
+                                "due_date", BookLoan.due_date,
+                            ),
+                            BookLoan.due_date,
+                        ),
+                        type_=JSON,
+                    ).label("active_loans"),
+                )
+                .select_from(BookLoan)
+                .join(Book, Book.id == BookLoan.book_id)
+                .where(BookLoan.reader_id == Reader.id, BookLoan.returned_at.is_(None))
+                .lateral("active")
+            )
+            history = (
+                select(func.count())
+                .where(BookLoan.reader_id == Reader.id)
+                .correlate(Reader)
+                .scalar_subquery()
+            )
+            return (
+                select(
+                    Reader.id,
+                    Reader.first_name,
+                    Reader.last_name,
+                    Reader.email,
+                    Reader.phone,
+                    Reader.cover_url,
+                    Reader.registered_at,
                     ReaderTicket.code.label("ticket_code"),
                     ReaderTicket.is_active.label("ticket_active"),
+                    history.label("history_count"),
+                    active.c.active_count,
+                    active.c.overdue_count,
+                    active.c.active_loans,
                 )
+                .outerjoin(ReaderTicket, ReaderTicket.reader_id == Reader.id)
+                .outerjoin(active, true())
             )
-            self._joined_ticket = True
-        return self
 
-    def with_active_loans_count(self):
-        subq = (
+        return self._step("profile", build)
+
+
+class ReaderTicketQuerySet(BaseQuerySet):
+    def __init__(self):
+        super().__init__(ReaderTicket)
+
+    def as_rows(self):
+        return self._step("as_rows", lambda stmt: select(
+            ReaderTicket.id,
+            ReaderTicket.code,
+            ReaderTicket.reader_id,
+            ReaderTicket.issued_at,
+            ReaderTicket.is_active,
+        ))
+
+    def by_code(self, code: str):
+        # code уникален и проиндексирован
+        self.params["code"] = code
+        return self._step("by_code", lambda stmt: stmt.where(ReaderTicket.code == bindparam("code", type_=String)))
+
+
+class OverdueLoanQuerySet(BaseQuerySet):
+    def __init__(self):
+        super().__init__(OverdueLoan)
+
+    def open(self):
+        # открытые просрочки, найденные db/overdue.py; список идёт по индексу ix_overdueloan_open.
+        # Сканер закрывает записи не сразу (продления — только полным обходом), поэтому выдача
+        # перепроверяется по первичному ключу: вернули или продлили — в списке её уже нет
+        return self._step("open", lambda stmt: (
             select(
-                BookLoan.reader_id,
-                func.count(BookLoan.id).label("active_loans"),
+                OverdueLoan.id,
+                OverdueLoan.due_date,
+                OverdueLoan.detected_at,
+                OverdueLoan.reader_id,
+                (func.current_date() - OverdueLoan.due_date).label("days_overdue"),
+                Book.bookname.label("bookname"),
+                func.concat_ws(" ", Reader.first_name, Reader.last_name).label("reader_name"),
             )
-            .where(BookLoan.returned_at.is_(None))
-            .group_by(BookLoan.reader_id)
-            .subquery()
-        )
-
-        self._stmt = (
-            self._stmt
-            .outerjoin(subq, subq.c.reader_id == Reader.id)
-            .add_columns(
-                func.coalesce(subq.c.active_loans, 0).label("active_loans")
+            .join(Book, Book.id == OverdueLoan.book_id)
+            .join(Reader, Reader.id == OverdueLoan.reader_id)
+            .join(BookLoan, BookLoan.id == OverdueLoan.id)
+            .where(
+                OverdueLoan.resolved_at.is_(None),
+                BookLoan.returned_at.is_(None),
+                BookLoan.due_date < func.current_date(),
             )
-        )
-        return self
+        ))
+
+
+class LibrarianQuerySet(BaseQuerySet):
+    def __init__(self):
+        super().__init__(Librarian)
+
+    def list_choices(self):
+        return self._step("list_choices", lambda stmt: (
+            select(Librarian.id, Librarian.first_name, Librarian.last_name)
+            .order_by(Librarian.last_name)
+        ))
+
+
+class BookAuthorQuerySet(BaseQuerySet):
+    def __init__(self):
+        super().__init__(BookAuthor)
+
+    def list_choices(self):
+        return self._step("list_choices", lambda stmt: select(BookAuthor.id, BookAuthor.name).order_by(BookAuthor.name))
+
+
+def _search_rank():
+    return func.greatest(
+        func.word_similarity(bindparam("search_text", type_=String), Book.bookname),
+        func.word_similarity(bindparam("search_text", type_=String), BookAuthor.name),
+    )
 
 
 class BookQueryset(BaseQuerySet):
     def __init__(self):
         super().__init__(Book)
         self._joined_author = False
+        self._ranked = False
 
     def select_for_choices(self):
-        self._stmt = (
+        return self._step("select_for_choices", lambda stmt: (
             select(
                 Book.id,
                 Book.bookname,
                 BookAuthor.name,
             )
             .join(Book.author)
-        )
-        return self
+        ))
+
+    def as_rows(self):
+        # колонки вместо сущностей: строки идут в ответ как есть (result.mappings()), без ORM-объектов
+        self._joined_author = True
+        return self._step("as_rows", lambda stmt: (
+            select(
+                Book.id,
+                Book.bookname,
+                Book.review,
+                Book.amount,
+                Book.cover_url,
+                Book.author_id,
+                BookAuthor.name.label("author"),
+            )
+            .join(Book.author)
+        ))
 
     def with_author(self):
-        if not self._joined_author:
-            self._stmt = (
-                self._stmt
-                .join(Book.author)
-                .options(contains_eager(Book.author))
+        if self._joined_author:
+            return self
+        self._joined_author = True
+        return self._step("with_author", lambda stmt: (
+            stmt
+            .join(Book.author)
+            .options(contains_eager(Book.author))
+        ))
+
+    def search(self, text: str | None, engine: str = "trigram"):
+        if not text:
+            return self
+
+        self.with_author()
+        self.params["search_pattern"] = f'%{text}%'
+        if engine == "ilike":
+            def build(stmt):
+                pattern = bindparam("search_pattern", type_=String)
+                return stmt.where(or_(Book.bookname.ilike(pattern), BookAuthor.name.ilike(pattern)))
+
+            return self._step(("search", "ilike"), build)
+
+        # обе ветки обслуживаются GIN-индексами gin_trgm_ops: ILIKE — для точных подстрок,
+        # %> (word_similarity) — для опечаток. UNION вместо OR через join, иначе индексы не используются
+        self.params["search_text"] = text
+        self._ranked = True
+
+        def build(stmt):
+            pattern = bindparam("search_pattern", type_=String)
+            similar = bindparam("search_text", type_=String)
+            matched = union(
+                select(Book.id).where(or_(Book.bookname.ilike(pattern), Book.bookname.op('%>')(similar))),
+                select(Book.id).join(Book.author).where(
+                    or_(BookAuthor.name.ilike(pattern), BookAuthor.name.op('%>')(similar))
+                ),
             )
-            self._joined_author = True
-        return self
+            return stmt.where(Book.id.in_(matched))
 
-    def search(self, text: str | None):
-        if text:
-            self.with_author()
-            pattern = f'%{text}%'
-            self._stmt = self._stmt.where(or_(Book.bookname.ilike(pattern), BookAuthor.name.ilike(pattern)))
+        return self._step(("search", "trigram"), build)
 
-        return self
+    def order_by_rank(self):
+        if not self._ranked:
+            return self.order_by(None)
+        return self._step("order_by_rank", lambda stmt: stmt.order_by(_search_rank().desc(), Book.id))
+
+    @property
+    def seekable(self) -> bool:
+        return not self._ranked and super().seekable
 
 
 class BookLoanQueryset(BaseQuerySet):
@@ -125,10 +432,11 @@ class BookLoanQueryset(BaseQuerySet):
         super().__init__(BookLoan)
 
     def as_list(self):
-        self._stmt = (
+        return self._step("as_list", lambda stmt: (
             select(
                 BookLoan.id,
                 BookLoan.issued_at,
+                BookLoan.due_date,
                 BookLoan.returned_at,
                 Book.bookname.label("bookname"),
                 func.concat_ws(" ", Reader.first_name, Reader.last_name).label("reader_name"),
@@ -137,5 +445,170 @@ class BookLoanQueryset(BaseQuerySet):
             .join(Book)
             .join(Reader)
             .outerjoin(Librarian)
-        )
+        ))
+
+    def issued_between(self, date_from: date | None = None, date_to: date | None = None):
+        # границы включительно; сравнение с началом следующего дня оставляет условие индексируемым
+        if date_from:
+            self.params["issued_from"] = datetime.combine(date_from, datetime.min.time())
+            self._step("issued_from", lambda stmt: stmt.where(BookLoan.issued_at >= bindparam("issued_from")))
+        if date_to:
+            self.params["issued_before"] = datetime.combine(date_to, datetime.min.time()) + timedelta(days=1)
+            self._step("issued_before", lambda stmt: stmt.where(BookLoan.issued_at < bindparam("issued_before")))
+        return self
+
+    def for_reader(self, reader_id: int | None):
+        if reader_id:
+            self.params["reader_id"] = reader_id
+            self._step("for_reader", lambda stmt: stmt.where(BookLoan.reader_id == bindparam("reader_id")))
         return self
+
+    @staticmethod
+    def checkout_statement(*, book_id: int, reader_id: int, librarian_id: int | None, due_date: date,
+                           issued_at: datetime):
+        # WITH book AS (UPDATE book SET amount = amount - 1 WHERE id = :id AND amount > 0 RETURNING id)
+        # INSERT INTO bookloan (...) SELECT ... FROM book RETURNING *
+        # нет экземпляров — UPDATE не находит строку, и INSERT вставляет ноль строк
+        book = (
+            update(Book)
+            .where(Book.id == book_id, Book.amount > 0)
+            .values(amount=Book.amount - 1)
+            .returning(Book.id)
+            .cte("checkout_book")
+        )
+        stmt = (
+            insert(BookLoan)
+            .from_select(
+                ["book_id", "reader_id", "librarian_id", "due_date", "issued_at"],
+                select(
+                    book.c.id,
+                    literal(reader_id),
+                    literal(librarian_id, type_=BookLoan.librarian_id.type),
+                    literal(due_date, type_=BookLoan.due_date.type),
+                    literal(issued_at, type_=BookLoan.issued_at.type),
+                ),
+            )
+            .returning(BookLoan)
+            .add_cte(book)
+        )
+        return select(BookLoan).from_statement(stmt).execution_options(populate_existing=True)
+
+    @staticmethod
+    def update_statement(loan_id: int, *, due_date: date, returned_at: datetime | None,
+                         returned_day: datetime | None):
+        # current блокирует только строку выдачи: два одновременных возврата одной выдачи
+        # не должны оба вернуть экземпляр. Строка книги обновляется, лишь когда меняется статус
+        current = (
+            select(
+                BookLoan.id,
+                BookLoan.book_id,
+                (
+                    case((BookLoan.returned_at.is_(None), 1), else_=0) if returned_at is not None
+                    else case((BookLoan.returned_at.is_not(None), -1), else_=0)
+                ).label("delta"),
+            )
+            .where(BookLoan.id == loan_id)
+            .with_for_update()
+        )
+        if returned_day is not None:
+            # дата возврата строго позже дня выдачи
+            current = current.where(BookLoan.issued_at < returned_day)
+        current = current.cte("current_loan")
+
+        book = (
+            update(Book)
+            .where(Book.id == current.c.book_id, current.c.delta != 0)
+            .where(or_(current.c.delta > 0, Book.amount > 0))
+            .values(amount=Book.amount + current.c.delta)
+            .returning(Book.id)
+            .cte("returned_book")
+        )
+        stmt = (
+            update(BookLoan)
+            .where(BookLoan.id == current.c.id)
+            .where(or_(current.c.delta == 0, exists(select(book.c.id))))
+            .values(due_date=due_date, returned_at=returned_at)
+            .returning(BookLoan)
+            .add_cte(book)
+        )
+        return select(BookLoan).from_statement(stmt).execution_options(populate_existing=True)
+
+    @staticmethod
+    def checkout_many_statement(book_ids: list[int], *, reader_id: int, librarian_id: int | None, due_date: date,
+                                issued_at: datetime):
+        # списание набором: строки книг блокируются в порядке id — встречные пакеты не ловят взаимоблокировку;
+        # книги, уже выданные этому читателю, пропускаются, чтобы не списать экземпляр впустую
+        active = (
+            select(BookLoan.id)
+            .where(BookLoan.book_id == Book.id, BookLoan.reader_id == reader_id, BookLoan.returned_at.is_(None))
+        )
+        locked = (
+            select(Book.id)
+            .where(Book.id.in_(book_ids), Book.amount > 0, ~active.exists())
+            .order_by(Book.id)
+            .with_for_update()
+            .cte("locked_books")
+        )
+        taken = (
+            update(Book)
+            .where(Book.id.in_(select(locked.c.id)))
+            .values(amount=Book.amount - 1)
+            .returning(Book.id)
+            .cte("taken_books")
+        )
+        return (
+            insert(BookLoan)
+            .from_select(
+                ["book_id", "reader_id", "librarian_id", "due_date", "issued_at"],
+                select(
+                    taken.c.id,
+                    literal(reader_id),
+                    literal(librarian_id, type_=BookLoan.librarian_id.type),
+                    literal(due_date, type_=BookLoan.due_date.type),
+                    literal(issued_at, type_=BookLoan.issued_at.type),
+                ),
+            )
+            .returning(BookLoan.id, BookLoan.book_id)
+            .add_cte(locked, taken)
+        )
+
+    @staticmethod
+    def return_many_statement(loan_ids: list[int], *, returned_at: datetime, returned_day: datetime):
+        # закрываются только открытые выдачи с датой выдачи раньше дня возврата;
+        # экземпляры возвращаются одним UPDATE по книгам с количеством на книгу
+        current = (
+            select(BookLoan.id, BookLoan.book_id)
+            .where(BookLoan.id.in_(loan_ids), BookLoan.returned_at.is_(None), BookLoan.issued_at < returned_day)
+            .order_by(BookLoan.id)
+            .with_for_update()
+            .cte("current_loans")
+        )
+        per_book = (
+            select(current.c.book_id, func.count().label("copies"))
+            .group_by(current.c.book_id)
+            .cte("returned_copies")
+        )
+        locked = (
+            select(Book.id)
+            .where(Book.id.in_(select(per_book.c.book_id)))
+            .order_by(Book.id)
+            .with_for_update()
+            .cte("locked_books")
+        )
+        books = (
+            update(Book)
+            .where(Book.id == per_book.c.book_id, Book.id.in_(select(locked.c.id)))
+            .values(amount=Book.amount + per_book.c.copies)
+            .returning(Book.id)
+            .cte("returned_books")
+        )
+        return (
+            update(BookLoan)
+            .where(BookLoan.id == current.c.id)
+            .values(returned_at=returned_at)
+            .returning(BookLoan.id, BookLoan.book_id)
+            .add_cte(locked, books)
+            # UPDATE ... FROM current_loans нельзя вычислить по объектам сессии, а синхронизация "fetch"
+            # забирает RETURNING себе — вызывающий получал закрытый результат. Объекты выдач здесь не загружены
+            .execution_options(synchronize_session=False)
+        )
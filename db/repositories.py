@@ -1,80 +1,179 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config.db_config import DBSettings
 from .api import Database
+from .cache import versions, choice_cache
+from .counting import get_counter
 from .models import *
 from sqlalchemy import select, func
 from sqlalchemy.exc import IntegrityError
 from .querysets import *
-from schemas.pagination import Pagination
-from datetime import date, datetime, time
+from schemas.pagination import Pagination, decode_cursor
+from schemas.schemas import BatchItemResult, BatchResult, ReaderProfile
+from datetime import date, datetime, time, timedelta
 
 
 class BaseRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    async def _paginate(self, qs: BaseQuerySet, *, name, page, page_size, filters=(), tables=(), after=None,
+                        before=None, mappings=False):
+        total, exact = await get_counter().count(self.session, qs, name=name, filters=filters, tables=tables)
+
+        cursor = decode_cursor(after or before)
+        if cursor is not None and qs.seekable:
+            backwards = after is None
+            rows = await self._fetch(qs.seek(cursor, backwards=backwards).limit(page_size + 1), mappings)
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            if backwards:
+                rows.reverse()
+            pagination = Pagination(page=page, page_size=page_size, total=total, total_exact=exact, keyset=True,
+                                    more=bool(rows) and (has_more or backwards))
+            if pagination.more:
+                pagination.next_cursor = qs.cursor_for(rows[-1])
+            if rows and (has_more or not backwards):
+                pagination.prev_cursor = qs.cursor_for(rows[0])
+            return rows, pagination
+
+        pagination = Pagination(page=page, page_size=page_size, total=total, total_exact=exact)
+        rows = await self._fetch(qs.limit(page_size + 1).offset(pagination.offset), mappings)
+        # при оценочном total наличие следующей страницы определяем по лишней строке
+        pagination.more = len(rows) > page_size
+        rows = rows[:page_size]
+        # даже в offset-режиме отдаём курсоры, чтобы следующие переходы шли через keyset
+        if rows and qs.seekable:
+            if pagination.has_next:
+                pagination.next_cursor = qs.cursor_for(rows[-1])
+            if pagination.has_prev:
+                pagination.prev_cursor = qs.cursor_for(rows[0])
+        return rows, pagination
+
+    @asynccontextmanager
+    async def _atomic(self):
+        # session.begin() падает, если чтения в этом же запросе уже открыли транзакцию (autobegin),
+        # поэтому фиксируем/откатываем текущую транзакцию явно
+        try:
+            yield
+            await self.session.commit()
+        except BaseException:
+            await self.session.rollback()
+            raise
+
+    async def _fetch(self, qs: BaseQuerySet, mappings: bool) -> list:
+        result = await self.session.execute(qs.query, qs.params)
+        return list(result.mappings().all() if mappings else result.scalars().all())
+
+
+class ChoicesRepository(BaseRepository):
+    # общий код для списков выбора: полный список (через choice_cache), typeahead и проверка одного id
+    lookup_field: str | None = None
+
+    def _choices(self) -> BaseQuerySet:
+        raise NotImplementedError
+
+    @staticmethod
+    def _choice(row) -> tuple[int, str]:
+        return row[0], row[1]
+
+    async def _load_choices(self) -> list[tuple[int, str]]:
+        result = await self.session.execute(self._choices().query)
+        return [self._choice(row) for row in result.all()]
+
+    async def lookup(self, text: str | None, limit: int = 20) -> list[tuple[int, str]]:
+        qs = self._choices().prefix_search(self.lookup_field, text).limit(limit)
+        result = await self.session.execute(qs.query, qs.params)
+        return [self._choice(row) for row in result.all()]
 
-class ReaderRepository(BaseRepository):
+    async def get_choice(self, obj_id: int) -> tuple[int, str] | None:
+        qs = self._choices().filter_by_id(obj_id)
+        result = await self.session.execute(qs.query, qs.params)
+        row = result.first()
+        return self._choice(row) if row else None
+
+
+class ReaderRepository(ChoicesRepository):
+    lookup_field = "last_name"
 
     async def get_reader(self, reader_id: int):
-        stmt = (
+        qs = (
             ReaderQuerySet()
             .filter_by_id(reader_id)
             .with_ticket()
             .with_active_loans_count()
-            .query
         )
 
-        result = await self.session.execute(stmt)
+        result = await self.session.execute(qs.query, qs.params)
 
         row = result.mappings().first()
 
         return dict(row) if row else None
 
+    async def get_profile(self, reader_id: int) -> ReaderProfile | None:
+        qs = ReaderQuerySet().profile().filter_by_id(reader_id)
+        row = (await self.session.execute(qs.query, qs.params)).mappings().first()
+        return ReaderProfile.model_validate(dict(row)) if row else None
+
     async def list_choices(self) -> list[tuple[int, str]]:
-        result = await self.session.execute(ReaderQuerySet().list_choices().query)
-        return [
-            (id_, f"{first} {last}")
-            for id_, first, last in result.all()
-        ]
+        return await choice_cache.get_or_load("readers", (Reader,), self._load_choices)
+
+    def _choices(self) -> BaseQuerySet:
+        return ReaderQuerySet().list_choices()
+
+    @staticmethod
+    def _choice(row) -> tuple[int, str]:
+        id_, first, last = row
+        return id_, f"{first} {last}"
 
     async def create(self, data: dict) -> Reader:
         # сразу вызываем синглтон
         reader = Reader(**data)
         self.session.add(reader)
         await self.session.commit()
+        versions.bump(Reader)
         await self.session.refresh(reader)
         return reader
 
 
-class BookRepository(BaseRepository):
+class BookRepository(ChoicesRepository):
+    lookup_field = "bookname"
 
     async def exists(self, book_id: int) -> bool:
 
         return await self.session.get(Book, book_id) is not None
 
     async def list_choices(self):
+        return await choice_cache.get_or_load("books", (Book, BookAuthor), self._load_choices)
 
-        stmt = BookQueryset().select_for_choices().query
-        result = await self.session.execute(stmt)
-        return [
-            (id_, f"{book} — {author}")
-            for id_, book, author in result.all()
-        ]
+    def _choices(self) -> BaseQuerySet:
+        return BookQueryset().select_for_choices()
 
-    async def list(self, *, page=1, page_size=10, search=None, order=None):
+    @staticmethod
+    def _choice(row) -> tuple[int, str]:
+        id_, book, author = row
+        return id_, f"{book} — {author}"
 
-        qs = BookQueryset().with_author().search(search).order_by(order).query
-        total = await self.session.scalar(select(func.count()).select_from(qs.subquery()))
-        pagination = Pagination(page=page, page_size=page_size, total=total)
+    async def list(self, *, page=1, page_size=10, search=None, order=None, after=None, before=None,
+                   search_engine="trigram", mappings=False):
 
-        result = await self.session.execute(
-            qs.limit(page_size).offset(pagination.offset)
-        )
-        books = result.scalars().all()
+        qs = BookQueryset().as_rows() if mappings else BookQueryset().with_author()
+        qs = qs.search(search, engine=search_engine)
+        qs = qs.order_by_rank() if search and not order else qs.order_by(order)
+        # движок поиска — часть фильтра только при поиске: без него это весь каталог, и EstimatedCounter
+        # берёт дешёвую оценку из pg_class вместо EXPLAIN
+        filters = (search, search_engine if search else None)
+        return await self._paginate(qs, name="books", page=page, page_size=page_size, filters=filters,
+                                    tables=(Book, BookAuthor), after=after, before=before, mappings=mappings)
 
-        return books, pagination
+    async def get_row(self, book_id: int):
+        qs = BookQueryset().as_rows().filter_by_id(book_id)
+        return (await self.session.execute(qs.query, qs.params)).mappings().first()
 
     async def create(self, data: dict) -> Book:
 
@@ -87,6 +186,7 @@ class BookRepository(BaseRepository):
         self.session.add(book)
         try:
             await self.session.commit()
+            versions.bump(Book)
             await self.session.refresh(book)
 
         except IntegrityError as e:
@@ -95,15 +195,19 @@ class BookRepository(BaseRepository):
         return book
 
 
-class LibrarianRepository(BaseRepository):
+class LibrarianRepository(ChoicesRepository):
+    lookup_field = "last_name"
 
     async def list_choices(self):
-        result = await self.session.execute(
-            select(Librarian.id, Librarian.first_name, Librarian.last_name).order_by(Librarian.last_name))
-        return [
-            (id_, f"{first_name}  {last_name}")
-            for id_, first_name, last_name in result.all()
-        ]
+        return await choice_cache.get_or_load("librarians", (Librarian,), self._load_choices)
+
+    def _choices(self) -> BaseQuerySet:
+        return LibrarianQuerySet().list_choices()
+
+    @staticmethod
+    def _choice(row) -> tuple[int, str]:
+        id_, first_name, last_name = row
+        return id_, f"{first_name}  {last_name}"
 
 
 class BookLoanRepository(BaseRepository):
@@ -112,75 +216,193 @@ class BookLoanRepository(BaseRepository):
 
         return await self.session.get(BookLoan, loan_id)
 
+    async def get_row(self, loan_id: int):
+        qs = BookLoanQueryset().as_list().filter_by_id(loan_id)
+        return (await self.session.execute(qs.query, qs.params)).mappings().first()
+
     async def update(self, loan_id: int, data: dict) -> BookLoan | None:
+        # один оператор: блокируется только строка выдачи, остаток книги меняется условным UPDATE
+        # и лишь при смене статуса возврата. Ноль строк — значит, не прошла одна из проверок
+        new_returned = data.get('returned_at', None)
+        returned_at = datetime.combine(new_returned, time(23, 59, 59)) if new_returned else None
+        stmt = BookLoanQueryset.update_statement(
+            loan_id,
+            due_date=data["due_date"],
+            returned_at=returned_at,
+            returned_day=datetime.combine(new_returned, time.min) if new_returned else None,
+        )
+        async with self._atomic():
+            loan = (await self.session.scalars(stmt)).first()
+            if loan is None:
+                raise ValueError(await self._update_error(loan_id, new_returned))
+        versions.bump(BookLoan)
+        return loan
 
-        async with self.session.begin():
-            loan = await self.session.get(BookLoan, loan_id, with_for_update=True)
-            if not loan:
-                raise ValueError("Выдача не найдена")
-            old_returned = loan.returned_at
-            new_returned = data.get('returned_at', None)
-            if new_returned and new_returned <= loan.issued_at.date():
-                raise ValueError("Дата возврата должна быть позже даты выдачи")
-            loan.due_date = data["due_date"]
-            loan.returned_at = (
-                datetime.combine(new_returned, time(23, 59, 59))
-                if new_returned
-                else None
-            )
-            book = await self.session.get(Book, loan.book_id, with_for_update=True)
-
-            if old_returned is None and new_returned is not None:
-                book.amount += 1
-
-            elif old_returned is not None and new_returned is None:
-                if book.amount < 1:
-                    raise ValueError(
-                        "Невозможно отменить возврат — нет доступных экземпляров"
-                    )
-                book.amount -= 1
-        await self.session.refresh(loan)
+    async def _update_error(self, loan_id: int, new_returned: date | None) -> str:
+        # только на пути ошибки: восстанавливаем, какая из проверок оператора не прошла
+        loan = await self.session.get(BookLoan, loan_id)
+        if not loan:
+            return "Выдача не найдена"
+        if new_returned and new_returned <= loan.issued_at.date():
+            return "Дата возврата должна быть позже даты выдачи"
+        return "Невозможно отменить возврат — нет доступных экземпляров"
+
+    async def list(self, *, page=1, page_size=10, order=None, after=None, before=None):
+
+        qs = BookLoanQueryset().as_list().order_by(order)
+        return await self._paginate(qs, name="bookloans", page=page, page_size=page_size,
+                                    tables=(BookLoan,), after=after, before=before,
+                                    mappings=True)
+
+    async def stream(self, *, date_from: date | None = None, date_to: date | None = None,
+                     reader_id: int | None = None, chunk_size: int = 1000) -> AsyncIterator[list]:
+        # серверный курсор: в памяти не больше chunk_size строк, сколько бы их ни было в таблице
+        qs = BookLoanQueryset().as_list().issued_between(date_from, date_to).for_reader(reader_id).order_by(None)
+        result = await self.session.stream(qs.query, qs.params, execution_options={"yield_per": chunk_size})
+        async for rows in result.mappings().partitions():
+            yield rows
+
+    async def create(self, data: dict) -> BookLoan:
+        # списание экземпляра и вставка выдачи — один оператор и один круг до БД;
+        # при нарушении unique_active_bookloan откатывается и списание
+        stmt = BookLoanQueryset.checkout_statement(
+            book_id=data["book_id"],
+            reader_id=data["reader_id"],
+            librarian_id=data.get("librarian_id"),
+            due_date=data["due_date"],
+            issued_at=datetime.utcnow(),
+        )
+        try:
+            async with self._atomic():
+                loan = (await self.session.scalars(stmt)).first()
+                if loan is None:
+                    raise ValueError(await self._checkout_error(data["book_id"]))
+        except IntegrityError:
+            raise ValueError("Эта книга уже выдана данному читателю и ещё не возвращена")
+        versions.bump(BookLoan)
         return loan
 
-    async def list(self, *, page=1, page_size=10, order=None):
+    async def _checkout_error(self, book_id: int) -> str:
+        if not await self.session.get(Book, book_id):
+            return "Такой книги не существует"
+        return "такая книга недоступна для выдачи"
+
+    async def create_many(self, data: dict) -> BatchResult:
+        # пакетная выдача одному читателю: списание и вставка — один оператор на весь пакет
+        book_ids = list(dict.fromkeys(data["book_ids"]))
+        mode = data.get("mode", "atomic")
+        if mode == "atomic" and len(book_ids) < len(data["book_ids"]):
+            raise ValueError("Книга указана в пакете несколько раз")
+        stmt = BookLoanQueryset.checkout_many_statement(
+            book_ids,
+            reader_id=data["reader_id"],
+            librarian_id=data.get("librarian_id"),
+            due_date=data["due_date"],
+            issued_at=datetime.utcnow(),
+        )
+
+        async def run() -> tuple[dict[int, int], dict[int, str]]:
+            issued = {book_id: loan_id for loan_id, book_id in (await self.session.execute(stmt)).all()}
+            errors = await self._checkout_errors([book_id for book_id in book_ids if book_id not in issued],
+                                                 data["reader_id"])
+            return issued, errors
 
-        qs = BookLoanQueryset().as_list().order_by(order).query
+        try:
+            issued, errors = await self._run_batch(run, mode)
+        except IntegrityError:
+            raise ValueError("Эта книга уже выдана данному читателю и ещё не возвращена")
 
-        total = await self.session.scalar(select(func.count()).select_from(qs.subquery()))
-        pagination = Pagination(page=page, page_size=page_size, total=total)
-        result = await self.session.execute(
-            qs.limit(page_size).offset(pagination.offset)
+        seen = set()
+        items = []
+        for book_id in data["book_ids"]:
+            if book_id in seen:
+                items.append(BatchItemResult(id=book_id, error="Книга указана в пакете несколько раз"))
+                continue
+            seen.add(book_id)
+            items.append(BatchItemResult(id=book_id, loan_id=issued.get(book_id), error=errors.get(book_id)))
+        return self._batch_result(items, issued)
+
+    async def _checkout_errors(self, book_ids: list[int], reader_id: int) -> dict[int, str]:
+        if not book_ids:
+            return {}
+        active = (
+            select(BookLoan.id)
+            .where(BookLoan.book_id == Book.id, BookLoan.reader_id == reader_id, BookLoan.returned_at.is_(None))
+        )
+        rows = (await self.session.execute(select(Book.id, active.exists()).where(Book.id.in_(book_ids)))).all()
+        found = dict(rows)
+        errors = {}
+        for book_id in book_ids:
+            if book_id not in found:
+                errors[book_id] = "Такой книги не существует"
+            elif found[book_id]:
+                errors[book_id] = "Эта книга уже выдана данному читателю и ещё не возвращена"
+            else:
+                errors[book_id] = "такая книга недоступна для выдачи"
+        return errors
+
+    async def return_many(self, data: dict) -> BatchResult:
+        loan_ids = list(dict.fromkeys(data["loan_ids"]))
+        returned_on: date = data["returned_at"]
+        stmt = BookLoanQueryset.return_many_statement(
+            loan_ids,
+            returned_at=datetime.combine(returned_on, time(23, 59, 59)),
+            returned_day=datetime.combine(returned_on, time.min),
         )
-        rows = result.mappings().all()
-        return rows, pagination
 
-    async def create(self, data: dict) -> BookLoan:
+        async def run() -> tuple[set[int], dict[int, str]]:
+            returned = {loan_id for loan_id, _ in (await self.session.execute(stmt)).all()}
+            errors = await self._return_errors([loan_id for loan_id in loan_ids if loan_id not in returned])
+            return returned, errors
 
+        returned, errors = await self._run_batch(run, data.get("mode", "atomic"))
+        items = [
+            BatchItemResult(id=loan_id, loan_id=loan_id if loan_id in returned else None, error=errors.get(loan_id))
+            for loan_id in loan_ids
+        ]
+        return self._batch_result(items, returned)
+
+    async def _return_errors(self, loan_ids: list[int]) -> dict[int, str]:
+        if not loan_ids:
+            return {}
+        found = {loan.id: loan for loan in await self.session.scalars(select(BookLoan).where(BookLoan.id.in_(loan_ids)))}
+        errors = {}
+        for loan_id in loan_ids:
+            if loan_id not in found:
+                errors[loan_id] = "Выдача не найдена"
+            elif found[loan_id].returned_at is not None:
+                errors[loan_id] = "Книга по этой выдаче уже возвращена"
+            else:
+                errors[loan_id] = "Дата возврата должна быть позже даты выдачи"
+        return errors
+
+    async def _run_batch(self, run, mode: str):
+        # atomic: любая ошибка откатывает весь пакет; partial: фиксируем то, что прошло
         try:
-            async with self.session.begin():
-                book = await self.session.get(Book, data['book_id'])
-                if not book:
-                    raise ValueError("Такой книги не существует")
-                if book.amount < 1:
-                    raise ValueError("такая книга недоступна для выдачи")
-                book.amount -= 1
-
-                loan = BookLoan(
-                    book_id=data["book_id"],
-                    reader_id=data["reader_id"],
-                    librarian_id=data.get("librarian_id"),
-                    due_date=data["due_date"],
-                    issued_at=datetime.utcnow(),
-                )
-                self.session.add(loan)
-            await self.session.refresh(loan)
-            return loan
+            done, errors = await run()
+            if errors and mode == "atomic":
+                await self.session.rollback()
+                return type(done)(), errors
+            await self.session.commit()
+        except BaseException:
+            await self.session.rollback()
+            raise
+        if done:
+            versions.bump(BookLoan)
+        return done, errors
 
-        except IntegrityError as E:
-            raise ValueError("Эта книга уже выдана данному читателю и ещё не возвращена")
+    @staticmethod
+    def _batch_result(items: list[BatchItemResult], done) -> BatchResult:
+        ok = all(item.error is None for item in items)
+        if not done:
+            for item in items:
+                if item.error is None:
+                    item.error = "Пакет отменён из-за ошибок в других позициях"
+        return BatchResult(ok=ok, items=items)
 
 
-class BookAuthorRepository(BaseRepository):
+class BookAuthorRepository(ChoicesRepository):
+    lookup_field = "name"
 
     # async def list_all(self) -> list[BookAuthor]:
     #     async with db.session() as session:
@@ -189,13 +411,17 @@ class BookAuthorRepository(BaseRepository):
     #         return authors
 
     async def list_choices(self) -> list[tuple[int, str]]:
-        result = await self.session.execute(
-            select(BookAuthor.id, BookAuthor.name).order_by(BookAuthor.name)
-        )
-        return result.all()
+        return await choice_cache.get_or_load("authors", (BookAuthor,), self._load_choices)
+
+    def _choices(self) -> BaseQuerySet:
+        return BookAuthorQuerySet().list_choices()
 
 
 class ReaderTicketRepository(BaseRepository):
+    async def get_by_code(self, code: str):
+        qs = ReaderTicketQuerySet().as_rows().by_code(code)
+        return (await self.session.execute(qs.query, qs.params)).mappings().first()
+
     async def create(self, reader_id: int | None):
 
         if not reader_id:
@@ -204,9 +430,74 @@ class ReaderTicketRepository(BaseRepository):
         self.session.add(ticket)
         try:
             await self.session.commit()
+            versions.bump(ReaderTicket)
             await self.session.refresh(ticket)
         except IntegrityError as E:
             await self.session.rollback()
             raise ValueError("Возможно , у читателя уже есть билет")
 
         return ticket
+
+
+class OverdueLoanRepository(BaseRepository):
+    async def list(self, *, page=1, page_size=10, after=None, before=None):
+        # самые давние просрочки первыми
+        qs = OverdueLoanQuerySet().open().order_by("due_date")
+        # filters не пустой: оценочный счётчик берёт EXPLAIN с условием resolved_at IS NULL, а не reltuples таблицы
+        return await self._paginate(qs, name="overdue", page=page, page_size=page_size, filters=("open",),
+                                    tables=(OverdueLoan,), after=after, before=before, mappings=True)
+
+
+class StatsRepository(BaseRepository):
+    # только сводные таблицы db/stats.py; имена книг и читателей — по первичному ключу для верхних строк
+    async def dashboard(self, *, top: int = 10, days: int = 30) -> dict:
+        summary = (await self.session.execute(
+            select(
+                CirculationStats.refreshed_at,
+                CirculationStats.active_loans,
+                CirculationStats.overdue_loans,
+                CirculationStats.overdue_readers,
+            )
+        )).mappings().first()
+        books = (await self.session.execute(
+            select(
+                Book.id,
+                Book.bookname,
+                BookAuthor.name.label("author"),
+                BookStats.loans_total,
+                BookStats.loans_active,
+                BookStats.last_issued_at,
+            )
+            .join(Book, Book.id == BookStats.book_id)
+            .join(Book.author)
+            .order_by(BookStats.loans_total.desc(), BookStats.book_id)
+            .limit(top)
+        )).mappings().all()
+        readers = (await self.session.execute(
+            select(
+                Reader.id,
+                func.concat_ws(" ", Reader.first_name, Reader.last_name).label("name"),
+                ReaderStats.loans_total,
+                ReaderStats.loans_active,
+                ReaderStats.last_issued_at,
+            )
+            .join(Reader, Reader.id == ReaderStats.reader_id)
+            .order_by(ReaderStats.loans_total.desc(), ReaderStats.reader_id)
+            .limit(top)
+        )).mappings().all()
+
+        first_day = date.today() - timedelta(days=days - 1)
+        checkouts = dict((await self.session.execute(
+            select(DailyCheckouts.day, DailyCheckouts.checkouts).where(DailyCheckouts.day >= first_day)
+        )).all())
+        # дни без выдач в таблице отсутствуют, а на графике нужны нулём
+        daily = [
+            {"day": day, "checkouts": checkouts.get(day, 0)}
+            for day in (first_day + timedelta(days=offset) for offset in range(days))
+        ]
+        return {
+            "summary": dict(summary) if summary else None,
+            "books": list(books),
+            "readers": list(readers),
+            "daily": daily,
+        }
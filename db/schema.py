@@ -0,0 +1,33 @@
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.schema import CreateIndex
+
+from config.db_config import DBSettings
+from .models import Base
+
+EXTENSIONS = ("pg_trgm",)
+
+
+async def ensure_schema(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        for extension in EXTENSIONS:
+            await conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
+        await conn.run_sync(Base.metadata.create_all)
+        # create_all не создаёт индексы у уже существующих таблиц (например, созданных миграциями Django)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def main() -> None:
+    engine = create_async_engine(DBSettings().url)
+    try:
+        await ensure_schema(engine)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,248 @@
+# Синтетические данные в объёме продакшена для бенчмарков: схема из db/models.py, загрузка через COPY.
+# Один и тот же --seed даёт одни и те же строки, поэтому прогоны на разных коммитах сравнимы.
+#   python -m db.seed --truncate                       # 50k авторов, 1M книг, 500k читателей, 20M выдач
+#   python -m db.seed --truncate --scale 0.01          # то же в масштабе 1:100
+#   python -m db.seed --truncate --until $(date +%F)   # история, заканчивающаяся сегодня
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config.db_config import DBSettings
+from .models import BookAuthor, Book, Reader, Librarian, ReaderTicket, BookLoan, CirculationStats, OverdueScanState
+from .schema import ensure_schema
+
+# конец истории по умолчанию — фиксированная дата, а не сегодня: иначе данные менялись бы каждый день.
+# Относительно сегодняшней даты все невозвращённые выдачи с таким концом истории просрочены
+DEFAULT_UNTIL = date(2025, 1, 1)
+
+FIRST_NAMES = [
+    "Александр", "Мария", "Дмитрий", "Анна", "Сергей", "Елена", "Андрей", "Ольга", "Михаил", "Наталья",
+    "Иван", "Татьяна", "Алексей", "Ирина", "Николай", "Екатерина", "Павел", "Светлана", "Олег", "Юлия",
+]
+LAST_NAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков",
+    "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов",
+    "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв",
+]
+TITLE_WORDS = [
+    "война", "мир", "тихий", "дон", "мастер", "маргарита", "идиот", "бесы", "отцы", "дети", "мёртвые",
+    "души", "преступление", "наказание", "герой", "нашего", "времени", "горе", "от", "ума", "белая",
+    "гвардия", "собачье", "сердце", "капитанская", "дочка", "записки", "охотника", "вишнёвый", "сад",
+    "shadow", "river", "winter", "garden", "silent", "empire", "stone", "night", "ocean", "crown",
+]
+COVER_URL = "https://example.com/covers/{}.jpg"
+
+
+@dataclass
+class SeedConfig:
+    authors: int = 50_000
+    books: int = 1_000_000
+    readers: int = 500_000
+    librarians: int = 50
+    loans: int = 20_000_000
+    # доля читателей с читательским билетом
+    ticket_share: float = 0.6
+    # доля невозвращённых выдач; все они выданы за последние active_days дней
+    active_share: float = 0.02
+    active_days: int = 120
+    # период истории выдач
+    history_days: int = 5 * 365
+    # показатели Zipf: популярные книги и активные читатели набирают основную часть выдач
+    book_skew: float = 0.9
+    reader_skew: float = 0.8
+    seed: int = 42
+
+    def scaled(self, scale: float) -> "SeedConfig":
+        counts = ("authors", "books", "readers", "loans")
+        values = {f.name: getattr(self, f.name) for f in fields(self)}
+        values.update({name: max(1, int(values[name] * scale)) for name in counts})
+        return SeedConfig(**values)
+
+
+class SkewedSampler:
+    # Zipf по рангу; ранги перемешаны, чтобы популярные id не были просто первыми по порядку
+    def __init__(self, ids: range, skew: float, rng: random.Random):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(self.ids) + 1)))
+        self.rng = rng
+
+    def sample(self, k: int) -> list[int]:
+        return self.rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+
+class Seeder:
+    def __init__(self, config: SeedConfig, *, until: date = DEFAULT_UNTIL, batch_size: int = 100_000):
+        self.config = config
+        self.batch_size = batch_size
+        # все даты отсчитываются от полуночи until: тот же seed и тот же until дают те же строки
+        self.now = datetime.combine(until, datetime.min.time(), timezone.utc)
+
+    def _rng(self, table: str) -> random.Random:
+        # свой генератор на таблицу: изменение размера одной таблицы не сдвигает данные в других
+        return random.Random(f"{self.config.seed}:{table}")
+
+    def authors(self) -> Iterator[tuple]:
+        rng = self._rng("authors")
+        for i in range(1, self.config.authors + 1):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+            yield i, name, None, None
+
+    def books(self) -> Iterator[tuple]:
+        rng = self._rng("books")
+        # у плодовитых авторов книг больше
+        authors = SkewedSampler(range(1, self.config.authors + 1), 0.7, rng)
+        for start in range(1, self.config.books + 1, self.batch_size):
+            stop = min(start + self.batch_size, self.config.books + 1)
+            for i, author_id in zip(range(start, stop), authors.sample(stop - start)):
+                title = " ".join(rng.choices(TITLE_WORDS, k=rng.randint(1, 4))).capitalize()
+                review = f"Рецензия на «{title}»" if rng.random() < 0.2 else None
+                amount = 0 if rng.random() < 0.05 else rng.randint(1, 10)
+                yield i, author_id, f"{title} {i}", review, amount, COVER_URL.format(i)
+
+    def readers(self) -> Iterator[tuple]:
+        rng = self._rng("readers")
+        days = self.config.history_days
+        for i in range(1, self.config.readers + 1):
+            phone = f"+79{rng.randrange(10 ** 9):09d}" if rng.random() < 0.7 else None
+            # читатели регистрируются равномерно по истории, id растёт вместе с датой
+            registered_at = self.now - timedelta(days=days * (1 - i / self.config.readers) + rng.random())
+            yield (i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"reader{i}@example.com", phone, None,
+                   registered_at)
+
+    def librarians(self) -> Iterator[tuple]:
+        rng = self._rng("librarians")
+        for i in range(1, self.config.librarians + 1):
+            hired_at = self.now - timedelta(days=rng.randint(30, 3650))
+            yield i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), None, hired_at
+
+    def tickets(self) -> Iterator[tuple]:
+        rng = self._rng("tickets")
+        ticket_id = 0
+        for reader_id in range(1, self.config.readers + 1):
+            if rng.random() < self.config.ticket_share:
+                ticket_id += 1
+                issued_at = self.now - timedelta(days=rng.randint(0, self.config.history_days))
+                yield ticket_id, reader_id, f"T{reader_id:011X}", issued_at, rng.random() > 0.05
+
+    def loans(self) -> Iterator[tuple]:
+        config = self.config
+        rng = self._rng("loans")
+        books = SkewedSampler(range(1, config.books + 1), config.book_skew, rng)
+        readers = SkewedSampler(range(1, config.readers + 1), config.reader_skew, rng)
+
+        # выдачи идут по времени, как в живой таблице: id растёт вместе с issued_at.
+        # Невозвращённые — только среди последних active_days, с такой вероятностью, чтобы набрать active_share
+        history = timedelta(days=config.history_days)
+        start = self.now - history
+        active_from = self.now - timedelta(days=config.active_days)
+        active_probability = min(1.0, config.active_share * config.history_days / config.active_days)
+        active_pairs: set[tuple[int, int]] = set()
+        step = history / config.loans
+
+        for first in range(1, config.loans + 1, self.batch_size):
+            count = min(self.batch_size, config.loans + 1 - first)
+            for offset, book_id, reader_id in zip(range(count), books.sample(count), readers.sample(count)):
+                loan_id = first + offset
+                issued_at = start + step * loan_id
+                librarian_id = rng.randint(1, config.librarians) if rng.random() < 0.95 else None
+                due_date = (issued_at + timedelta(days=rng.choice((14, 21, 30)))).date()
+
+                returned_at = None
+                active = issued_at >= active_from and rng.random() < active_probability
+                # unique_active_bookloan: одна открытая выдача книги на читателя
+                if active and (book_id, reader_id) not in active_pairs:
+                    active_pairs.add((book_id, reader_id))
+                else:
+                    returned_at = min(issued_at + timedelta(days=rng.randint(1, 45), hours=rng.randint(0, 12)),
+                                      self.now)
+                yield loan_id, reader_id, book_id, librarian_id, issued_at, due_date, returned_at
+
+    def tables(self) -> list[tuple[type, tuple[str, ...], Iterator[tuple]]]:
+        return [
+            (BookAuthor, ("id", "name", "bio", "image_url"), self.authors()),
+            (Book, ("id", "author_id", "bookname", "review", "amount", "cover_url"), self.books()),
+            (Reader, ("id", "first_name", "last_name", "email", "phone", "cover_url", "registered_at"),
+             self.readers()),
+            (Librarian, ("id", "first_name", "last_name", "cover_url", "hired_at"), self.librarians()),
+            (ReaderTicket, ("id", "reader_id", "code", "issued_at", "is_active"), self.tickets()),
+            (BookLoan, ("id", "reader_id", "book_id", "librarian_id", "issued_at", "due_date", "returned_at"),
+             self.loans()),
+        ]
+
+    async def run(self, engine: AsyncEngine, *, truncate: bool = False) -> None:
+        await ensure_schema(engine)
+        models = [model for model, _, _ in self.tables()]
+        names = ", ".join(model.__tablename__ for model in models)
+        # вторичные индексы (триграммы, префиксы) дешевле построить один раз после загрузки
+        secondary = [index for model in models for index in model.__table__.indexes if not index.unique]
+
+        async with engine.connect() as conn:
+            if truncate:
+                await conn.execute(text(f"TRUNCATE {names} RESTART IDENTITY CASCADE"))
+            else:
+                for model in models:
+                    if await conn.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {model.__tablename__})")):
+                        raise SystemExit(f"{model.__tablename__} не пуста: запустите с --truncate")
+            for index in secondary:
+                await conn.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+            await conn.commit()
+
+            raw = await conn.get_raw_connection()
+            for model, columns, records in self.tables():
+                started = time.perf_counter()
+                await raw.driver_connection.copy_records_to_table(
+                    model.__tablename__, records=records, columns=columns,
+                )
+                rows = await conn.scalar(text(f"SELECT count(*) FROM {model.__tablename__}"))
+                elapsed = time.perf_counter() - started
+                print(f"{model.__tablename__:<28}{rows:>12,} rows {elapsed:8.1f}s {rows / elapsed:>10,.0f} rows/s")
+                # id заданы явно, поэтому последовательности нужно догнать
+                await conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                    f"GREATEST((SELECT max(id) FROM {model.__tablename__}), 1))"
+                ))
+            # выдачи загружены задним числом: сбрасываем отметки, чтобы db/stats.py пересчитал всё,
+            # а db/overdue.py прошёл просрочки с начала
+            for model in (CirculationStats, OverdueScanState):
+                await conn.execute(text(f"DELETE FROM {model.__tablename__}"))
+            await conn.commit()
+
+        started = time.perf_counter()
+        await ensure_schema(engine)
+        print(f"{'indexes':<28}{len(secondary):>12} built {time.perf_counter() - started:8.1f}s")
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"ANALYZE {names}"))
+
+
+async def main() -> None:
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser()
+    for f in fields(SeedConfig):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(getattr(defaults, f.name)),
+                            default=getattr(defaults, f.name))
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель для authors/books/readers/loans")
+    parser.add_argument("--until", type=date.fromisoformat, default=DEFAULT_UNTIL,
+                        help=f"дата, которой заканчивается история (по умолчанию {DEFAULT_UNTIL})")
+    parser.add_argument("--truncate", action="store_true", help="очистить таблицы перед загрузкой")
+    args = parser.parse_args()
+
+    config = SeedConfig(**{f.name: getattr(args, f.name) for f in fields(SeedConfig)}).scaled(args.scale)
+    engine = create_async_engine(DBSettings().url)
+    try:
+        await Seeder(config, until=args.until).run(engine, truncate=args.truncate)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
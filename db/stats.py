@@ -0,0 +1,200 @@
+# Статистика выдач для дашборда: популярность книг, активность читателей, выдачи по дням и срез по текущим
+# и просроченным выдачам. Агрегаты по всей library_app_bookloan на каждый запрос слишком дороги, поэтому они
+# хранятся в сводных таблицах (BookStats, ReaderStats, DailyCheckouts, CirculationStats), а дашборд читает только их.
+#
+# Пересчёт дельтами: раз в interval берутся выдачи, у которых issued_at или returned_at не раньше отметки
+# (watermark) минус lookback, и для затронутых книг, читателей и дней агрегаты пересчитываются целиком по индексам
+# с book_id/reader_id/issued_at в начале. Upsert идемпотентен, поэтому перекрытие окон безопасно, а lookback
+# покрывает транзакции, зафиксированные позже своего issued_at, и возвраты, оформленные задним числом.
+# Изменения, которые в окно не попадают (возврат датой старше lookback, отмена возврата), исправляет полный
+# пересчёт раз в full_every. Пересчёт по ключам, а не приращения в BookLoanRepository: выдачи и возвраты идут
+# и пакетами, и через import/seed, и пропущенное приращение не исправилось бы никогда.
+# Срез по текущим выдачам зависит от сегодняшней даты, а не только от записей, поэтому считается на каждом
+# проходе заново — по частичным индексам WHERE returned_at IS NULL, то есть только по книгам на руках.
+# Воркеров несколько, пересчитывает один: остальные не получают pg_try_advisory_xact_lock и пропускают проход.
+#   python -m db.stats --full     # пересчитать всё вручную
+import argparse
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from sqlalchemy import Date, DateTime, bindparam, cast, delete, distinct, exists, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .api import Database
+from .models import BookLoan, BookStats, CirculationStats, DailyCheckouts, ReaderStats
+
+logger = logging.getLogger("db.stats")
+
+# ключ pg_try_advisory_xact_lock; снимается вместе с транзакцией пересчёта
+LOCK_KEY = 7_240_001
+STATE_ID = 1
+
+
+def _loan_totals(key):
+    return (
+        select(
+            key,
+            func.count().label("loans_total"),
+            func.count().filter(BookLoan.returned_at.is_(None)).label("loans_active"),
+            func.max(BookLoan.issued_at).label("last_issued_at"),
+        )
+        .group_by(key)
+    )
+
+
+def _daily_checkouts():
+    day = cast(BookLoan.issued_at, Date)
+    return select(day.label("day"), func.count().label("checkouts")).group_by(day)
+
+
+def _upsert(model, key: str, rows):
+    # rows — select, чьи подписи колонок совпадают с полями сводной таблицы
+    columns = [column.name for column in rows.selected_columns]
+    stmt = insert(model).from_select(columns, rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: stmt.excluded[column] for column in columns if column != key},
+    )
+
+
+class StatsRefresher:
+    def __init__(self, database: Database, *, interval: float = 60, lookback: timedelta = timedelta(days=2),
+                 full_every: timedelta = timedelta(hours=24)):
+        self.database = database
+        self.interval = interval
+        self.lookback = lookback
+        self.full_every = full_every
+        self.runs = 0
+        self.full_runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def refresh(self, session: AsyncSession, *, full: bool = False) -> str | None:
+        # "full" или "delta"; None — пересчёт сейчас идёт в другом процессе
+        if not await session.scalar(select(func.pg_try_advisory_xact_lock(LOCK_KEY))):
+            await session.rollback()
+            return None
+
+        # время базы, а не воркера: отметка сравнивается с issued_at/returned_at в той же базе
+        now = await session.scalar(select(func.now()))
+        state = await session.get(CirculationStats, STATE_ID)
+        if state is None:
+            state = CirculationStats(id=STATE_ID)
+            session.add(state)
+        full = (
+            full or state.watermark is None or state.full_refreshed_at is None
+            or now - state.full_refreshed_at >= self.full_every
+        )
+        if full:
+            await self._refresh_all(session)
+            state.full_refreshed_at = now
+        else:
+            await self._refresh_since(session, state.watermark - self.lookback)
+        await self._snapshot(session, state)
+        state.watermark = state.refreshed_at = now
+        await session.commit()
+        return "full" if full else "delta"
+
+    async def _refresh_since(self, session: AsyncSession, since) -> None:
+        changed = or_(BookLoan.issued_at >= since, BookLoan.returned_at >= since)
+        for model, key in ((BookStats, BookLoan.book_id), (ReaderStats, BookLoan.reader_id)):
+            touched = select(key).where(changed)
+            await session.execute(_upsert(model, key.key, _loan_totals(key).where(key.in_(touched))))
+        # возврат не меняет выдачи по дням: пересчитываем только дни, в которые выдавали после отметки
+        day_start = func.date_trunc("day", bindparam("since", since, type_=DateTime(timezone=True)))
+        await session.execute(_upsert(DailyCheckouts, "day", _daily_checkouts().where(BookLoan.issued_at >= day_start)))
+
+    async def _refresh_all(self, session: AsyncSession) -> None:
+        for model, key, stats_key in (
+            (BookStats, BookLoan.book_id, BookStats.book_id),
+            (ReaderStats, BookLoan.reader_id, ReaderStats.reader_id),
+        ):
+            await session.execute(_upsert(model, key.key, _loan_totals(key)))
+            await session.execute(delete(model).where(~exists().where(key == stats_key)))
+        day = cast(BookLoan.issued_at, Date)
+        await session.execute(_upsert(DailyCheckouts, "day", _daily_checkouts()))
+        await session.execute(delete(DailyCheckouts).where(~exists().where(day == DailyCheckouts.day)))
+
+    @staticmethod
+    async def _snapshot(session: AsyncSession, state: CirculationStats) -> None:
+        overdue = BookLoan.due_date < func.current_date()
+        row = (await session.execute(
+            select(
+                func.count(),
+                func.count().filter(overdue),
+                func.count(distinct(BookLoan.reader_id)).filter(overdue),
+            )
+            .where(BookLoan.returned_at.is_(None))
+        )).one()
+        state.active_loans, state.overdue_loans, state.overdue_readers = row
+
+    async def run_once(self, *, full: bool = False) -> str | None:
+        started = time.perf_counter()
+        async with self.database.get_session() as session:
+            mode = await self.refresh(session, full=full)
+        if mode is None:
+            self.skipped += 1
+            return None
+        self.runs += 1
+        self.full_runs += mode == "full"
+        self.last_duration = time.perf_counter() - started
+        return mode
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                # воркер не должен умирать из-за одной неудачи: следующий проход пересчитает то же окно
+                self.failures += 1
+                logger.exception("stats refresh failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "full_runs": self.full_runs,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_duration_seconds": round(self.last_duration, 3),
+        }
+
+
+async def main() -> None:
+    from .db_entry import db
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="пересчитать все сводные таблицы")
+    args = parser.parse_args()
+
+    await db.connect()
+    try:
+        refresher = StatsRefresher(db)
+        mode = await refresher.run_once(full=args.full)
+        if mode is None:
+            raise SystemExit("пересчёт уже идёт в другом процессе")
+        print(f"stats refreshed ({mode}) in {refresher.last_duration:.1f}s")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
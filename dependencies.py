@@ -1,9 +1,27 @@
 from typing import AsyncIterator
+from fastapi import Request
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.db_entry import db
+from middleware.read_your_writes import PRIMARY_COOKIE
 
 
 async def get_db_session() -> AsyncIterator[AsyncSession]:
     async with db.get_session() as session:
         yield session
+
+
+def reads_from_primary(request: Request) -> bool:
+    # клиент только что писал: реплика могла ещё не получить его изменения
+    return PRIMARY_COOKIE in request.cookies
+
+
+async def get_read_db_session(request: Request) -> AsyncIterator[AsyncSession]:
+    # только для чтения: сессия на реплике, если она есть и жива
+    async with db.get_session(readonly=not reads_from_primary(request)) as session:
+        try:
+            yield session
+        except (exc.OperationalError, exc.InterfaceError, OSError):
+            db.report_failure(session)
+            raise
@@ -20,16 +20,12 @@ class ReaderForm(BaseForm):
 class BookForm(BaseForm):
     schema_class = BookCreateSchema
 
-    def __init__(self, form_data=None, *, author_choices=[]):
-        self.author_choices = author_choices
-        super().__init__(form_data)
-
     def init_fields(self):
         self._fields = {
             "author_id": SelectField(
                 name="author_id",
                 label="Автор",
-                choices=self.author_choices,
+                lookup="authors",
             ),
             "bookname": FormField("bookname", "Название книги", placeholder="Введите название книги"),
             "review": FormField("review", "Описание", required=False, placeholder="Описание о книге",
@@ -43,16 +39,14 @@ class BookForm(BaseForm):
 class BookLoanForm(BaseForm):
     schema_class = BookLoanCreateSchema
 
-    def __init__(self, form_data=None, *, book_choices, reader_choices, librarian_choices, initial=None):
-        self.book_choices = book_choices
-        self.reader_choices = reader_choices
+    def __init__(self, form_data=None, *, librarian_choices, initial=None):
         self.librarian_choices = librarian_choices
         super().__init__(form_data, initial=initial)
 
     def init_fields(self):
         self._fields = {
-            "book_id": SelectField("book_id", "Книга", self.book_choices),
-            "reader_id": SelectField("reader_id", "Читатель", self.reader_choices),
+            "book_id": SelectField("book_id", "Книга", lookup="books"),
+            "reader_id": SelectField("reader_id", "Читатель", lookup="readers"),
             "librarian_id": SelectField("librarian_id", "Библиотекарь", self.librarian_choices),
             "due_date": FormField(
                 "due_date",
@@ -65,15 +59,11 @@ class BookLoanForm(BaseForm):
 class ReaderTicketForm(BaseForm):
     schema_class = ReaderTicketSchema
 
-    def __init__(self, form_data=None, *, reader_choices):
-        self.reader_choices = reader_choices
-        super().__init__(form_data)
-
     def init_fields(self):
         self._fields = {"reader_id": SelectField(
             name="reader_id",
             label="Читатель",
-            choices=self.reader_choices
+            lookup="readers",
         ), }
 
 
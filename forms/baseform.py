@@ -22,6 +22,8 @@ class BaseForm:
 
     def add_error(self, field: str, message: str):
         self._errors.setdefault(field, []).append(message)
+        if field in self._fields:
+            self._fields[field].errors.append(message)
 
     def bind_data(self):
         for name, field in self._fields.items():
@@ -28,12 +28,21 @@ class SelectField(FormField):
             self,
             name: str,
             label: str,
-            choices: list[tuple],
+            choices: list[tuple] | None = None,
             required: bool = True,
             placeholder: str | None = None,
             attrs: dict | None = None,
-            extra_class: str = ""
+            extra_class: str = "",
+            lookup: str | None = None,
     ):
         super().__init__(name, label, required=required, input_type="select", placeholder=placeholder, attrs=attrs,
                          extra_class=extra_class)
-        self.choices = choices
+        self.choices = choices or []
+        # lookup — имя typeahead-эндпоинта (/lookup/<lookup>/): вместо всех <option> рендерится поиск,
+        # а подпись выбранного значения подставляет роут одним запросом
+        self.lookup = lookup
+        self.selected_label = ""
+
+    @property
+    def lookup_url(self) -> str | None:
+        return f"/lookup/{self.lookup}/" if self.lookup else None
@@ -1,39 +1,145 @@
+import asyncio
+import logging
 import os
+import signal
+from datetime import timedelta
 
 from fastapi import FastAPI, HTTPException, Request
 
+from config.app_config import HTTPSettings, WorkerSettings
 from config.db_config import DBSettings
 
 from db.api import Database
 from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
 
-from db.db_entry import db
+from db.cache import VersionSync, choice_cache
+from db.counting import get_counter
+from db.db_entry import db, settings
+from db.overdue import overdue_scanner
+from db.stats import StatsRefresher
+from middleware.compression import CompressionMiddleware
+from middleware.metrics import MetricsMiddleware, metrics, render_gauges
+from middleware.read_your_writes import ReadYourWritesMiddleware
+from middleware.sql_timing import SQLTimingMiddleware
+from routes.api import router as api_router
+from routes.response_cache import response_cache
 from routes.routes import router
-from fastapi.staticfiles import StaticFiles
+from routes.static_assets import PrecompressedStaticFiles, assets
+from routes.templating import precompile, templates
+
+http_settings = HTTPSettings()
+worker_settings = WorkerSettings()
+
+response_cache.max_bytes = http_settings.response_cache_max_bytes
+response_cache.ttl = http_settings.response_cache_ttl
+if settings.replica_urls:
+    response_cache.settle = settings.replica_max_lag
+
+version_sync = VersionSync(db, interval=worker_settings.version_sync_interval)
+stats_refresher = StatsRefresher(
+    db,
+    interval=worker_settings.stats_refresh_interval,
+    lookback=timedelta(hours=worker_settings.stats_lookback_hours),
+    full_every=timedelta(hours=worker_settings.stats_full_refresh_hours),
+)
+overdue_scanner.interval = worker_settings.overdue_scan_interval
+overdue_scanner.batch_size = worker_settings.overdue_batch_size
+overdue_scanner.max_batches = worker_settings.overdue_max_batches
+overdue_scanner.lookback = timedelta(hours=worker_settings.overdue_lookback_hours)
+overdue_scanner.full_every = timedelta(hours=worker_settings.overdue_full_scan_hours)
+
+logger = logging.getLogger("main")
 
 app = FastAPI(debug=False if os.getenv('ENV_TYPE') == "prod" else True)
 
 app.include_router(router)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.include_router(api_router)
+app.mount("/static", PrecompressedStaticFiles(assets=assets), name="static")
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=http_settings.compression_min_size,
+    levels={
+        "gzip": http_settings.gzip_level, "br": http_settings.brotli_quality, "zstd": http_settings.zstd_level,
+    },
+)
+app.add_middleware(SQLTimingMiddleware, instrumentation=db.instrumentation)
+if settings.replica_urls and settings.read_your_writes_window > 0:
+    app.add_middleware(ReadYourWritesMiddleware, window=settings.read_your_writes_window)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+
+def toggle_sql_instrumentation():
+    db.instrumentation.set_enabled(not db.instrumentation.enabled)
 
 
 @app.on_event("startup")
 async def startup():
+    # сборка идемпотентна: уже собранные файлы не пересоздаются, пишется только манифест
+    assets.build()
+    precompile(templates.env)
     await db.connect()
+    await db.warm_up(settings.pool_warmup)
+    if worker_settings.version_sync_interval > 0:
+        version_sync.start()
+    if worker_settings.stats_refresh_interval > 0:
+        stats_refresher.start()
+    if worker_settings.overdue_scan_interval > 0:
+        overdue_scanner.start(db)
+    # kill -USR2 <pid> включает/выключает учёт SQL без перезапуска — только в этом воркере.
+    # Обработчик сигнала ставится лишь из главного потока: TestClient и встраивание поднимают lifespan
+    # в другом, и тогда переключателя просто нет (включается DB_SQL_INSTRUMENTATION)
+    if hasattr(signal, "SIGUSR2"):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, toggle_sql_instrumentation)
+        except (RuntimeError, NotImplementedError) as e:
+            logger.warning("SIGUSR2 toggle for SQL instrumentation is unavailable: %s", e)
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await version_sync.stop()
+    await stats_refresher.stop()
+    # дожидается текущей пачки и снимает блокировку лидера, пока соединение ещё живо
+    await overdue_scanner.stop()
     await db.close()
 
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout(request: Request, exc: PoolTimeoutError):
+    # пул исчерпан дольше pool_timeout: отказываем сразу, клиент или балансировщик повторит
+    return JSONResponse(
+        {"detail": "База данных перегружена, повторите запрос позже"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.get("/health")
 async def health():
     try:
         async with db.get_session() as session:
             await session.execute(text("SELECT 1"))
-        return {"status": "ok", "db": "connected"}
+        # реплики не влияют на статус: без них чтения просто идут на мастер
+        return {"status": "ok", "db": "connected", "replicas": db.replica_stats()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB connection error: {e}")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    lines = metrics.render()
+    lines += render_gauges("db_pool", db.pool_stats())
+    for index, replica in enumerate(db.replica_stats()):
+        lines += render_gauges(f"db_replica_{index}", replica)
+    lines += render_gauges("version_sync", version_sync.stats())
+    lines += render_gauges("choice_cache", choice_cache.stats())
+    lines += render_gauges("response_cache", response_cache.stats())
+    lines += render_gauges("stats_refresh", stats_refresher.stats())
+    lines += render_gauges("overdue_scanner", overdue_scanner.stats())
+    counter = get_counter()
+    if hasattr(counter, "stats"):
+        lines += render_gauges("count_cache", counter.stats())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
@@ -0,0 +1,160 @@
+# Сжатие ответов: zstd, brotli или gzip — что лучше из принятого клиентом (Accept-Encoding).
+# Готовое тело сжимается целиком и получает Content-Length; StreamingResponse сжимается по кускам
+# с flush после каждого, чтобы клиент получал данные по мере выгрузки, а не в конце.
+# Не трогаем: маленькие тела (меньше minimum_size), уже сжатое (есть Content-Encoding — например,
+# готовые .br/.gz статики), несжимаемые типы (картинки, архивы), HEAD, 204 и 304.
+# brotli и zstandard необязательны: без них остаётся то, что установлено.
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# уровни для динамических ответов: выше — заметно дороже по CPU при небольшом выигрыше в размере
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/javascript", "application/xml", "application/x-ndjson", "image/svg+xml",
+}
+
+
+def accepted_encodings(header: str) -> set[str]:
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name.strip():
+            continue
+        q = params.strip().removeprefix("q=")
+        try:
+            if params and float(q) == 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def compressible(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    media_type = content_type.partition(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+class GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def write(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliStream:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def write(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + (self._compressor.finish() if final else self._compressor.flush())
+
+
+class ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def write(self, data: bytes, final: bool) -> bytes:
+        mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+# в порядке предпочтения сервера
+ENCODERS = {
+    name: stream
+    for name, stream, available in (
+        ("zstd", ZstdStream, zstandard is not None),
+        ("br", BrotliStream, brotli is not None),
+        ("gzip", GzipStream, True),
+    )
+    if available
+}
+
+
+class CompressionMiddleware:
+    def __init__(self, app, *, minimum_size: int = 500, levels: dict[str, int] | None = None,
+                 encodings: tuple[str, ...] = tuple(ENCODERS)):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.encodings = [name for name in encodings if name in ENCODERS]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding = next((name for name in self.encodings if name in accepted), None)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        stream = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, stream, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                passthrough = (
+                    message["status"] in (204, 304) or message["status"] < 200
+                    or "content-encoding" in headers or not compressible(headers.get("content-type"))
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # заголовки зависят от тела: отправим вместе с первым куском
+                    start = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if stream is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                stream = ENCODERS[encoding](self.levels[encoding])
+                headers = MutableHeaders(scope=start)
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                # сжатое представление отличается побайтно: строгий ETag становится слабым
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["etag"] = f"W/{etag}"
+                compressed = stream.write(body, final=not more_body)
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    headers["content-length"] = str(len(compressed))
+                await send(start)
+            else:
+                compressed = stream.write(body, final=not more_body)
+
+            if compressed or not more_body:
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
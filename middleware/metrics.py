@@ -0,0 +1,136 @@
+# Метрики HTTP в формате Prometheus без внешних зависимостей.
+# Серия заводится один раз на (маршрут, метод) с заранее выделенными корзинами гистограммы;
+# дальше запрос только увеличивает счётчики — память не растёт с числом запросов.
+import time
+from bisect import bisect_left
+from typing import Callable
+
+# секунды; последняя корзина (+Inf) добавляется неявно
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNMATCHED_ROUTE = "<unmatched>"
+# метод приходит от клиента как есть: нестандартные сводятся в одну серию, как и неизвестные маршруты
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "CONNECT", "TRACE"})
+OTHER_METHOD = "OTHER"
+
+
+class RouteSeries:
+    __slots__ = ("buckets", "total", "count", "statuses")
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.total = 0.0
+        self.count = 0
+        # кодов ответа у маршрута единицы, словарь перестаёт расти после прогрева
+        self.statuses: dict[int, int] = {}
+
+
+class RouteMetrics:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = buckets
+        self._series: dict[str, dict[str, RouteSeries]] = {}
+
+    def observe(self, route: str, method: str, status: int, seconds: float) -> None:
+        if method not in HTTP_METHODS:
+            method = OTHER_METHOD
+        methods = self._series.get(route)
+        if methods is None:
+            methods = self._series[route] = {}
+        series = methods.get(method)
+        if series is None:
+            series = methods[method] = RouteSeries(len(self.bounds) + 1)
+
+        series.buckets[bisect_left(self.bounds, seconds)] += 1
+        series.total += seconds
+        series.count += 1
+        series.statuses[status] = series.statuses.get(status, 0) + 1
+
+    def clear(self) -> None:
+        self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = [
+            "# HELP http_requests_total HTTP requests by route, method and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for route, method, series in self._iter():
+            for status, count in sorted(series.statuses.items()):
+                lines.append(f'http_requests_total{{{_labels(route, method)},status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency by route and method.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for route, method, series in self._iter():
+            labels = _labels(route, method)
+            cumulative = 0
+            for bound, count in zip(self.bounds, series.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {series.total}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {series.count}")
+        return lines
+
+    def _iter(self):
+        for route, methods in sorted(self._series.items()):
+            for method, series in sorted(methods.items()):
+                yield route, method, series
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(route: str, method: str) -> str:
+    return f'route="{_escape(route)}",method="{method}"'
+
+
+def render_gauges(prefix: str, values: dict) -> list[str]:
+    # {"hits": 3} -> choice_cache_hits 3; значения снимаются в момент запроса /metrics
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, (int, float)):
+            lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+    return lines
+
+
+class MetricsMiddleware:
+    # чистый ASGI: без BaseHTTPMiddleware, который добавляет задачу и очередь на каждый запрос.
+    # Метка маршрута — шаблон пути ("/reader/{reader_id}"), а не сам путь, чтобы число серий было конечным
+    def __init__(self, app, metrics: RouteMetrics, clock: Callable[[], float] = time.perf_counter):
+        self.app = app
+        self.metrics = metrics
+        self.clock = clock
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = self.clock()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.observe(route_label(scope), scope["method"], status, self.clock() - started)
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mount (статика) не кладёт route в scope, но задаёт endpoint и дописывает свой путь в root_path
+    if "endpoint" in scope:
+        return f"{scope.get('root_path', '')}/{{path}}"
+    return UNMATCHED_ROUTE
+
+
+metrics = RouteMetrics()
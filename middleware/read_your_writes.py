@@ -0,0 +1,24 @@
+# Чтение своих записей при репликах: после успешного небезопасного запроса (POST и т. п.) клиент
+# получает короткоживущую куку, и пока она есть, его чтения идут на мастер (см. get_read_db_session).
+# Так редирект после формы показывает только что созданную запись, даже если реплика ещё не догнала.
+PRIMARY_COOKIE = "db_primary"
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadYourWritesMiddleware:
+    def __init__(self, app, window: int = 5, cookie: str = PRIMARY_COOKIE):
+        self.app = app
+        self.cookie = f"{cookie}=1; Max-Age={window}; Path=/; HttpOnly; SameSite=Lax".encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", self.cookie)]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
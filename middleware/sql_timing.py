@@ -0,0 +1,29 @@
+# Server-Timing с временем и числом SQL-запросов запроса; при выключенном учёте — просто проброс.
+from db.instrumentation import QueryInstrumentation
+from .metrics import route_label
+
+
+class SQLTimingMiddleware:
+    def __init__(self, app, instrumentation: QueryInstrumentation):
+        self.app = app
+        self.instrumentation = instrumentation
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.instrumentation.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        # до маршрутизации шаблон маршрута неизвестен: медленные запросы логируются с путём
+        queries = self.instrumentation.start(scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                timing = f'db;dur={queries.total * 1000:.1f};desc="{queries.count} queries"'
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            queries.route = route_label(scope)
+            self.instrumentation.finish(queries)
@@ -0,0 +1,136 @@
+# Версионированный JSON API для киосков и мобильного приложения: те же репозитории, что и у HTML-страниц.
+# Списки и карточки читаются запросами по колонкам и отдаются строками result.mappings() через
+# FastJSONResponse — без ORM-объектов и без повторной валидации по response_model.
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.repositories import (
+    BookLoanRepository, BookRepository, OverdueLoanRepository, ReaderRepository, ReaderTicketRepository,
+    StatsRepository,
+)
+from db.overdue import overdue_scanner
+from dependencies import get_db_session, get_read_db_session
+from schemas.api import (
+    BookLoanOut, BookLoanPage, BookOut, BookPage, ChoiceOut, OverduePage, ReaderOut, StatsDashboard, TicketOut,
+)
+from schemas.schemas import (
+    BookLoanCreateSchema, BookLoanUpdateSchema, ReaderCreateSchema, ReaderProfile, ReaderTicketSchema,
+)
+from .responses import FastJSONResponse
+
+router = APIRouter(prefix="/api/v1", tags=["api"], default_response_class=FastJSONResponse)
+
+
+@router.get("/books/", response_model=BookPage)
+async def api_books(page: int = Query(1, ge=1), page_size: int = Query(20, ge=1, le=100),
+                    q: str | None = Query(None, max_length=100),
+                    order: str | None = Query(None, pattern="^-?(id|bookname|amount)$"),
+                    after: str | None = Query(None), before: str | None = Query(None),
+                    session: AsyncSession = Depends(get_read_db_session)):
+    rows, pagination = await BookRepository(session).list(page=page, page_size=page_size, search=q, order=order,
+                                                           after=after, before=before, mappings=True)
+    return FastJSONResponse({"items": rows, "pagination": pagination})
+
+
+@router.get("/books/{book_id}", response_model=BookOut)
+async def api_book(book_id: int, session: AsyncSession = Depends(get_read_db_session)):
+    row = await BookRepository(session).get_row(book_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return FastJSONResponse(row)
+
+
+@router.get("/loans/", response_model=BookLoanPage)
+async def api_loans(page: int = Query(1, ge=1), page_size: int = Query(20, ge=1, le=100),
+                    order: str | None = Query(None, pattern="^-?(id|issued_at|due_date)$"),
+                    after: str | None = Query(None), before: str | None = Query(None),
+                    session: AsyncSession = Depends(get_read_db_session)):
+    rows, pagination = await BookLoanRepository(session).list(page=page, page_size=page_size, order=order,
+                                                               after=after, before=before)
+    return FastJSONResponse({"items": rows, "pagination": pagination})
+
+
+@router.get("/loans/{loan_id}", response_model=BookLoanOut)
+async def api_loan(loan_id: int, session: AsyncSession = Depends(get_read_db_session)):
+    row = await BookLoanRepository(session).get_row(loan_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    return FastJSONResponse(row)
+
+
+@router.post("/loans/", response_model=BookLoanOut, status_code=201)
+async def api_create_loan(data: BookLoanCreateSchema, session: AsyncSession = Depends(get_db_session)):
+    repo = BookLoanRepository(session)
+    try:
+        loan = await repo.create(data.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(await repo.get_row(loan.id), status_code=201)
+
+
+@router.put("/loans/{loan_id}", response_model=BookLoanOut)
+async def api_update_loan(loan_id: int, data: BookLoanUpdateSchema, session: AsyncSession = Depends(get_db_session)):
+    repo = BookLoanRepository(session)
+    try:
+        await repo.update(loan_id, data.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(await repo.get_row(loan_id))
+
+
+@router.get("/overdue/", response_model=OverduePage)
+async def api_overdue(page: int = Query(1, ge=1), page_size: int = Query(20, ge=1, le=100),
+                      after: str | None = Query(None), before: str | None = Query(None),
+                      session: AsyncSession = Depends(get_read_db_session)):
+    rows, pagination = await OverdueLoanRepository(session).list(page=page, page_size=page_size, after=after,
+                                                                  before=before)
+    return FastJSONResponse({"items": rows, "pagination": pagination, "scanner": overdue_scanner.stats()})
+
+
+@router.get("/readers/", response_model=list[ChoiceOut])
+async def api_readers(q: str | None = Query(None, max_length=100), limit: int = Query(20, ge=1, le=50),
+                      session: AsyncSession = Depends(get_read_db_session)):
+    choices = await ReaderRepository(session).lookup(q, limit=limit)
+    return FastJSONResponse([{"id": id_, "label": label} for id_, label in choices])
+
+
+@router.get("/readers/{reader_id}", response_model=ReaderProfile)
+async def api_reader(reader_id: int, session: AsyncSession = Depends(get_read_db_session)):
+    profile = await ReaderRepository(session).get_profile(reader_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Reader not found")
+    return FastJSONResponse(profile)
+
+
+@router.post("/readers/", response_model=ReaderOut, status_code=201)
+async def api_create_reader(data: ReaderCreateSchema, session: AsyncSession = Depends(get_db_session)):
+    try:
+        reader = await ReaderRepository(session).create(data.model_dump(mode="json"))
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="Reader with this email already exists")
+    return FastJSONResponse(ReaderOut.model_validate(reader, from_attributes=True), status_code=201)
+
+
+@router.get("/tickets/{code}", response_model=TicketOut)
+async def api_ticket(code: str, session: AsyncSession = Depends(get_read_db_session)):
+    row = await ReaderTicketRepository(session).get_by_code(code.upper())
+    if row is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return FastJSONResponse(row)
+
+
+@router.post("/tickets/", response_model=TicketOut, status_code=201)
+async def api_create_ticket(data: ReaderTicketSchema, session: AsyncSession = Depends(get_db_session)):
+    try:
+        ticket = await ReaderTicketRepository(session).create(data.reader_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(TicketOut.model_validate(ticket, from_attributes=True), status_code=201)
+
+
+@router.get("/stats/", response_model=StatsDashboard)
+async def api_stats(top: int = Query(10, ge=1, le=100), days: int = Query(30, ge=1, le=366),
+                    session: AsyncSession = Depends(get_read_db_session)):
+    return FastJSONResponse(await StatsRepository(session).dashboard(top=top, days=days))
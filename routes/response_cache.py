@@ -0,0 +1,90 @@
+# Кэш готовых HTML-ответов для идемпотентных GET-страниц каталога.
+# Ключ — путь и строка запроса: ссылки в шаблонах строятся от корня, без схемы и хоста, поэтому страница
+# одна для любого Host. Валидность — версии таблиц (db/cache.py: versions) и ttl.
+# Ответ несёт ETag и Last-Modified, поэтому браузер перепроверяет страницу условным запросом
+# и при неизменном каталоге получает 304 без тела.
+import functools
+import hashlib
+import inspect
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.responses import StreamingResponse
+
+from db.cache import VersionedCache, versions
+
+
+class CachedResponse:
+    __slots__ = ("body", "headers", "etag", "last_modified")
+
+    def __init__(self, response: Response, tables: tuple):
+        self.body = response.body
+        # слабый сразу: CompressionMiddleware ослабляет ETag сжатого 200, а 304 идёт мимо сжатия —
+        # иначе один и тот же ответ приходил бы с разными валидаторами
+        self.etag = f'W/"{hashlib.blake2b(self.body, digest_size=12).hexdigest()}"'
+        # без записей с момента старта — время, когда страница собрана
+        self.last_modified = int(versions.changed_at(*tables) or time.time())
+        self.headers = {
+            "content-type": response.headers["content-type"],
+            "etag": self.etag,
+            "last-modified": formatdate(self.last_modified, usegmt=True),
+            # хранить можно, но перед показом — перепроверить
+            "cache-control": "no-cache",
+        }
+
+    def respond(self, request: Request) -> Response:
+        if self.not_modified(request):
+            headers = {key: value for key, value in self.headers.items() if key != "content-type"}
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, headers=self.headers)
+
+    def not_modified(self, request: Request) -> bool:
+        # If-None-Match важнее If-Modified-Since (RFC 9110, 13.2.2)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag.removeprefix("W/") in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class ResponseCache(VersionedCache):
+    @staticmethod
+    def _estimate(cached: CachedResponse) -> int:
+        return len(cached.body) + 500
+
+
+response_cache = ResponseCache(max_bytes=32 * 1024 * 1024, ttl=60)
+
+
+def cached_response(*tables, cache: ResponseCache = response_cache):
+    # только для GET-обработчиков без побочных эффектов, чей ответ зависит лишь от пути, строки запроса
+    # и содержимого tables; обработчик должен принимать request. Ответы кроме 200 не кэшируются
+    def decorator(handler):
+        if "request" not in inspect.signature(handler).parameters:
+            raise TypeError(f"{handler.__name__}: cached_response needs a 'request' parameter")
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs["request"]
+            key = f"{request.url.path}?{request.url.query}"
+            version = versions.get(*tables)
+            cached = cache.get(key, version)
+            if cached is None:
+                response = await handler(*args, **kwargs)
+                if response.status_code != 200 or isinstance(response, StreamingResponse):
+                    return response
+                cached = CachedResponse(response, tables)
+                cache.put(key, version, tables, cached)
+            return cached.respond(request)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,36 @@
+# JSON-ответ на orjson. В отличие от JSONResponse (json.dumps) и ORJSONResponse из FastAPI,
+# принимает строки result.mappings() и pydantic-модели как есть: строки не превращаются в ORM-объекты
+# и не проходят валидацию response_model, datetime/date/UUID orjson пишет сам.
+# Обработчик возвращает FastJSONResponse(...) напрямую; response_model у маршрута остаётся для схемы OpenAPI
+# и описывает ровно те колонки, что выбирает запрос.
+from collections.abc import Mapping
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    # вызывается только для типов, которых orjson не знает
+    if isinstance(obj, Mapping):  # RowMapping
+        return dict(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        if isinstance(content, BaseModel):
+            # pydantic-core сериализует модель целиком сам, без промежуточного dict
+            return content.model_dump_json().encode()
+        return dumps(content)
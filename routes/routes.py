@@ -1,26 +1,75 @@
 from fastapi.params import Query
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi import FastAPI, HTTPException, Request, APIRouter
 from sqlalchemy.exc import IntegrityError
 from fastapi import Depends
 
-from dependencies import get_db_session
+from db.bulk import IMPORTERS
+from db.export import FORMATS as EXPORT_FORMATS, export_loans
+from db.db_entry import db
+from dependencies import get_db_session, get_read_db_session, reads_from_primary
+from routes.response_cache import cached_response
+from routes.templating import templates
 from forms._forms import *
 from db.repositories import *
 
-templates = Jinja2Templates(directory="templates")
 router = APIRouter()
 
+# версия каталога: книги, авторы и выдачи (выдача меняет остаток книги)
+CATALOG = (Book, BookAuthor, BookLoan)
+
+LOOKUPS = {
+    "readers": ReaderRepository,
+    "books": BookRepository,
+    "librarians": LibrarianRepository,
+    "authors": BookAuthorRepository,
+}
+
+
+def choice_loader(field: SelectField):
+    repo_class = LOOKUPS[field.lookup]
+
+    async def load(session: AsyncSession):
+        return await repo_class(session).get_choice(int(field.value))
+
+    return load
+
+
+async def resolve_lookups(form: BaseForm, *, validate: bool = True, readonly: bool = False) -> bool:
+    # typeahead-поля: выбранный id проверяется одним запросом по ключу, заодно берётся подпись для виджета.
+    # Запросы независимы, поэтому идут параллельно через db.gather. readonly — для GET-страниц: читать можно
+    # с реплики; проверка перед записью (POST) идёт на мастер
+    fields = [
+        field for field in form
+        if getattr(field, "lookup", None) and field.value and not field.errors
+    ]
+    checked = [field for field in fields if field.value.isdigit()]
+    choices = dict(zip(checked, await db.gather(*[choice_loader(field) for field in checked], readonly=readonly)))
+
+    valid = True
+    for field in fields:
+        choice = choices.get(field)
+        if choice:
+            field.selected_label = choice[1]
+        elif validate:
+            form.add_error(field.name, "Выбранное значение не найдено")
+            valid = False
+        else:
+            field.value = ""
+    return valid
+
 
 @router.get("/", response_class=HTMLResponse)
+@cached_response()
 async def main(request: Request):
     items = [
         {'title': 'Все книги', 'url': '/books/'},
         {'title': 'Предложить книгу', 'url': '/create_book/'},
         {'title': 'Создать читателя', 'url': '/create_reader/'},
         {'title': 'Выдача книг', 'url': '/bookloan/'},
-        {'title': "Создать читательский билет", 'url': "/readerticket/"}
+        {'title': 'Просроченные выдачи', 'url': '/bookloan/overdue/'},
+        {'title': "Создать читательский билет", 'url': "/readerticket/"},
+        {'title': 'Статистика', 'url': '/stats/'},
     ]
     return templates.TemplateResponse("main.html", {"request": request, "items": items})
 
@@ -34,17 +83,18 @@ async def create_reader_form(request: Request):
 
 
 @router.get("/create_book/", response_class=HTMLResponse)
-async def create_book_form(request: Request, session: AsyncSession = Depends(get_db_session)):
-    author_choices = await BookAuthorRepository(session).list_choices()
-    form = BookForm(author_choices=author_choices)
+async def create_book_form(request: Request):
+    form = BookForm()
     return templates.TemplateResponse("forms/form.html", {"request": request, "title": "Создать книгу", "form": form})
 
 
 @router.get('/books/', response_class=HTMLResponse)
+@cached_response(*CATALOG)
 async def books_list(request: Request, page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100),
-                     q: str | None = Query(None), session: AsyncSession = Depends(get_db_session)):
+                     q: str | None = Query(None), after: str | None = Query(None), before: str | None = Query(None),
+                     session: AsyncSession = Depends(get_read_db_session)):
     repo = BookRepository(session)
-    books, pagination = await  repo.list(page=page, page_size=page_size, search=q)
+    books, pagination = await  repo.list(page=page, page_size=page_size, search=q, after=after, before=before)
     return templates.TemplateResponse(
         "books/book_list.html",
         {
@@ -58,10 +108,10 @@ async def books_list(request: Request, page: int = Query(1, ge=1), page_size: in
 
 @router.post('/create_book/', response_class=HTMLResponse)
 async def create_book(request: Request, session: AsyncSession = Depends(get_db_session)):
-    author_choices = await BookAuthorRepository(session).list_choices()
     data = dict(await request.form())
-    form = BookForm(data, author_choices=author_choices)
-    if not form.is_valid():
+    form = BookForm(data)
+    valid = form.is_valid()
+    if not await resolve_lookups(form) or not valid:
         return templates.TemplateResponse("forms/form.html",
                                           {'request': request, 'title': "Создать книгу", "form": form})
     # print(form.cleaned_data.model_dump())
@@ -84,10 +134,11 @@ async def create_book(request: Request, session: AsyncSession = Depends(get_db_s
 
 
 @router.get('/bookloan/', response_class=HTMLResponse)
-async def bookloan_list(request: Request, session: AsyncSession = Depends(get_db_session), page: int = Query(1, ge=1),
-                        page_size: int = Query(10, ge=1, le=100)):
+async def bookloan_list(request: Request, session: AsyncSession = Depends(get_read_db_session), page: int = Query(1, ge=1),
+                        page_size: int = Query(10, ge=1, le=100), after: str | None = Query(None),
+                        before: str | None = Query(None)):
     repo = BookLoanRepository(session)
-    loans, pagination = await repo.list(page=page, page_size=page_size)
+    loans, pagination = await repo.list(page=page, page_size=page_size, after=after, before=before)
     return templates.TemplateResponse(
         "books/bookloan.html",
         {
@@ -99,25 +150,71 @@ async def bookloan_list(request: Request, session: AsyncSession = Depends(get_db
     )
 
 
+@router.get('/bookloan/overdue/', response_class=HTMLResponse)
+async def overdue_list(request: Request, session: AsyncSession = Depends(get_read_db_session),
+                       page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100),
+                       after: str | None = Query(None), before: str | None = Query(None)):
+    loans, pagination = await OverdueLoanRepository(session).list(page=page, page_size=page_size, after=after,
+                                                                  before=before)
+    return templates.TemplateResponse(
+        "books/overdue.html",
+        {
+            "request": request,
+            "loans": loans,
+            "pagination": pagination,
+        }
+    )
+
+
+@router.get('/bookloan/export/')
+async def bookloan_export(request: Request, fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+                          date_from: date | None = Query(None), date_to: date | None = Query(None),
+                          reader_id: int | None = Query(None, ge=1)):
+    # сессия живёт столько же, сколько отдаётся тело ответа, поэтому открываем её в самом генераторе
+    primary = reads_from_primary(request)
+
+    async def body():
+        async with db.get_session(readonly=not primary) as session:
+            async for chunk in export_loans(session, fmt, date_from=date_from, date_to=date_to,
+                                            reader_id=reader_id):
+                yield chunk
+
+    filename = f"bookloans.{fmt}"
+    return StreamingResponse(body(), media_type=EXPORT_FORMATS[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.post('/bookloan/batch/checkout/')
+async def bookloan_batch_checkout(data: BookLoanBatchCreateSchema, session: AsyncSession = Depends(get_db_session)):
+    try:
+        result = await BookLoanRepository(session).create_many(data.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 409 — ничего не выдано (atomic) или выдано не всё (partial): подробности в items
+    return JSONResponse(result.model_dump(), status_code=200 if result.ok else 409)
+
+
+@router.post('/bookloan/batch/return/')
+async def bookloan_batch_return(data: BookLoanBatchReturnSchema, session: AsyncSession = Depends(get_db_session)):
+    result = await BookLoanRepository(session).return_many(data.model_dump())
+    return JSONResponse(result.model_dump(), status_code=200 if result.ok else 409)
+
+
 @router.get("/create_bookloan/", response_class=HTMLResponse)
 async def create_bookloan_form(
         request: Request,
         book_id: int | None = Query(None),
-        session: AsyncSession = Depends(get_db_session)
+        session: AsyncSession = Depends(get_read_db_session)
 ):
-    book_repo = BookRepository(session)
     initial = {}
     if book_id is not None:
-        if await book_repo.exists(book_id):
-            print("Существует книга такая")
-            initial["book_id"] = book_id
+        initial["book_id"] = book_id
 
     form = BookLoanForm(
-        book_choices=await book_repo.list_choices(),
-        reader_choices=await ReaderRepository(session).list_choices(),
         librarian_choices=await LibrarianRepository(session).list_choices(),
         initial=initial,
     )
+    await resolve_lookups(form, validate=False, readonly=not reads_from_primary(request))
 
     return templates.TemplateResponse(
         "forms/form.html",
@@ -132,11 +229,10 @@ async def create_bookloan_form(
 @router.post('/create_bookloan/', response_class=HTMLResponse)
 async def create_bookloan(request: Request, session: AsyncSession = Depends(get_db_session)):
     data = dict(await request.form())
-    form = BookLoanForm(data, book_choices=await BookRepository(session).list_choices(),
-                        reader_choices=await ReaderRepository(session).list_choices(),
-                        librarian_choices=await LibrarianRepository(session).list_choices())
+    form = BookLoanForm(data, librarian_choices=await LibrarianRepository(session).list_choices())
+    valid = form.is_valid()
 
-    if not form.is_valid():
+    if not await resolve_lookups(form) or not valid:
         return templates.TemplateResponse(
             "forms/form.html",
             {
@@ -196,7 +292,7 @@ async def create_reader(request: Request, session: AsyncSession = Depends(get_db
 
 
 @router.get("/bookloan/{loan_id}/", response_class=HTMLResponse)
-async def update_bookloan_form(request: Request, loan_id: int, session: AsyncSession = Depends(get_db_session)):
+async def update_bookloan_form(request: Request, loan_id: int, session: AsyncSession = Depends(get_read_db_session)):
     repo = BookLoanRepository(session)
     loan = await repo.get(loan_id)
     if not loan:
@@ -255,9 +351,8 @@ async def update_bookloan(
 
 
 @router.get('/readerticket/', response_class=HTMLResponse)
-async def readerticket_form(request: Request, session: AsyncSession = Depends(get_db_session)):
-    reader_choices = await ReaderRepository(session).list_choices()
-    form = ReaderTicketForm(reader_choices=reader_choices)
+async def readerticket_form(request: Request):
+    form = ReaderTicketForm()
     return templates.TemplateResponse(
         "forms/form.html",
         {
@@ -271,10 +366,10 @@ async def readerticket_form(request: Request, session: AsyncSession = Depends(ge
 @router.post("/readerticket/", response_class=HTMLResponse)
 async def create_reader_ticket(request: Request, session: AsyncSession = Depends(get_db_session)):
     data = dict(await request.form())
-    reader_choices = await ReaderRepository(session).list_choices()
-    form = ReaderTicketForm(data, reader_choices=reader_choices)
+    form = ReaderTicketForm(data)
+    valid = form.is_valid()
 
-    if not form.is_valid():
+    if not await resolve_lookups(form) or not valid:
         return templates.TemplateResponse(
             "forms/form.html",
             {"request": request, "title": "Создать читательский билет", "form": form},
@@ -295,12 +390,50 @@ async def create_reader_ticket(request: Request, session: AsyncSession = Depends
 
 
 @router.get("/reader/{reader_id}")
-async def reader_detail(reader_id: int, session: AsyncSession = Depends(get_db_session)):
+async def reader_detail(request: Request, reader_id: int,
+                        fmt: str = Query("html", alias="format", pattern="^(html|json)$"),
+                        session: AsyncSession = Depends(get_read_db_session)):
     repo = ReaderRepository(session)
-    data = await repo.get_reader(reader_id)
-    print(data)
+    profile = await repo.get_profile(reader_id)
+
+    if fmt == "json":
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Reader not found")
+        # сериализация pydantic-core, без промежуточного dict и json.dumps
+        return Response(profile.model_dump_json(), media_type="application/json")
 
-    if not data:
+    if profile is None:
         return RedirectResponse("/", status_code=302)
 
-    return JSONResponse({"hello": "world"})
+    return templates.TemplateResponse(
+        "readers/profile.html",
+        {"request": request, "reader": profile},
+    )
+
+
+@router.get("/stats/", response_class=HTMLResponse)
+async def stats_dashboard(request: Request, session: AsyncSession = Depends(get_read_db_session)):
+    data = await StatsRepository(session).dashboard()
+    peak = max((item["checkouts"] for item in data["daily"]), default=0)
+    return templates.TemplateResponse("stats/dashboard.html", {"request": request, **data, "peak": peak})
+
+
+@router.get("/lookup/{entity}/")
+async def lookup(entity: str, q: str | None = Query(None, max_length=100), limit: int = Query(20, ge=1, le=50),
+                 session: AsyncSession = Depends(get_read_db_session)):
+    repo_class = LOOKUPS.get(entity)
+    if repo_class is None:
+        raise HTTPException(status_code=404, detail="Unknown lookup")
+    choices = await repo_class(session).lookup(q, limit=limit)
+    return JSONResponse([{"id": id_, "label": label} for id_, label in choices])
+
+
+@router.post("/import/{entity}/")
+async def bulk_import(entity: str, request: Request, fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+                      batch_size: int = Query(5000, ge=100, le=50000),
+                      session: AsyncSession = Depends(get_db_session)):
+    importer_class = IMPORTERS.get(entity)
+    if importer_class is None:
+        raise HTTPException(status_code=404, detail="Unknown import")
+    report = await importer_class(session, batch_size=batch_size).run(request.stream(), fmt)
+    return JSONResponse(report.model_dump())
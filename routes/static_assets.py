@@ -0,0 +1,146 @@
+# Статика с отпечатком содержимого: static/css/output.css копируется в static/dist/css/output.<hash>.css
+# рядом со сжатыми .gz и .br (brotli — если установлен). Имя меняется вместе с содержимым, поэтому
+# такие файлы отдаются с Cache-Control: immutable и браузер их не перепроверяет. Сжатие делается
+# один раз при сборке, на запрос отдаётся готовый вариант по Accept-Encoding.
+#   python -m routes.static_assets        # сборка при деплое; на старте приложения сборка тоже выполняется
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from middleware.compression import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # без brotli отдаём только gzip
+    brotli = None
+
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+# уже сжатые форматы повторно не сжимаем
+COMPRESSIBLE = {".css", ".js", ".svg", ".html", ".json", ".txt", ".map", ".xml"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _write(path: Path, data: bytes) -> None:
+    # через временный файл: соседние воркеры, собирающие то же самое, не увидят недописанный файл
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class StaticAssets:
+    def __init__(self, directory: str = "static"):
+        self.directory = Path(directory)
+        self.dist = self.directory / DIST_DIR
+        # "css/output.css" -> "dist/css/output.1a2b3c4d5e.css"
+        self.files: dict[str, str] = {}
+        # "dist/css/output.1a2b3c4d5e.css" -> ["br", "gzip"]
+        self.encodings: dict[str, list[str]] = {}
+
+    def _sources(self):
+        for path in sorted(self.directory.rglob("*")):
+            if path.is_file() and self.dist not in path.parents and not path.name.startswith("."):
+                yield path
+
+    def build(self) -> int:
+        files, encodings = {}, {}
+        # сборка — артефакт: каталог сам исключает себя из git, где бы ни лежал static
+        ignore = self.dist / ".gitignore"
+        if not ignore.exists():
+            _write(ignore, b"*\n")
+        for source in self._sources():
+            data = source.read_bytes()
+            relative = source.relative_to(self.directory)
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            hashed = (self.dist / relative).with_name(f"{source.stem}.{digest}{source.suffix}")
+            target = hashed.relative_to(self.directory).as_posix()
+            files[relative.as_posix()] = target
+            encodings[target] = []
+
+            # имя зависит от содержимого: уже собранный файл не пересобираем
+            if not hashed.exists():
+                _write(hashed, data)
+            if source.suffix not in COMPRESSIBLE:
+                continue
+            variants = [("gzip", ".gz", lambda: gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ("br", ".br", lambda: brotli.compress(data, quality=11)))
+            for encoding, suffix, compress in variants:
+                variant = hashed.with_name(hashed.name + suffix)
+                if not variant.exists():
+                    compressed = compress()
+                    if len(compressed) >= len(data):
+                        continue
+                    _write(variant, compressed)
+                encodings[target].append(encoding)
+
+        # старые хэшированные файлы не удаляем: их могут запрашивать страницы, отданные до выкладки
+        _write(self.dist / MANIFEST, json.dumps({"files": files, "encodings": encodings}, indent=2).encode())
+        self.files, self.encodings = files, encodings
+        return len(files)
+
+    def load(self) -> bool:
+        try:
+            manifest = json.loads((self.dist / MANIFEST).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        self.files, self.encodings = manifest["files"], manifest["encodings"]
+        return True
+
+    def url_path(self, path: str) -> str:
+        # путь для url_for('static', path=...): хэшированный, если файл собран, иначе исходный
+        return self.files.get(path.lstrip("/"), path)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    def __init__(self, *, assets: StaticAssets, **kwargs):
+        super().__init__(directory=assets.directory, **kwargs)
+        self.assets = assets
+        self.root = assets.directory.resolve()
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        relative = Path(full_path).relative_to(self.root).as_posix()
+        encodings = self.assets.encodings.get(relative)
+        if encodings is None:
+            # исходные имена остаются доступными, но их нужно перепроверять
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.headers.setdefault("cache-control", "no-cache")
+            return response
+
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((name for name in encodings if name in accepted), None)
+        path = f"{full_path}.{'br' if encoding == 'br' else 'gz'}" if encoding else full_path
+        response = FileResponse(
+            path,
+            status_code=status_code,
+            stat_result=os.stat(path) if encoding else stat_result,
+            method=scope["method"],
+            media_type=mimetypes.guess_type(full_path)[0] or "text/plain",
+        )
+        response.headers["cache-control"] = IMMUTABLE
+        if encodings:
+            response.headers["vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["content-encoding"] = encoding
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+assets = StaticAssets("static")
+
+
+if __name__ == "__main__":
+    count = assets.build()
+    print(f"{count} files -> {assets.dist}")
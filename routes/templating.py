@@ -0,0 +1,85 @@
+# Окружение Jinja2 для всех страниц.
+# - Байткод шаблонов хранится на диске (TEMPLATE_CACHE_DIR, по умолчанию во временном каталоге) и общий
+#   для всех воркеров: перезапуск и новые воркеры не компилируют шаблоны заново. Jinja пишет файл
+#   через временный и переименование, поэтому одновременная запись из нескольких воркеров безопасна.
+# - precompile() на старте загружает все шаблоны, чтобы первый запрос к странице не платил за компиляцию.
+# - {% cache key, ... %}...{% endcache %} — кэш фрагментов: HTML блока переиспользуется, пока ключ тот же.
+#   В ключ кладут всё, от чего зависит фрагмент, например id и изменчивые поля записи
+#   и table_version("library_app_book") — версию таблицы, которая меняется при любой записи в неё (db/cache.py).
+import os
+import tempfile
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, nodes, pass_context
+from jinja2.ext import Extension
+
+from db.cache import VersionedCache, versions
+from .static_assets import assets
+
+TEMPLATES_DIR = "templates"
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def __init__(self, environment: Environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=VersionedCache(max_bytes=16 * 1024 * 1024, ttl=3600))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_cached_fragment", [nodes.Tuple(key, "load")])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cached_fragment(self, key: tuple, caller) -> str:
+        cache: VersionedCache = self.environment.fragment_cache
+        html = cache.get(key, ())
+        if html is None:
+            html = caller()
+            cache.put(key, (), (), html)
+        return html
+
+
+def table_version(*tables: str) -> tuple[tuple[int, int], ...]:
+    return versions.get(*tables)
+
+
+@pass_context
+def url_for(context, name: str, /, **path_params):
+    # как url_for Starlette, но статика — по хэшированному имени из манифеста сборки, и путь от корня
+    # без схемы и хоста: готовые страницы кэшируются по пути (routes/response_cache.py) и отдаются
+    # на любой Host — абсолютная ссылка запомнила бы origin первого запроса
+    if name == "static" and "path" in path_params:
+        path_params["path"] = assets.url_path(path_params["path"])
+    return context["request"].url_for(name, **path_params).path
+
+
+def build_environment() -> Environment:
+    cache_dir = os.getenv("TEMPLATE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "library-templates")
+    os.makedirs(cache_dir, exist_ok=True)
+    environment = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        bytecode_cache=FileSystemBytecodeCache(cache_dir),
+        extensions=[FragmentCacheExtension],
+        # на проде шаблоны не меняются: не проверяем mtime файла на каждом рендере
+        auto_reload=os.getenv("ENV_TYPE") != "prod",
+    )
+    environment.globals["table_version"] = table_version
+    # Jinja2Templates ставит свой url_for через setdefault, поэтому этот не перезаписывается
+    environment.globals["url_for"] = url_for
+    return environment
+
+
+def precompile(environment: Environment) -> int:
+    names = environment.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in names:
+        environment.get_template(name)
+    return len(names)
+
+
+templates = Jinja2Templates(env=build_environment())
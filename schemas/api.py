@@ -0,0 +1,114 @@
+# Модели ответов /api/v1. Поля повторяют колонки запросов (BookQueryset.as_rows, BookLoanQueryset.as_list,
+# ReaderTicketQuerySet.as_rows): ответ собирается из строк напрямую, модель — контракт и схема OpenAPI.
+from datetime import date, datetime
+
+from pydantic import BaseModel
+
+from .pagination import Pagination
+
+
+class BookOut(BaseModel):
+    id: int
+    bookname: str
+    review: str | None = None
+    amount: int
+    cover_url: str
+    author_id: int
+    author: str
+
+
+class BookPage(BaseModel):
+    items: list[BookOut]
+    pagination: Pagination
+
+
+class BookLoanOut(BaseModel):
+    id: int
+    issued_at: datetime
+    due_date: date
+    returned_at: datetime | None = None
+    bookname: str
+    reader_name: str
+    librarian_name: str
+
+
+class BookLoanPage(BaseModel):
+    items: list[BookLoanOut]
+    pagination: Pagination
+
+
+class ChoiceOut(BaseModel):
+    id: int
+    label: str
+
+
+class ReaderOut(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    phone: str | None = None
+    cover_url: str | None = None
+    registered_at: datetime
+
+
+class TicketOut(BaseModel):
+    id: int
+    code: str
+    reader_id: int
+    issued_at: datetime
+    is_active: bool
+
+
+class StatsSummaryOut(BaseModel):
+    refreshed_at: datetime
+    active_loans: int
+    overdue_loans: int
+    overdue_readers: int
+
+
+class StatsBookOut(BaseModel):
+    id: int
+    bookname: str
+    author: str
+    loans_total: int
+    loans_active: int
+    last_issued_at: datetime | None = None
+
+
+class StatsReaderOut(BaseModel):
+    id: int
+    name: str
+    loans_total: int
+    loans_active: int
+    last_issued_at: datetime | None = None
+
+
+class DailyCheckoutsOut(BaseModel):
+    day: date
+    checkouts: int
+
+
+class StatsDashboard(BaseModel):
+    # summary = null, пока db/stats.py ни разу не пересчитал статистику
+    summary: StatsSummaryOut | None
+    books: list[StatsBookOut]
+    readers: list[StatsReaderOut]
+    daily: list[DailyCheckoutsOut]
+
+
+class OverdueLoanOut(BaseModel):
+    id: int
+    due_date: date
+    detected_at: datetime
+    reader_id: int
+    days_overdue: int
+    bookname: str
+    reader_name: str
+
+
+class OverduePage(BaseModel):
+    items: list[OverdueLoanOut]
+    pagination: Pagination
+    # состояние сканера в этом воркере (db/overdue.py): leader, passes, detected, resolved, backlog...
+    scanner: dict[str, float]
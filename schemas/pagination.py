@@ -1,10 +1,37 @@
+import base64
+import json
+
 from pydantic import BaseModel
 
 
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str | None) -> list | None:
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and values else None
+
+
 class Pagination(BaseModel):
     page: int
     page_size: int
     total: int
+    # False, если total — оценка (pg_class.reltuples / EXPLAIN), а не точный count
+    total_exact: bool = True
+    # keyset-режим: страница определяется курсором, а не номером
+    keyset: bool = False
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+    # есть ли строки после страницы — известно, когда выбрана лишняя строка
+    more: bool | None = None
 
     @property
     def is_paginated(self):
@@ -20,8 +47,12 @@ class Pagination(BaseModel):
 
     @property
     def has_prev(self):
+        if self.keyset:
+            return self.prev_cursor is not None
         return self.page > 1
 
     @property
     def has_next(self):
+        if self.more is not None:
+            return self.more
         return self.page < self.pages
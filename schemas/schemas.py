@@ -1,12 +1,12 @@
 from pydantic import BaseModel, EmailStr, HttpUrl, field_validator, Field
-from typing import Optional
-from datetime import date
+from typing import Literal, Optional
+from datetime import date, datetime
 import re
 
 
 class ReaderCreateSchema(BaseModel):
-    first_name: str = Field(..., min_length=1, description="Имя должно быть хотя бы 1 символ")
-    last_name: str = Field(..., min_length=1, description="Фамилия должна быть хотя бы 1 символ")
+    first_name: str = Field(..., min_length=1, max_length=100, description="Имя должно быть хотя бы 1 символ")
+    last_name: str = Field(..., min_length=1, max_length=100, description="Фамилия должна быть хотя бы 1 символ")
     email: EmailStr
     phone: Optional[str] = Field(
         None,
@@ -32,7 +32,7 @@ class ReaderCreateSchema(BaseModel):
 
 class BookCreateSchema(BaseModel):
     author_id: int
-    bookname: str = Field(..., min_length=1)
+    bookname: str = Field(..., min_length=1, max_length=100)
     review: str | None = None
     amount: int = Field(ge=0)
     cover_url: HttpUrl
@@ -89,5 +89,97 @@ class BookLoanUpdateSchema(BaseModel):
         return v
 
 
+class BookLoanBatchCreateSchema(BaseModel):
+    reader_id: int
+    librarian_id: int
+    due_date: date
+    book_ids: list[int] = Field(..., min_length=1, max_length=100)
+    # atomic — всё или ничего; partial — выдаём то, что можно, ошибки по каждой книге
+    mode: Literal["atomic", "partial"] = "atomic"
+
+    @field_validator("due_date")
+    @classmethod
+    def validate_due_date(cls, v: date):
+        return BookLoanCreateSchema.validate_due_date(v)
+
+
+class BookLoanBatchReturnSchema(BaseModel):
+    loan_ids: list[int] = Field(..., min_length=1, max_length=100)
+    returned_at: date = Field(default_factory=date.today)
+    mode: Literal["atomic", "partial"] = "atomic"
+
+
+class BatchItemResult(BaseModel):
+    # book_id для выдачи, loan_id запрошенной выдачи для возврата
+    id: int
+    loan_id: int | None = None
+    error: str | None = None
+
+
+class BatchResult(BaseModel):
+    ok: bool
+    items: list[BatchItemResult]
+
+
 class ReaderTicketSchema(BaseModel):
     reader_id: int
+
+
+class ReaderProfileLoan(BaseModel):
+    id: int
+    book_id: int
+    bookname: str
+    issued_at: datetime
+    due_date: date
+
+    @property
+    def overdue(self) -> bool:
+        return self.due_date < date.today()
+
+
+class ReaderProfile(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    phone: str | None = None
+    cover_url: str | None = None
+    registered_at: datetime
+    ticket_code: str | None = None
+    ticket_active: bool | None = None
+    history_count: int = 0
+    active_count: int = 0
+    overdue_count: int = 0
+    active_loans: list[ReaderProfileLoan] = []
+
+    @field_validator("active_loans", mode="before")
+    @classmethod
+    def none_to_empty(cls, v):
+        # json_agg по пустому набору возвращает NULL
+        return v or []
+
+
+class ImportRowError(BaseModel):
+    line: int
+    errors: list[str]
+
+
+class ImportReport(BaseModel):
+    received: int = 0
+    inserted: int = 0
+    failed: int = 0
+    errors: list[ImportRowError] = []
+    # ошибок может быть миллион — храним только первые, остальные лишь считаем
+    errors_truncated: bool = False
+    elapsed: float = 0
+
+    def add_error(self, line: int, errors: list[str], limit: int) -> None:
+        self.failed += 1
+        if len(self.errors) < limit:
+            self.errors.append(ImportRowError(line=line, errors=errors))
+        else:
+            self.errors_truncated = True
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.received / self.elapsed if self.elapsed else 0.0
@@ -0,0 +1,65 @@
+document.addEventListener("DOMContentLoaded", function () {
+  const widgets = document.querySelectorAll("[data-typeahead]");
+
+  widgets.forEach(function (widget) {
+    const url = widget.dataset.typeahead;
+    const hidden = widget.querySelector("[data-typeahead-value]");
+    const input = widget.querySelector("[data-typeahead-input]");
+    const list = widget.querySelector("[data-typeahead-list]");
+    let timer = null;
+    let controller = null;
+
+    function close() {
+      list.classList.add("hidden");
+      list.innerHTML = "";
+    }
+
+    function render(items) {
+      list.innerHTML = "";
+      if (!items.length) {
+        close();
+        return;
+      }
+      items.forEach(function (item) {
+        const li = document.createElement("li");
+        li.textContent = item.label;
+        li.className = "px-3 py-2 cursor-pointer hover:bg-[#252525]";
+        // mousedown, а не click: срабатывает раньше blur у поля ввода
+        li.addEventListener("mousedown", function (e) {
+          e.preventDefault();
+          hidden.value = item.id;
+          input.value = item.label;
+          close();
+        });
+        list.appendChild(li);
+      });
+      list.classList.remove("hidden");
+    }
+
+    function search() {
+      // предыдущий запрос больше не нужен
+      if (controller) controller.abort();
+      controller = new AbortController();
+
+      fetch(`${url}?q=${encodeURIComponent(input.value.trim())}`, { signal: controller.signal })
+        .then(function (response) {
+          return response.json();
+        })
+        .then(render)
+        .catch(function () {});
+    }
+
+    input.addEventListener("input", function () {
+      // текст изменён — выбранный ранее id больше не соответствует подписи
+      hidden.value = "";
+      clearTimeout(timer);
+      timer = setTimeout(search, 200);
+    });
+
+    input.addEventListener("focus", function () {
+      if (!hidden.value) search();
+    });
+
+    input.addEventListener("blur", close);
+  });
+});
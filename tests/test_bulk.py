@@ -0,0 +1,182 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from pydantic_core import PydanticCustomError
+
+from db import bulk
+from db.bulk import BookImporter, ReaderImporter, ReaderImportSchema, import_email
+
+
+class FakeSession:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+def recording(importer_class):
+    # вместо COPY и слияния запоминаем записи; "вставлены" все строки, кроме повторов email
+    # или (автор, название) — как ON CONFLICT DO NOTHING в базе
+    class Recording(importer_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.records = []
+            self.keys = set()
+
+        async def _write(self, records):
+            self.records += records
+            inserted = set()
+            for record in records:
+                key = record[1:3] if importer_class is BookImporter else record[3]
+                if key not in self.keys:
+                    self.keys.add(key)
+                    inserted.add(record[0])
+            return inserted
+
+    return Recording
+
+
+def run(importer, data: bytes, fmt: str = "csv", chunk_size: int = 7):
+    async def chunks():
+        # мелкие куски: строки и многобайтные символы рвутся между ними
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    return asyncio.run(importer.run(chunks(), fmt))
+
+
+@pytest.fixture(autouse=True)
+def table_versions(monkeypatch):
+    monkeypatch.setattr(bulk.versions, "bump", lambda *tables: None)
+
+
+EMAIL_ADAPTER = TypeAdapter(EmailStr)
+
+
+@pytest.mark.parametrize("value", [
+    "ivan@example.com",
+    "Ivan.Petrov+lib@Mail.RU",
+    "o'neil@example.com",
+    "a..b@example.com",
+    ".a@example.com",
+    "ivan@-example.com",
+    "ivan@example",
+    "ivan@exa_mple.com",
+    "x" * 65 + "@example.com",
+    "ivan@" + "x" * 64 + ".com",
+    "ivan@пример.рф",
+    "иван@example.com",
+    '"quoted"@example.com',
+    "Ivan Petrov <ivan@example.com>",
+    "no-at-sign",
+    "",
+])
+def test_import_email_matches_email_str(value):
+    try:
+        expected = ("ok", str(EMAIL_ADAPTER.validate_python(value)))
+    except ValidationError as e:
+        expected = ("error", e.errors()[0]["msg"])
+    try:
+        actual = ("ok", import_email(value))
+    except PydanticCustomError as e:
+        actual = ("error", str(e))
+    assert actual == expected
+
+
+def test_invalid_domain_is_checked_once(monkeypatch):
+    bulk._domain_error.cache_clear()
+    calls = []
+    validate_email = bulk.validate_email
+
+    def counting(value):
+        calls.append(value)
+        return validate_email(value)
+
+    monkeypatch.setattr(bulk, "validate_email", counting)
+    for local in ("a", "b", "c"):
+        with pytest.raises(PydanticCustomError):
+            import_email(f"{local}@-bad.com")
+    # один раз для домена; сами адреса с этим доменом до validate_email не доходят
+    assert calls == ["x@-bad.com"]
+
+
+def test_valid_addresses_always_go_through_validate_email(monkeypatch):
+    calls = []
+    validate_email = bulk.validate_email
+    monkeypatch.setattr(bulk, "validate_email", lambda value: calls.append(value) or validate_email(value))
+    assert import_email("ivan@EXAMPLE.com") == "ivan@example.com"
+    assert "ivan@EXAMPLE.com" in calls
+
+
+def test_reader_schema_limits_name_length():
+    with pytest.raises(ValidationError) as error:
+        ReaderImportSchema(first_name="И" * 101, last_name="Петров", email="ivan@example.com")
+    assert error.value.errors()[0]["loc"] == ("first_name",)
+
+
+def test_reader_csv_import_reports_errors_per_line():
+    importer = recording(ReaderImporter)(FakeSession(), batch_size=2)
+    data = (
+        "first_name,last_name,email,phone\n"
+        "Иван,Петров,ivan@example.com,+79990000000\n"
+        "Мария,Смирнова,not-an-email,\n"
+        "\"Анна\nМария\",Иванова,anna@example.com,\n"
+        "Олег,Волков,ivan@example.com,\n"
+        "Пётр,Козлов\n"
+        ",Пустое,empty@example.com,\n"
+    ).encode()
+    report = run(importer, data)
+
+    assert report.received == 6
+    assert report.inserted == 2
+    errors = {error.line: error.errors for error in report.errors}
+    assert sorted(errors) == [3, 6, 7, 8]
+    assert errors[3][0].startswith("email:")
+    assert errors[6] == ["Читатель с таким email уже существует"]
+    assert errors[7] == ["Ожидалось 4 колонок, получено 2"]
+    assert errors[8][0].startswith("first_name:")
+    assert [record[1] for record in importer.records] == ["Иван", "Анна\nМария", "Олег"]
+    assert importer.session.commits == 2
+
+
+def test_book_ndjson_import():
+    importer = recording(BookImporter)(FakeSession())
+    rows = [
+        {"author_id": 1, "bookname": " Война и мир ", "amount": 3, "cover_url": "https://example.com/a.jpg"},
+        {"author_id": 1, "bookname": "Анна Каренина", "amount": -1, "cover_url": "https://example.com/b.jpg"},
+        {"author_id": 1, "bookname": "Без обложки", "amount": 1, "cover_url": "https://example.com/c.gif"},
+        ["not", "an", "object"],
+        {"author_id": 1, "bookname": ["список"], "amount": 1, "cover_url": "https://example.com/d.png"},
+    ]
+    data = ("\n".join(json.dumps(row, ensure_ascii=False) for row in rows) + "\n{broken\n").encode()
+    report = run(importer, data, fmt="ndjson")
+
+    assert (report.received, report.inserted, report.failed) == (6, 1, 5)
+    assert importer.records == [(1, 1, "Война и мир", None, 3, "https://example.com/a.jpg")]
+    errors = {error.line: error.errors for error in report.errors}
+    assert sorted(errors) == [2, 3, 4, 5, 6]
+    assert errors[2][0].startswith("amount:")
+    assert errors[3][0].startswith("cover_url:")
+    assert errors[4] == ["Ожидался JSON-объект"]
+    assert errors[6][0].startswith("Некорректный JSON")
+
+
+def test_error_list_is_truncated():
+    importer = recording(ReaderImporter)(FakeSession(), max_errors=2)
+    data = "first_name,last_name,email\n" + "".join(f"Иван,Петров,bad{i}\n" for i in range(5))
+    report = run(importer, data.encode())
+    assert report.failed == 5
+    assert len(report.errors) == 2
+    assert report.errors_truncated
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        run(ReaderImporter(FakeSession()), b"", fmt="xml")
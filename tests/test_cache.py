@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from db import cache as cache_module
+from db.cache import ChoiceCache, TableVersions, VersionedCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def table_versions(monkeypatch):
+    # у каждого теста свои версии: глобальные versions меняют и другие тесты
+    table_versions = TableVersions()
+    monkeypatch.setattr(cache_module, "versions", table_versions)
+    return table_versions
+
+
+def test_hit_until_version_changes(table_versions):
+    cache = VersionedCache()
+    version = table_versions.get("library_app_book")
+    cache.put("books", version, ("library_app_book",), ["a"])
+    assert cache.get("books", table_versions.get("library_app_book")) == ["a"]
+
+    table_versions.bump("library_app_book")
+    assert cache.get("books", table_versions.get("library_app_book")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_bump_of_other_table_keeps_entry(table_versions):
+    cache = VersionedCache()
+    cache.put("books", table_versions.get("library_app_book"), ("library_app_book",), ["a"])
+    table_versions.bump("library_app_reader")
+    assert cache.get("books", table_versions.get("library_app_book")) == ["a"]
+
+
+def test_entry_expires_after_ttl(clock, table_versions):
+    cache = VersionedCache(ttl=10)
+    cache.put("books", (), (), ["a"])
+    clock[0] += 9
+    assert cache.get("books", ()) == ["a"]
+    clock[0] += 2
+    assert cache.get("books", ()) is None
+
+
+def test_settle_shortens_ttl_right_after_a_write(clock, table_versions):
+    cache = VersionedCache(ttl=300, settle=10)
+    table_versions.bump("library_app_book")
+    clock[0] += 4
+    cache.put("books", table_versions.get("library_app_book"), ("library_app_book",), ["a"])
+    clock[0] += 7
+    # загружено через 4 с после записи: могло прийти с отстающей реплики и живёт только до конца окна
+    assert cache.get("books", table_versions.get("library_app_book")) is None
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = VersionedCache(max_bytes=3 * VersionedCache._estimate("x" * 100))
+    for key in ("a", "b", "c"):
+        cache.put(key, (), (), key * 100)
+    assert cache.get("a", ()) == "a" * 100
+
+    cache.put("d", (), (), "d" * 100)
+    assert cache.get("b", ()) is None
+    assert [cache.get(key, ()) is not None for key in ("a", "c", "d")] == [True, True, True]
+    assert cache.evictions == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_value_larger_than_budget_is_not_stored():
+    cache = VersionedCache(max_bytes=100)
+    cache.put("big", (), (), "x" * 1000)
+    assert cache.get("big", ()) is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_entry_keeps_size_accounting():
+    cache = VersionedCache()
+    cache.put("a", (), (), "x" * 100)
+    cache.put("a", (), (), "y" * 10)
+    assert cache.stats()["bytes"] == VersionedCache._estimate("y" * 10)
+
+
+def test_estimate_counts_nested_values():
+    choices = [(1, "Толстой"), (2, "Пушкин")]
+    assert VersionedCache._estimate(choices) > VersionedCache._estimate([])
+    assert VersionedCache._estimate(choices) > sum(VersionedCache._estimate(label) for _, label in choices)
+
+
+def test_observed_stamps_change_version_and_changed_at(clock):
+    table_versions = TableVersions()
+    table_versions.observe({"library_app_book": 5})
+    version = table_versions.get("library_app_book")
+    # первая отметка — точка отсчёта, а не запись
+    assert table_versions.changed_at("library_app_book") == 0.0
+
+    clock[0] += 1
+    table_versions.observe({"library_app_book": 5})
+    assert table_versions.get("library_app_book") == version
+
+    table_versions.observe({"library_app_book": 6})
+    assert table_versions.get("library_app_book") != version
+    assert table_versions.changed_at("library_app_book") == clock[0]
+
+
+def test_choice_cache_loads_once_per_version(table_versions):
+    cache = ChoiceCache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return [(1, "Толстой")]
+
+    async def scenario():
+        for _ in range(3):
+            assert await cache.get_or_load("authors", ("library_app_bookauthor",), loader) == [(1, "Толстой")]
+        table_versions.bump("library_app_bookauthor")
+        await cache.get_or_load("authors", ("library_app_bookauthor",), loader)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
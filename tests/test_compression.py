@@ -0,0 +1,131 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from middleware.compression import ENCODERS, CompressionMiddleware, accepted_encodings, compressible
+
+PAGE = "<p>" + "Каталог библиотеки. " * 100 + "</p>"
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", set()),
+    ("gzip", {"gzip"}),
+    ("gzip, deflate, br, zstd", {"gzip", "deflate", "br", "zstd"}),
+    ("GZIP;q=0.5, br;q=1.0", {"gzip", "br"}),
+    ("br;q=0, gzip", {"gzip"}),
+    ("br;q=0.0, zstd;q=bad, gzip", {"gzip"}),
+])
+def test_accepted_encodings(header, expected):
+    assert accepted_encodings(header) == expected
+
+
+@pytest.mark.parametrize("content_type, expected", [
+    ("text/html; charset=utf-8", True),
+    ("application/json", True),
+    ("image/svg+xml", True),
+    ("image/png", False),
+    ("application/zip", False),
+    (None, False),
+])
+def test_compressible(content_type, expected):
+    assert compressible(content_type) is expected
+
+
+def make_client(**options) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, **options)
+
+    @app.get("/page")
+    async def page():
+        return HTMLResponse(PAGE, headers={"etag": '"abc"'})
+
+    @app.get("/small")
+    async def small():
+        return HTMLResponse("<p>ok</p>")
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" * 500, media_type="image/png")
+
+    @app.get("/precompressed")
+    async def precompressed():
+        return Response(gzip.compress(PAGE.encode()), media_type="text/html", headers={"content-encoding": "gzip"})
+
+    @app.get("/stream")
+    async def stream():
+        async def rows():
+            for i in range(50):
+                yield f"{i},Книга {i}\n"
+        return StreamingResponse(rows(), media_type="text/csv")
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def client():
+    return make_client()
+
+
+def test_server_preference_among_accepted(client):
+    response = client.get("/page", headers={"Accept-Encoding": "gzip, br, zstd"})
+    assert response.headers["content-encoding"] == next(iter(ENCODERS))
+    assert response.text == PAGE
+
+
+@pytest.mark.parametrize("encoding", list(ENCODERS))
+def test_each_available_encoding(client, encoding):
+    response = client.get("/page", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert int(response.headers["content-length"]) < len(PAGE.encode())
+    assert response.text == PAGE
+
+
+def test_rejected_encoding_is_skipped(client):
+    response = client.get("/page", headers={"Accept-Encoding": "zstd;q=0, br;q=0, gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_configured_encodings_limit_choice():
+    client = make_client(encodings=("gzip",))
+    response = client.get("/page", headers={"Accept-Encoding": "zstd, br, gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_compressed_response_gets_weak_etag(client):
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["etag"] == 'W/"abc"'
+
+
+def test_no_accept_encoding_passes_through(client):
+    response = client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"abc"'
+    assert response.text == PAGE
+
+
+@pytest.mark.parametrize("path", ["/small", "/image"])
+def test_small_and_incompressible_bodies_pass_through(client, path):
+    response = client.get(path, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_already_encoded_body_is_not_compressed_again(client):
+    response = client.get("/precompressed", headers={"Accept-Encoding": "gzip, br, zstd"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == PAGE
+
+
+def test_streaming_response_is_compressed_without_length(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text.splitlines()[-1] == "49,Книга 49"
+
+
+def test_head_is_not_compressed(client):
+    response = client.head("/page", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,115 @@
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse
+from fastapi.testclient import TestClient
+
+from db import cache as cache_module
+from db.cache import TableVersions
+from middleware.compression import CompressionMiddleware
+from routes.response_cache import ResponseCache, cached_response
+
+PAGE = "<ul>" + "<li>Книга</li>" * 200 + "</ul>"
+
+
+@pytest.fixture
+def table_versions(monkeypatch):
+    table_versions = TableVersions()
+    monkeypatch.setattr(cache_module, "versions", table_versions)
+    monkeypatch.setattr("routes.response_cache.versions", table_versions)
+    return table_versions
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def client(table_versions, calls):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, encodings=("gzip",))
+    cache = ResponseCache(ttl=60)
+
+    @app.get("/books/")
+    @cached_response("library_app_book", cache=cache)
+    async def books(request: Request):
+        calls.append(request.url.query)
+        return HTMLResponse(PAGE)
+
+    return TestClient(app)
+
+
+def test_second_request_is_served_from_cache(client, calls):
+    first = client.get("/books/?page=2")
+    second = client.get("/books/?page=2")
+    assert first.text == second.text == PAGE
+    assert calls == ["page=2"]
+    assert first.headers["cache-control"] == "no-cache"
+
+
+def test_query_string_is_part_of_the_key(client, calls):
+    client.get("/books/?page=1")
+    client.get("/books/?page=2")
+    assert calls == ["page=1", "page=2"]
+
+
+def test_etag_is_weak_and_same_with_and_without_compression(client):
+    compressed = client.get("/books/", headers={"Accept-Encoding": "gzip"})
+    plain = client.get("/books/", headers={"Accept-Encoding": "identity"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["etag"].startswith('W/"')
+    assert compressed.headers["etag"] == plain.headers["etag"]
+
+
+@pytest.mark.parametrize("transform", [
+    lambda tag: tag,
+    lambda tag: tag.removeprefix("W/"),
+    lambda tag: f'"other", {tag}',
+])
+def test_if_none_match_gives_304(client, transform):
+    etag = client.get("/books/", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    response = client.get("/books/", headers={"If-None-Match": transform(etag), "Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert "content-type" not in response.headers
+
+
+def test_other_etag_gives_full_page(client):
+    response = client.get("/books/", headers={"If-None-Match": 'W/"stale"'})
+    assert response.status_code == 200
+    assert response.text == PAGE
+
+
+def test_if_modified_since(client):
+    last_modified = client.get("/books/").headers["last-modified"]
+    assert client.get("/books/", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/books/", headers={"If-Modified-Since": formatdate(0, usegmt=True)}).status_code == 200
+    assert client.get("/books/", headers={"If-Modified-Since": "yesterday"}).status_code == 200
+
+
+def test_write_invalidates_page(client, calls, table_versions):
+    etag = client.get("/books/").headers["etag"]
+    table_versions.bump("library_app_book")
+    # тело то же — и ETag тот же: браузер получит 304, хотя страница перечитана
+    assert client.get("/books/", headers={"If-None-Match": etag}).status_code == 304
+    assert len(calls) == 2
+
+
+def test_non_200_is_not_cached(table_versions):
+    app = FastAPI()
+    calls = []
+
+    @app.get("/missing/")
+    @cached_response("library_app_book", cache=ResponseCache())
+    async def missing(request: Request):
+        calls.append(1)
+        return HTMLResponse("нет", status_code=404)
+
+    client = TestClient(app)
+    assert client.get("/missing/").status_code == 404
+    assert client.get("/missing/").status_code == 404
+    assert len(calls) == 2